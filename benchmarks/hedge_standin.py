@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+对冲请求的本地替身验证
+在本机启动两个 aiohttp 替身来源（主来源对一个 ASN 存在长尾，备用来源延迟固定），
+用 fetch_prefixes_async.fetch_one 验证:
+    1. 对冲后总耗时明显低于不对冲（长尾 ASN 由备用来源返回）
+    2. 额外请求数只有长尾 ASN 的一个
+    3. 落败的慢请求按下界记入历史，多轮运行后主来源的对冲阈值不会逐轮下降
+    4. 主来源不可用时转移到备用来源
+
+不访问外网，任一检查失败时以非零状态退出。
+
+用法:
+    python benchmarks/hedge_standin.py
+    python benchmarks/hedge_standin.py --tail 5.0 --rounds 6
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+import fetch_prefixes_async as fpa
+
+ASNS = [1, 2, 3, 4, 5]
+SLOW_ASN = 1
+FAST_DELAY = 0.1
+ALTERNATE_DELAY = 0.3
+
+
+def _make_app(tail: float, served: Dict[str, int]) -> web.Application:
+    async def primary(request):
+        asn = int(request.query['resource'][2:])
+        served['primary'] += 1
+        await asyncio.sleep(tail if asn == SLOW_ASN else FAST_DELAY)
+        return web.json_response({'data': {'prefixes': [{'prefix': f'10.{asn}.0.0/24'}, {'prefix': '2001:db8::/32'}]}})
+
+    async def alternate(request):
+        asn = int(request.query['resource'][2:])
+        served['alternate'] += 1
+        await asyncio.sleep(ALTERNATE_DELAY)
+        return web.json_response({'data': {'prefixes': {'v4': {'originating': [f'10.{asn}.0.0/24']}}}})
+
+    app = web.Application()
+    app.router.add_get('/primary', primary)
+    app.router.add_get('/alternate', alternate)
+    return app
+
+
+async def _fetch_all(session, sources: List[Dict], history: fpa.LatencyHistory, hedge: bool):
+    semaphore = asyncio.Semaphore(len(ASNS))
+    stats: Dict[str, int] = {}
+    start = time.perf_counter()
+    results = await asyncio.gather(*[fpa.fetch_one(session, asn, semaphore, sources, history, hedge, stats)
+                                     for asn in ASNS])
+    return time.perf_counter() - start, dict(results), stats
+
+
+async def run(tail: float, rounds: int, port: int) -> List[str]:
+    """运行全部检查，返回失败项说明（为空表示通过）"""
+    fpa.REQUEST_DELAY = 0.01
+    fpa.RETRY_DELAY = 0.01
+    served = {'primary': 0, 'alternate': 0}
+    runner = web.AppRunner(_make_app(tail, served))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    base = f'http://127.0.0.1:{port}'
+    sources = [dict(fpa.PREFIX_SOURCES[0], url=base + '/primary?resource=AS{asn}'),
+               dict(fpa.PREFIX_SOURCES[1], url=base + '/alternate?resource=AS{asn}')]
+    name = sources[0]['name']
+    failures = []
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            # 历史: 各 ASN 平时都很快，长尾 ASN 本次变慢
+            history = fpa.LatencyHistory(path=None)
+            for asn in ASNS:
+                for _ in range(10):
+                    history.record(name, asn, FAST_DELAY)
+
+            plain_wall, plain, _ = await _fetch_all(session, sources, fpa.LatencyHistory(path=None), hedge=False)
+            served.update(primary=0, alternate=0)
+            hedged_wall, hedged, stats = await _fetch_all(session, sources, history, hedge=True)
+            print(f"⏱️  no hedge: {plain_wall:.2f}s, hedged: {hedged_wall:.2f}s, "
+                  f"extra requests: {served['alternate']}, stats: {stats}")
+            if hedged != plain:
+                failures.append('hedged results differ from unhedged results')
+            if hedged_wall > plain_wall * 0.7:
+                failures.append(f'hedging did not cut wall time ({hedged_wall:.2f}s vs {plain_wall:.2f}s)')
+            if served['alternate'] != 1 or stats.get('hedge_wins') != 1:
+                failures.append(f"expected exactly one hedge win, served {served}, stats {stats}")
+
+            # 多轮运行: 落败的慢请求按下界记入历史，阈值不应逐轮下降
+            thresholds = []
+            for _ in range(rounds):
+                thresholds.append(history.hedge_delay(name, SLOW_ASN))
+                await _fetch_all(session, sources, history, hedge=True)
+            thresholds.append(history.hedge_delay(name, SLOW_ASN))
+            print(f"📈 AS{SLOW_ASN} hedge threshold per round: {[round(t, 2) for t in thresholds]}")
+            slowest = max(history.samples[name][str(SLOW_ASN)])
+            if slowest < thresholds[0]:
+                failures.append(f'cancelled slow requests were not recorded (slowest sample {slowest:.2f}s)')
+            if any(b < a for a, b in zip(thresholds, thresholds[1:])):
+                failures.append(f'hedge threshold shrank across rounds: {thresholds}')
+
+            # 主来源不可用: 转移到备用来源
+            down = [dict(sources[0], url='http://127.0.0.1:1/primary?resource=AS{asn}'), sources[1]]
+            _, prefixes = await fpa.fetch_one(session, 2, asyncio.Semaphore(1), down, fpa.LatencyHistory(path=None))
+            if prefixes != ['10.2.0.0/24']:
+                failures.append(f'failover returned {prefixes}')
+    finally:
+        await runner.cleanup()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对冲请求的本地替身验证')
+    parser.add_argument('--tail', type=float, default=3.0, help='长尾 ASN 在主来源上的延迟（秒）')
+    parser.add_argument('--rounds', type=int, default=4, help='检查阈值稳定性的轮数')
+    parser.add_argument('--port', type=int, default=18642, help='替身来源监听端口')
+    args = parser.parse_args()
+
+    failures = asyncio.run(run(args.tail, args.rounds, args.port))
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ All hedge checks passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+离线基准测试
+基于合成 xdb 测量各热点路径的吞吐、耗时和峰值内存，结果以 JSON 输出，
+并可与保存的基线对比。
+
+用法:
+    python benchmarks/run_benchmarks.py                          # 默认规模
+    python benchmarks/run_benchmarks.py --quick                  # 快速冒烟
+    python benchmarks/run_benchmarks.py --save-baseline          # 保存为基线
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import io
+import ipaddress
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BENCH_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'src'))
+sys.path.insert(0, str(BENCH_DIR))
+
+from synthetic_xdb import generate_segments, write_xdb
+from synthetic_qqwry import write_qqwry
+from ip2region_client import SEGMENT_CACHE_SIZE, IP2RegionClient
+from qqwry_client import QQWryClient
+import util
+import searcher as xdb_searcher
+from sample_ips import sample_ips_from_cidr
+from fetch_prefixes_async import split_large_prefixes
+from cidr_merger import merge_cidrs, merge_conservative
+from scanner_advanced import scan_prefixes_concurrent
+from slash24_set import Slash24Set
+from bulk_lookup import Formatter, SegmentTable, classify_chunk
+
+DEFAULT_BASELINE = BENCH_DIR / 'baseline.json'
+SIZES = {
+    'quick': {'segments': 20000, 'regions': 200, 'lookups': 20000, 'prefixes': 2000, 'large_prefixes': 20},
+    'default': {'segments': 200000, 'regions': 500, 'lookups': 200000, 'prefixes': 20000, 'large_prefixes': 200},
+}
+
+
+def _measure(name: str, fn: Callable[[], int], repeat: int = 3) -> Dict:
+    """
+    运行 fn（返回本次处理的操作数），取最快一次的耗时；再单独跑一次统计 tracemalloc 峰值内存
+    """
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            ops = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'name': name,
+        'ops': ops,
+        'seconds': round(best, 6),
+        'ops_per_sec': round(ops / best, 1) if best > 0 else None,
+        'peak_memory_bytes': peak,
+    }
+    print(f"  {name:<32} {result['ops_per_sec'] or 0:>14,.0f} ops/s  {best * 1000:>10.1f} ms  "
+          f"peak {peak / 1024 / 1024:>7.1f} MB")
+    return result
+
+
+def _random_ips(n: int, seed: int) -> List[bytes]:
+    rng = random.Random(seed)
+    return [rng.getrandbits(32).to_bytes(4, 'big') for _ in range(n)]
+
+
+def _random_prefixes(n: int, prefixlen: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    shift = 32 - prefixlen
+    return [str(ipaddress.IPv4Network(((rng.getrandbits(prefixlen) << shift), prefixlen))) for _ in range(n)]
+
+
+def run(size: str, seed: int = 0) -> Dict:
+    cfg = SIZES[size]
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / 'synthetic.xdb')
+        qqwry_path = str(Path(tmp) / 'qqwry.dat')
+        gen_start = time.perf_counter()
+        segments = generate_segments(cfg['segments'], cfg['regions'], seed)
+        write_xdb(db_path, segments)
+        write_qqwry(qqwry_path, segments, seed)
+        print(f"✓ 合成 xdb / qqwry.dat: {cfg['segments']} 段, {cfg['regions']} 个区域 "
+              f"({time.perf_counter() - gen_start:.1f}s)\n")
+
+        header = util.load_header_from_file(db_path)
+        version = util.version_from_header(header)
+        v_index = util.load_vector_index_from_file(db_path)
+        c_buffer = util.load_content_from_file(db_path)
+        ips = _random_ips(cfg['lookups'], seed)
+
+        policies = {
+            'search_file': lambda: xdb_searcher.new_with_file_only(version, db_path),
+            'search_vector_index': lambda: xdb_searcher.new_with_vector_index(version, db_path, v_index),
+            'search_buffer': lambda: xdb_searcher.new_with_buffer(version, c_buffer),
+        }
+        for name, factory in policies.items():
+            searcher = factory()
+
+            def lookups(s=searcher):
+                for ip in ips:
+                    s.search(ip)
+                return len(ips)
+
+            results.append(_measure(name, lookups))
+            searcher.close()
+
+        # 字符串 IP 输入：ip2region 客户端与纯真客户端对比
+        ip_strs = [str(ipaddress.IPv4Address(ip)) for ip in ips]
+        client = IP2RegionClient(db_path)
+        results.append(_measure('ip2region_client_search', lambda: (
+            [client.search(ip) for ip in ip_strs], len(ip_strs))[1]))
+        # 扫描器的访问模式：按地址顺序对连续 /24 各采样 3 个点，相邻采样点多落在同一段（命中段缓存）
+        scan_rng = random.Random(seed)
+        scan_strs = [ip for base in _random_prefixes(cfg['lookups'] // 768, 16, seed + 4)
+                     for sub in ipaddress.IPv4Network(base).subnets(new_prefix=24)
+                     for ip in sample_ips_from_cidr(str(sub), n=3, rng=scan_rng)]
+        cached = IP2RegionClient(db_path, segment_cache=SEGMENT_CACHE_SIZE)
+        results.append(_measure('ip2region_client_search_scan', lambda: (
+            [cached.search(ip) for ip in scan_strs], len(scan_strs))[1]))
+        results.append(_measure('ip2region_client_search_scan_nocache', lambda: (
+            [client.search(ip) for ip in scan_strs], len(scan_strs))[1]))
+        cached.close()
+        client.close()
+
+        # 批量查询：一块换行分隔的 IP 文本 -> TSV
+        bulk_formatter = Formatter(SegmentTable.from_xdb(db_path))
+        bulk_data = ''.join(ip + '\n' for ip in ip_strs).encode('ascii')
+        results.append(_measure('bulk_lookup_chunk', lambda: classify_chunk(bulk_data, bulk_formatter)[1]))
+
+        qqwry = QQWryClient(qqwry_path)
+        results.append(_measure('qqwry_search', lambda: ([qqwry.search(ip) for ip in ip_strs], len(ip_strs))[1]))
+        results.append(_measure('qqwry_search_many', lambda: len(qqwry.search_many(ip_strs))))
+        qqwry.close()
+
+        prefixes_24 = _random_prefixes(cfg['prefixes'], 24, seed)
+        prefixes_20 = _random_prefixes(cfg['prefixes'] // 10, 20, seed + 1)
+
+        def sampling():
+            for cidr in prefixes_24:
+                sample_ips_from_cidr(cidr, n=3)
+            for cidr in prefixes_20:
+                sample_ips_from_cidr(cidr, n=3)
+            return len(prefixes_24) + len(prefixes_20)
+
+        results.append(_measure('sample_ips_from_cidr', sampling))
+
+        large = _random_prefixes(cfg['large_prefixes'], 16, seed + 2) + prefixes_24[:cfg['prefixes'] // 2]
+        results.append(_measure('split_large_prefixes', lambda: len(split_large_prefixes(large))))
+
+        # 合并：连续的 /24 块（可合并）+ 随机散点
+        contiguous = []
+        rng = random.Random(seed)
+        for base in _random_prefixes(cfg['prefixes'] // 64, 18, seed + 3):
+            net = ipaddress.IPv4Network(base)
+            for sub in net.subnets(new_prefix=24):
+                if rng.random() < 0.8:
+                    contiguous.append(str(sub))
+        merge_input = contiguous + prefixes_24[:cfg['prefixes'] // 4]
+        results.append(_measure('merge_cidrs', lambda: (merge_cidrs(merge_input), len(merge_input))[1]))
+
+        merge_nets = sorted({ipaddress.IPv4Network(c) for c in merge_input},
+                            key=lambda x: (x.network_address, x.prefixlen))
+        results.append(_measure('merge_conservative',
+                                lambda: (merge_conservative(list(merge_nets)), len(merge_nets))[1]))
+
+        # /24 位图集合：两次“运行结果”的并 / 交 / 差及还原为最少 CIDR
+        set_a = Slash24Set.from_cidrs(merge_input)
+        set_b = Slash24Set.from_cidrs(contiguous[::2] + prefixes_24)
+
+        def slash24_ops():
+            for r in (set_a | set_b, set_a & set_b, set_a - set_b):
+                r.to_cidrs()
+            return 3
+
+        results.append(_measure('slash24_set_ops', slash24_ops))
+
+        client = IP2RegionClient(db_path, segment_cache=SEGMENT_CACHE_SIZE)
+        scan_input = prefixes_24[:cfg['prefixes'] // 2]
+        results.append(_measure(
+            'scan_prefixes_concurrent',
+            lambda: len(scan_prefixes_concurrent(scan_input, client, sample_per_cidr=3, max_workers=8)),
+            repeat=1))
+        client.close()
+
+    return {
+        'size': size,
+        'seed': seed,
+        'config': cfg,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(report: Dict, baseline: Dict):
+    """打印与基线的吞吐对比（>1 表示比基线快）"""
+    base = {r['name']: r for r in baseline.get('results', [])}
+    print(f"\n与基线对比 ({baseline.get('created_at', '?')}, size={baseline.get('size')}):")
+    for r in report['results']:
+        b = base.get(r['name'])
+        if not b or not b.get('ops_per_sec') or not r.get('ops_per_sec'):
+            print(f"  {r['name']:<32} (无基线)")
+            continue
+        speedup = r['ops_per_sec'] / b['ops_per_sec']
+        mem = r['peak_memory_bytes'] / b['peak_memory_bytes'] if b['peak_memory_bytes'] else float('nan')
+        print(f"  {r['name']:<32} 吞吐 x{speedup:.2f}   内存 x{mem:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试（合成 xdb）')
+    parser.add_argument('--quick', action='store_true', help='使用小规模快速运行')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='结果 JSON 输出路径')
+    parser.add_argument('--baseline', default=None, help='与指定基线 JSON 对比')
+    parser.add_argument('--save-baseline', action='store_true', help=f'将结果保存为基线 ({DEFAULT_BASELINE.name})')
+    args = parser.parse_args()
+
+    report = run('quick' if args.quick else 'default', args.seed)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n结果已保存: {args.output}")
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n基线已保存: {DEFAULT_BASELINE}")
+    if args.baseline:
+        compare(report, json.loads(Path(args.baseline).read_text(encoding='utf-8')))
+
+
+if __name__ == '__main__':
+    main()
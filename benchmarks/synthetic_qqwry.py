@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+合成纯真 IP 数据库（qqwry.dat）生成器
+与 synthetic_xdb.py 使用相同的段生成规则，记录混合使用内联、国家重定向(0x02)
+和整体重定向(0x01)三种存储模式，覆盖解析器的所有分支。
+
+用法:
+    python benchmarks/synthetic_qqwry.py /tmp/qqwry.dat --segments 200000 --regions 500
+"""
+import argparse
+import random
+import struct
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from synthetic_xdb import generate_segments
+
+
+def region_to_qqwry(region: str) -> Tuple[str, str]:
+    """'中国|河北省|石家庄市|移动|CN' -> ('河北省石家庄市', '移动')"""
+    parts = region.split('|')
+    country = ''.join(p for p in parts[1:3] if p) or parts[0]
+    area = parts[3] if len(parts) > 3 else ''
+    return country, area
+
+
+def write_qqwry(path, segments: List[Tuple[int, int, str]], seed: int = 0) -> Path:
+    rng = random.Random(seed)
+    buf = bytearray(8)
+
+    def put_string(s: str) -> int:
+        offset = len(buf)
+        buf.extend(s.encode('gbk') + b'\x00')
+        return offset
+
+    # 共享字符串池（供重定向模式引用）
+    country_ptr, area_ptr, block_ptr = {}, {}, {}
+    pairs = {region_to_qqwry(r) for _, _, r in segments}
+    for country, area in sorted(pairs):
+        if country not in country_ptr:
+            country_ptr[country] = put_string(country)
+        if area not in area_ptr:
+            area_ptr[area] = put_string(area)
+        block_ptr[(country, area)] = len(buf)
+        buf.extend(country.encode('gbk') + b'\x00' + area.encode('gbk') + b'\x00')
+
+    def ptr3(offset: int) -> bytes:
+        return struct.pack('<I', offset)[:3]
+
+    records = []
+    for start, end, region in segments:
+        country, area = region_to_qqwry(region)
+        rec = len(buf)
+        buf.extend(struct.pack('<I', end))
+        mode = rng.random()
+        if mode < 0.4:
+            buf.extend(b'\x01' + ptr3(block_ptr[(country, area)]))
+        elif mode < 0.7:
+            buf.extend(b'\x02' + ptr3(country_ptr[country]))
+            buf.extend(b'\x02' + ptr3(area_ptr[area]))
+        elif mode < 0.85:
+            buf.extend(b'\x02' + ptr3(country_ptr[country]))
+            buf.extend(area.encode('gbk') + b'\x00')
+        else:
+            buf.extend(country.encode('gbk') + b'\x00' + area.encode('gbk') + b'\x00')
+        records.append((start, rec))
+
+    idx_start = len(buf)
+    for start, rec in records:
+        buf.extend(struct.pack('<I', start) + ptr3(rec))
+    idx_end = len(buf) - 7
+    struct.pack_into('<II', buf, 0, idx_start, idx_end)
+    if len(buf) >= 1 << 24:
+        raise ValueError("qqwry 文件超过 3 字节偏移上限，请减少段数")
+
+    Path(path).write_bytes(bytes(buf))
+    return Path(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成确定性的合成 qqwry.dat')
+    parser.add_argument('output')
+    parser.add_argument('--segments', type=int, default=200000)
+    parser.add_argument('--regions', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    path = write_qqwry(args.output, generate_segments(args.segments, args.regions, args.seed), args.seed)
+    print(f"✓ 已生成 {path} ({path.stat().st_size / 1024 / 1024:.1f} MB, {args.segments} 段)")
+
+
+if __name__ == '__main__':
+    main()
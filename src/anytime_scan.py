@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+限时扫描（anytime 调度）
+
+在给定截止时间内尽可能提高结果质量，且任何时刻停止都能产出有效结果：
+1. 覆盖阶段：每个网段先查询 1 个采样点（地址数多的网段优先），得到初步分类
+2. 细化阶段：剩余时间按优先级给网段追加采样点，优先级 = 地址数 × 下一个采样点推翻当前结论的概率
+   （采样全部一致时按 Laplace 估计 1/(k+2)；已出现分歧的网段结论固定为 medium，不再追加）
+每个网段最多查询 sample_per_cidr 个采样点，采样点预先按与普通扫描相同的方式生成，
+因此时间充足时结果与普通扫描（相同 --seed）完全一致。
+
+结果在普通扫描字段之外带 confidence（结论置信度）和 complete（是否已完成全部计划采样或已出现分歧）；
+时间耗尽时仍未探测的网段不出现在结果中。
+"""
+import heapq
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from ip2region_client import is_hebei_mobile_region
+from metrics import metrics
+from prefix_array import PrefixArray, format_cidr
+from region_targets import RegionTable
+from sample_ips import sample_ips_from_cidr
+from scanner_advanced import _lookup_regions, sort_results
+
+# 每轮调度的采样点数：轮与轮之间检查截止时间
+ROUND_SIZE = 4096
+CHUNK_SIZE = 256
+
+
+def confidence(hits: int, samples: int) -> float:
+    """结论置信度：采样出现分歧时为 1（medium 已确定），全部一致时为 1 - 1/(k+2)"""
+    if samples == 0:
+        return 0.0
+    if 0 < hits < samples:
+        return 1.0
+    return round(1 - 1 / (samples + 2), 4)
+
+
+class AnytimeScanner:
+    """
+    限时扫描器
+
+    Args:
+        prefixes: PrefixArray 或 CIDR 字符串列表
+        ip2: 查询后端（见 scanner_advanced._lookup_regions）
+        sample_per_cidr: 每个网段最多采样数
+        seed: 可选的随机种子（与 scan_single 相同的派生方式）
+        region_table: 可选的 RegionTable，提供时结果带 region_ids
+    """
+
+    def __init__(self, prefixes, ip2, sample_per_cidr: int = 3, seed=None, max_workers: int = 8,
+                 region_table: Optional[RegionTable] = None, matcher=is_hebei_mobile_region):
+        if not isinstance(prefixes, PrefixArray):
+            prefixes = PrefixArray.from_cidrs(prefixes)
+        self.prefixes = prefixes
+        self.ip2 = ip2
+        self.sample_per_cidr = sample_per_cidr
+        self.seed = seed
+        self.max_workers = max_workers
+        self.region_table = region_table
+        self.matcher = matcher
+        n = len(prefixes)
+        self.cidrs: List[Optional[str]] = [None] * n
+        self.plans: List[Optional[List[str]]] = [None] * n
+        self.regions: List[List[str]] = [[] for _ in range(n)]
+        self.hits = [0] * n
+        self.lookups = 0
+
+    def _plan(self, i: int) -> List[str]:
+        plan = self.plans[i]
+        if plan is None:
+            cidr = self.cidrs[i] = format_cidr(*self.prefixes[i])
+            rng = random.Random(f'{self.seed}:{cidr}') if self.seed is not None else None
+            plan = self.plans[i] = sample_ips_from_cidr(self.prefixes[i], n=self.sample_per_cidr, rng=rng)
+        return plan
+
+    def _open(self, i: int) -> bool:
+        """是否还值得追加采样（未用完计划且尚未出现分歧）"""
+        k = len(self.regions[i])
+        if k >= len(self._plan(i)):
+            return False
+        return k == 0 or self.hits[i] in (0, k)
+
+    def _priority(self, i: int) -> float:
+        k = len(self.regions[i])
+        return self.prefixes.num_addresses(i) / (k + 2)
+
+    def _probe(self, ex: ThreadPoolExecutor, batch: List[int]):
+        """每个网段追加查询下一个计划中的采样点"""
+        # 按地址顺序查询，相邻网段落在同一 xdb 段时命中查询后端的段缓存
+        batch = sorted(batch, key=self.prefixes.networks.__getitem__)
+        ips = [self._plan(i)[len(self.regions[i])] for i in batch]
+        chunks = [ips[j:j + CHUNK_SIZE] for j in range(0, len(ips), CHUNK_SIZE)]
+        regions = [r for part in ex.map(lambda c: _lookup_regions(self.ip2, c), chunks) for r in part]
+        for i, region in zip(batch, regions):
+            self.regions[i].append(region)
+            if self.matcher(region):
+                self.hits[i] += 1
+        self.lookups += len(batch)
+        if metrics.enabled:
+            metrics.incr('samples', len(batch))
+
+    def run(self, deadline: float, stop=None) -> Dict:
+        """
+        扫描直到全部完成、到达截止时间（time.monotonic()）或 stop 被置位
+
+        Returns:
+            进度统计
+        """
+        n = len(self.prefixes)
+        start = time.monotonic()
+        # 覆盖阶段：地址数多的网段优先，同等大小按地址顺序
+        order = sorted(range(n), key=lambda i: (self.prefixes.prefixlens[i], self.prefixes.networks[i]))
+        probed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            while probed < n:
+                if time.monotonic() >= deadline or (stop is not None and stop.is_set()):
+                    break
+                batch = order[probed:probed + ROUND_SIZE]
+                self._probe(ex, batch)
+                probed += len(batch)
+
+            # 细化阶段：按优先级追加采样
+            heap = [(-self._priority(i), i) for i in order[:probed] if self._open(i)]
+            heapq.heapify(heap)
+            while heap:
+                if time.monotonic() >= deadline or (stop is not None and stop.is_set()):
+                    break
+                batch = [heapq.heappop(heap)[1] for _ in range(min(ROUND_SIZE, len(heap)))]
+                self._probe(ex, batch)
+                for i in batch:
+                    if self._open(i):
+                        heapq.heappush(heap, (-self._priority(i), i))
+
+        complete = sum(1 for i in order[:probed] if not self._open(i))
+        stats = {
+            'prefixes': n,
+            'probed': probed,
+            'complete': complete,
+            'lookups': self.lookups,
+            'seconds': round(time.monotonic() - start, 2),
+        }
+        metrics.set_gauge('anytime_probed', probed)
+        metrics.set_gauge('anytime_complete', complete)
+        return stats
+
+    def results(self) -> List[Dict]:
+        """当前结果（只含已探测的网段），字段与 scan_single 相同并附加 confidence、complete"""
+        results = []
+        for i, regions in enumerate(self.regions):
+            if not regions:
+                continue
+            k, hits = len(regions), self.hits[i]
+            status = 'none' if hits == 0 else 'high' if hits == k else 'medium'
+            res = {
+                'cidr': self.cidrs[i],
+                'sampled': self.plans[i][:k],
+                'hits': hits,
+                'samples': k,
+                'status': status,
+                'confidence': confidence(hits, k),
+                'complete': not self._open(i),
+            }
+            if self.region_table is not None:
+                res['region_ids'] = [self.region_table.intern(r) for r in regions]
+            results.append(res)
+        return sort_results(results)
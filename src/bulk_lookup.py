@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+批量 IP 查询（日志 / 流量导出中的大量 IP）
+
+从标准输入或文件按大块（默认 4 MB）流式读取以空白分隔的 IPv4 地址（通常每行一个），
+逐块查询区域并判断是否为目标（河北移动），按输入顺序输出 TSV 或 NDJSON：
+1. 启动时把 xdb（或配合 --qqwry 的预合并区间表）的全部段读入内存，合并相邻的相同区域段，
+   得到按起始地址排序的 starts / ends / region_ids 数组
+2. 有 numpy 时整块 IP 按列向量化解析为整数，再用一次 searchsorted 定位所在段；
+   否则逐个 inet_pton + bisect
+3. 每个区域的输出后缀（标志位、区域字符串）预先编码，输出时只做拼接
+--processes N 时各块分发给 N 个进程并行处理（imap 保持输入顺序），段表只在启动时加载一次。
+吞吐统计输出到标准错误。
+
+输出格式:
+    tsv     ip<TAB>target<TAB>region    target 为 1/0，无效 IP 为 -；不在任何段内时 region 为空
+    ndjson  {"ip": ..., "target": true, "region": ...}，无效 IP 为 {"ip": ..., "error": "invalid"}
+--fields flag / region 只输出其中一列。
+
+用法:
+    zcat flows.gz | python src/main.py lookup > flows.tsv
+    python src/main.py lookup ips1.txt ips2.txt --format ndjson --processes 4 -o out.ndjson
+    python src/main.py lookup --qqwry data/qqwry.dat --fields flag < ips.txt
+"""
+import argparse
+import json
+import socket
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from ip2region_client import is_hebei_mobile_region
+from xdb_maker import coalesce, iter_segments
+
+try:
+    import numpy as np
+except ImportError:  # numpy 可选，缺失时退化为逐个解析 + bisect
+    np = None
+
+CHUNK_BYTES = 4 << 20
+FORMATS = ('tsv', 'ndjson')
+FIELDS = ('both', 'flag', 'region')
+# IPv4 点分十进制最长 15 个字符，按 16 列定宽解析（第 16 列非空即过长），另补 3 列零便于错位比较
+_WIDTH = 16
+
+
+class SegmentTable:
+    """
+    内存段表（按起始地址排序、互不相交）
+
+    Args:
+        segments: 按地址排序的 (start, end, region)
+        matcher: 目标判断函数，每个区域只调用一次
+    """
+
+    def __init__(self, segments: Iterable[Tuple[int, int, str]], matcher=is_hebei_mobile_region):
+        ids = {}
+        self.regions: List[str] = []
+        starts, ends, region_ids = array('I'), array('I'), array('I')
+        for start, end, region in coalesce(segments):
+            rid = ids.get(region)
+            if rid is None:
+                rid = ids[region] = len(self.regions)
+                self.regions.append(region)
+            starts.append(start)
+            ends.append(end)
+            region_ids.append(rid)
+        self.flags = [bool(region) and bool(matcher(region)) for region in self.regions]
+        # 不在任何段内 / 无效 IP 使用两个额外的编号
+        self.miss = len(self.regions)
+        self.invalid = self.miss + 1
+        if np is not None:
+            self.flag_array = np.array(self.flags + [False, False], dtype=bool)
+            self.starts = np.frombuffer(starts, dtype=np.uint32)
+            self.ends = np.frombuffer(ends, dtype=np.uint32)
+            self.region_ids = np.frombuffer(region_ids, dtype=np.uint32)
+        else:
+            self.starts, self.ends, self.region_ids = starts, ends, region_ids
+
+    @classmethod
+    def from_xdb(cls, db_path, matcher=is_hebei_mobile_region) -> 'SegmentTable':
+        return cls(iter_segments(db_path), matcher)
+
+    @classmethod
+    def from_joined(cls, path, matcher=is_hebei_mobile_region) -> 'SegmentTable':
+        """由预合并区间表（joined_table.py）构建，每个区间已是 ip2region + 纯真 的最终结果"""
+        from joined_table import JoinedTableClient
+
+        client = JoinedTableClient(path)
+        try:
+            return cls(client.iter_ranges(), matcher)
+        finally:
+            client.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def codes(self, tokens: List[bytes]):
+        """每个 token 的区域编号（miss / invalid 见构造函数）；有 numpy 时返回数组，否则返回列表"""
+        if np is not None:
+            values, valid = parse_ipv4(tokens)
+            idx = np.searchsorted(self.starts, values, side='right').astype(np.int64) - 1
+            safe = np.maximum(idx, 0)
+            found = valid & (idx >= 0) & (values <= self.ends[safe])
+            codes = np.where(found, self.region_ids[safe], self.miss)
+            codes[~valid] = self.invalid
+            return codes
+
+        pton = socket.inet_pton
+        codes = []
+        for token in tokens:
+            try:
+                x = int.from_bytes(pton(socket.AF_INET, token.decode('ascii')), 'big')
+            except (OSError, UnicodeDecodeError):
+                codes.append(self.invalid)
+                continue
+            i = bisect_right(self.starts, x) - 1
+            codes.append(self.region_ids[i] if i >= 0 and x <= self.ends[i] else self.miss)
+        return codes
+
+
+def parse_ipv4(tokens: List[bytes]):
+    """
+    向量化解析点分十进制 IPv4（与 inet_pton 一样严格：4 段、每段 0-255、不允许前导零）
+
+    token 转为定宽字节矩阵后转置（每个字符位置一行，行内连续），每段首位数字处由其后最多两位数字
+    算出段值，再按位置依次移位累加；每一步都是对全部 token 的整行运算
+
+    Returns:
+        (uint32 地址数组, bool 有效标志数组)
+    """
+    n = len(tokens)
+    w = _WIDTH
+    m = np.ascontiguousarray(np.array(tokens, dtype=f'S{w + 3}').view(np.uint8).reshape(n, w + 3).T)
+    d = m - np.uint8(48)
+    dig = d < 10
+    dot = m == 46
+    nul = m == 0
+    # 只允许数字和点，长度不超过 15（NUL 只出现在末尾的填充部分）
+    ok = (dig | dot | nul).all(0) & nul[w - 1]
+    ok &= (nul[:w - 1] <= nul[1:w]).all(0)
+    d = d.astype(np.uint16)
+    next1 = dig[1:w + 1]
+    next2 = next1 & dig[2:w + 2]
+    start = dig[:w].copy()
+    start[1:] &= ~dig[:w - 1]
+    # 段值：d0，后面还有数字时依次 *10 累加（布尔掩码参与乘法，避免分支）
+    n1, n2 = next1.view(np.uint8), next2.view(np.uint8)
+    octet = d[:w] * (1 + 9 * n1) + d[1:w + 1] * n1
+    octet = octet * (1 + 9 * n2) + d[2:w + 2] * n2
+    # 段超过 3 位、段值超过 255、前导零
+    bad = (next2 & dig[3:w + 3]) | (octet > 255) | (next1 & (d[:w] == 0))
+    ok &= ~(start & bad).any(0)
+    ok &= (start.sum(0, dtype=np.uint8) == 4) & (dot.sum(0, dtype=np.uint8) == 3)
+    # 逐位置移位累加：只有段首位置移 8 位并放入段值
+    octet = (octet * start).astype(np.uint32)
+    shift = start.view(np.uint8) << np.uint8(3)
+    value = np.zeros(n, dtype=np.uint32)
+    for j in range(w):
+        value <<= shift[j]
+        value |= octet[j]
+    return value, ok
+
+
+def _json_escape(token: bytes) -> bytes:
+    return json.dumps(token.decode('utf-8', 'replace'), ensure_ascii=False)[1:-1].encode('utf-8')
+
+
+class Formatter:
+    """按区域编号预先编码每行的后缀，输出时只做 token + 后缀 拼接"""
+
+    def __init__(self, table: SegmentTable, fmt: str = 'tsv', fields: str = 'both'):
+        self.fmt = fmt
+        self.table = table
+        with_flag, with_region = fields in ('both', 'flag'), fields in ('both', 'region')
+        entries = [(flag, region) for flag, region in zip(table.flags, table.regions)] + [(False, '')]
+        suffixes = []
+        if fmt == 'tsv':
+            for flag, region in entries:
+                cols = (([b'1' if flag else b'0'] if with_flag else [])
+                        + ([region.encode('utf-8')] if with_region else []))
+                suffixes.append(b''.join(b'\t' + col for col in cols) + b'\n')
+            cols = ([b'-'] if with_flag else []) + ([b''] if with_region else [])
+            suffixes.append(b''.join(b'\t' + col for col in cols) + b'\n')
+        else:
+            # 每行以 {"ip":" 开头，后缀补上 IP 的结束引号和其余字段
+            for flag, region in entries:
+                parts = []
+                if with_flag:
+                    parts.append('"target":' + ('true' if flag else 'false'))
+                if with_region:
+                    parts.append('"region":' + json.dumps(region or None, ensure_ascii=False))
+                suffixes.append(('"' + ''.join(',' + p for p in parts) + '}\n').encode('utf-8'))
+            suffixes.append(b'","error":"invalid"}\n')
+        self.suffixes = suffixes
+        self._suffix_array = np.array(suffixes, dtype=object) if np is not None else None
+
+    def format(self, tokens: List[bytes], codes) -> bytes:
+        invalid = self.table.invalid
+        if self.fmt == 'ndjson':
+            # 无效 token 可能含引号等字符，需要转义
+            tokens = [b'{"ip":"' + (_json_escape(t) if c == invalid else t) for t, c in zip(tokens, codes)]
+        if self._suffix_array is not None:
+            suffixes = self._suffix_array[codes].tolist()
+        else:
+            suffixes = [self.suffixes[c] for c in codes]
+        # token 与后缀交错放入一个列表后一次 join，不逐行拼接
+        parts = [b''] * (2 * len(tokens))
+        parts[::2] = tokens
+        parts[1::2] = suffixes
+        return b''.join(parts)
+
+
+# 工作进程的段表与格式化器（fork 时直接继承，spawn 时由 initializer 传入）
+_worker: Optional[Formatter] = None
+
+
+def _init_worker(formatter: Formatter):
+    global _worker
+    _worker = formatter
+
+
+def classify_chunk(data: bytes, formatter: Optional[Formatter] = None) -> Tuple[bytes, int, int, int]:
+    """
+    查询一块输入
+
+    Returns:
+        (输出字节, IP 数, 无效数, 目标命中数)
+    """
+    formatter = formatter or _worker
+    table = formatter.table
+    tokens = data.split()
+    if not tokens:
+        return b'', 0, 0, 0
+    codes = table.codes(tokens)
+    if np is not None:
+        invalid = int(np.count_nonzero(codes == table.invalid))
+        hits = int(np.count_nonzero(table.flag_array[codes]))
+    else:
+        invalid = sum(1 for c in codes if c == table.invalid)
+        hits = sum(1 for c in codes if c < table.miss and table.flags[c])
+    return formatter.format(tokens, codes), len(tokens), invalid, hits
+
+
+def iter_chunks(streams: Iterable[BinaryIO], chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """按大块读取，每块在最后一个换行处截断，不会切开一个 IP"""
+    for stream in streams:
+        rest = b''
+        while True:
+            data = stream.read(chunk_bytes)
+            if not data:
+                break
+            if rest:
+                data = rest + data
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                rest = data
+                continue
+            rest = data[cut:]
+            yield data[:cut]
+        if rest:
+            yield rest
+
+
+def _open_inputs(paths: List[str]) -> Iterator[BinaryIO]:
+    for path in paths or ['-']:
+        if path == '-':
+            yield sys.stdin.buffer
+        else:
+            with open(path, 'rb') as f:
+                yield f
+
+
+def run(paths: List[str], out: BinaryIO, formatter: Formatter, processes: int = 1,
+        chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """
+    流式查询全部输入并写出结果
+
+    Returns:
+        {'ips', 'invalid', 'hits', 'seconds'}
+    """
+    stats = {'ips': 0, 'invalid': 0, 'hits': 0}
+    start = time.perf_counter()
+    chunks = iter_chunks(_open_inputs(paths), chunk_bytes)
+    pool = None
+    if processes > 1:
+        import multiprocessing
+
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        pool = ctx.Pool(processes, initializer=_init_worker, initargs=(formatter,))
+        parts = pool.imap(classify_chunk, chunks)
+    else:
+        parts = (classify_chunk(chunk, formatter) for chunk in chunks)
+    try:
+        for data, n, invalid, hits in parts:
+            out.write(data)
+            stats['ips'] += n
+            stats['invalid'] += invalid
+            stats['hits'] += hits
+    finally:
+        if pool is not None:
+            pool.terminate()
+    out.flush()
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main(argv=None):
+    project_root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description='批量查询 IP 区域与目标标志（流式，保持输入顺序）')
+    parser.add_argument('inputs', nargs='*', help='输入文件（以空白分隔的 IPv4），省略或 - 表示标准输入')
+    parser.add_argument('--xdb', default=str(project_root / 'data' / 'ip2region_v4.xdb'))
+    parser.add_argument('--qqwry', default=None, help='启用纯真补充：使用 ip2region + 纯真 预合并区间表查询')
+    parser.add_argument('--format', choices=FORMATS, default='tsv')
+    parser.add_argument('--fields', choices=FIELDS, default='both', help='输出目标标志、区域或两者')
+    parser.add_argument('--processes', type=int, default=1, help='并行进程数（按块分发，输出仍保持输入顺序）')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_BYTES / (1 << 20), help='每块读取的大小（MB）')
+    parser.add_argument('-o', '--output', default=None, help='输出文件，默认标准输出')
+    args = parser.parse_args(argv)
+    if args.processes < 1:
+        parser.error('--processes 必须 >= 1')
+
+    load_start = time.perf_counter()
+    if args.qqwry:
+        from joined_table import ensure_joined_table
+
+        table = SegmentTable.from_joined(ensure_joined_table(args.xdb, args.qqwry))
+    else:
+        table = SegmentTable.from_xdb(args.xdb)
+    print(f"✓ 已加载 {len(table)} 个段、{len(table.regions)} 个区域 ({time.perf_counter() - load_start:.1f}s"
+          f"{'，numpy 向量化' if np is not None else ''})", file=sys.stderr)
+
+    formatter = Formatter(table, args.format, args.fields)
+    chunk_bytes = max(1 << 16, int(args.chunk_mb * (1 << 20)))
+    if args.output:
+        with open(args.output, 'wb') as out:
+            stats = run(args.inputs, out, formatter, args.processes, chunk_bytes)
+    else:
+        stats = run(args.inputs, sys.stdout.buffer, formatter, args.processes, chunk_bytes)
+
+    rate = stats['ips'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"⚡ 查询 {stats['ips']:,} 个 IP（目标 {stats['hits']:,}，无效 {stats['invalid']:,}），"
+          f"{stats['seconds']:.2f}s，{rate / 1e6:.2f} M IP/s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
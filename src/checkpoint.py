@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+扫描断点续跑
+
+扫描过程中把已完成网段的结果定期追加到 results.jsonl（每次追加后 fsync），
+并在 manifest.json 中记录本次扫描的输入（ASN 列表哈希、xdb/纯真文件哈希、随机种子、采样数），manifest 原子替换写入。
+进程中途退出（CI 超时、OOM、Ctrl-C）后，使用 --resume 且输入一致时只扫描未完成的网段。
+
+results.jsonl 每行一条记录：
+- {"regions": [...]}：区域字符串表的增量（按出现顺序追加，结果中的 region_ids 引用累积后的表；
+  带 "reset" 时表从空开始，续跑时使用）
+- {"cidr": ..., "status": ..., ...}：一条扫描结果
+写入中途崩溃留下的不完整末行在加载时丢弃。
+"""
+import hashlib
+import json
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ip2region_downloader import file_sha256
+from region_targets import RegionTable
+from result_io import RESULT_FIELDS
+
+MANIFEST_VERSION = 1
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def build_manifest(asns: List[int], xdb_path, sample: int, seed=None, qqwry_path=None, **extra) -> Dict:
+    """
+    描述扫描输入的 manifest（用于判断断点是否可复用）
+
+    Args:
+        asns: ASN 列表
+        xdb_path: ip2region 数据库路径
+        sample: 每个网段采样数
+        seed: 随机种子（None 表示不固定）
+        qqwry_path: 可选的纯真数据库路径
+        extra: 其他影响结果的参数（如查询后端、分片号）
+    """
+    return {
+        'version': MANIFEST_VERSION,
+        'asns_sha256': hashlib.sha256(','.join(str(a) for a in sorted(asns)).encode('ascii')).hexdigest(),
+        'xdb_sha256': file_sha256(xdb_path),
+        'qqwry_sha256': file_sha256(qqwry_path) if qqwry_path else None,
+        'sample': sample,
+        'seed': seed,
+        **extra,
+    }
+
+
+def manifest_mismatch(saved: Dict, current: Dict) -> Optional[str]:
+    """返回第一个不一致的字段名；一致时返回 None（created_at 等元信息不参与比较）"""
+    for key in sorted(set(saved) | set(current)):
+        if key in ('created_at', 'completed'):
+            continue
+        if saved.get(key) != current.get(key):
+            return key
+    return None
+
+
+@contextmanager
+def stop_on_signals(signals=(signal.SIGINT, signal.SIGTERM)):
+    """
+    在 with 块内把 Ctrl-C / SIGTERM（CI 超时）转换为置位一个 Event，由扫描循环在安全点检查并停止
+
+    直接在主线程抛出 KeyboardInterrupt 可能打断线程池内部的锁操作，导致工作线程死锁；
+    再次收到信号时恢复默认行为（立即中断）
+    """
+    stop = threading.Event()
+    previous = {}
+
+    def handler(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        stop.set()
+
+    if threading.current_thread() is threading.main_thread():
+        for sig in signals:
+            previous[sig] = signal.signal(sig, handler)
+    try:
+        yield stop
+    finally:
+        for sig, h in previous.items():
+            signal.signal(sig, h)
+
+
+class Checkpoint:
+    """
+    扫描断点：manifest.json + 追加写入的 results.jsonl
+
+    add() 只写入内存缓冲，距上次落盘超过 interval 秒时自动 flush；
+    flush() 追加写入并 fsync，随后原子更新 manifest 中的完成数
+    """
+
+    def __init__(self, directory: Path, manifest: Dict, region_table: RegionTable, interval: float = 30.0):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / 'manifest.json'
+        self.results_path = self.directory / 'results.jsonl'
+        self.manifest = dict(manifest)
+        self.region_table = region_table
+        self.interval = interval
+        self.completed = 0
+        self._regions_written = 0
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._file = None
+
+    def load(self) -> Dict[str, Dict]:
+        """
+        读取已有断点（manifest 与当前输入一致时）
+
+        Returns:
+            {cidr: result}，region_ids 已映射到 self.region_table；不可复用时返回空字典
+        """
+        try:
+            saved = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            print("⚠ 未找到可用的断点，从头开始扫描")
+            return {}
+        key = manifest_mismatch(saved, self.manifest)
+        if key is not None:
+            print(f"⚠ 断点输入不一致（{key}），从头开始扫描")
+            return {}
+
+        results: Dict[str, Dict] = {}
+        mapping: List[int] = []
+        good_offset = 0
+        try:
+            with open(self.results_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    if 'regions' in record:
+                        if record.get('reset'):
+                            mapping = []
+                        mapping.extend(self.region_table.intern(r) for r in record['regions'])
+                    else:
+                        if 'region_ids' in record:
+                            record['region_ids'] = [mapping[i] for i in record['region_ids']]
+                        results[record['cidr']] = record
+                    good_offset += len(line)
+        except FileNotFoundError:
+            return {}
+        # 丢弃崩溃时写了一半的末行，之后从完整记录末尾继续追加
+        with open(self.results_path, 'r+b') as f:
+            f.truncate(good_offset)
+        self.completed = len(results)
+        return results
+
+    def _open(self, append: bool):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.results_path, 'a' if append else 'w', encoding='utf-8')
+        if append:
+            # 续写时重新开始一段区域表，之后记录的 region_ids 直接对应 self.region_table
+            self._file.write(_dumps({'regions': [], 'reset': True}) + '\n')
+        self._regions_written = 0
+        self._write_manifest()
+
+    def start(self, resumed: bool):
+        """开始写入（resumed=False 时清空旧断点）"""
+        self._open(append=resumed)
+
+    def add(self, result: Dict):
+        regions = self.region_table.regions
+        if len(regions) > self._regions_written:
+            self._buffer.append(_dumps({'regions': regions[self._regions_written:]}))
+            self._regions_written = len(regions)
+        self._buffer.append(_dumps({k: v for k, v in result.items() if k in RESULT_FIELDS}))
+        self.completed += 1
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._file is None:
+            return
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._write_manifest()
+        self._last_flush = time.monotonic()
+
+    def _write_manifest(self):
+        self.manifest['created_at'] = self.manifest.get('created_at') or time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.manifest['completed'] = self.completed
+        tmp = self.manifest_path.with_suffix('.json.tmp')
+        tmp.write_text(json.dumps(self.manifest, indent=2, ensure_ascii=False), encoding='utf-8')
+        tmp.replace(self.manifest_path)
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """扫描全部完成后删除断点"""
+        self.close()
+        for p in (self.results_path, self.manifest_path):
+            p.unlink(missing_ok=True)
+        try:
+            self.directory.rmdir()
+        except OSError:
+            pass
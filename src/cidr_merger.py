@@ -4,7 +4,12 @@ CIDR合并工具
 将连续的IP地址段合并成更大的网段，减少结果数量
 """
 import ipaddress
-from typing import List, Set
+import socket
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import metrics
+from prefix_array import PrefixArray, format_cidr, parse_cidr, range_to_prefixes
 
 
 def merge_cidrs(cidrs: List[str]) -> List[str]:
@@ -24,37 +29,24 @@ def merge_cidrs(cidrs: List[str]) -> List[str]:
     if not cidrs:
         return []
     
-    # 解析所有CIDR为IPv4Network对象
-    networks = []
-    for cidr in cidrs:
-        try:
-            net = ipaddress.IPv4Network(cidr, strict=False)
-            networks.append(net)
-        except Exception as e:
-            print(f"Warning: 无法解析CIDR {cidr}: {e}")
-            continue
-    
-    if not networks:
+    # 整数解析：(网络地址, 掩码位数)
+    prefixes = PrefixArray.from_cidrs(cidrs)
+    if not len(prefixes):
         return []
     
-    # 按网络地址排序
-    networks.sort(key=lambda x: (x.network_address, x.prefixlen))
-    
-    # 去重和合并重叠（仅使用collapse_addresses处理重叠情况）
-    # 但要注意：collapse_addresses会扩大范围，所以我们需要验证
-    collapsed = list(ipaddress.collapse_addresses(networks))
-    
-    # 验证合并是否保持覆盖范围一致
-    # 如果collapsed的总IP数等于原始的总IP数，说明是安全的合并
-    original_ip_count = sum(net.num_addresses for net in networks)
-    collapsed_ip_count = sum(net.num_addresses for net in collapsed)
-    
-    if collapsed_ip_count == original_ip_count:
+    # 区间合并后按最少前缀分解（等价于 collapse_addresses，但全程使用整数）
+    # 如果合并后的总IP数等于原始的总IP数（输入无重叠），说明是安全的合并
+    intervals = prefixes.intervals()
+    if sum(e - s + 1 for s, e in intervals) == prefixes.total_addresses():
         # 安全合并，覆盖范围一致
-        return [str(net) for net in collapsed]
+        merged = [format_cidr(net, plen) for s, e in intervals for net, plen in range_to_prefixes(s, e)]
     else:
-        # collapse_addresses扩大了范围，使用保守策略
-        return merge_conservative(networks)
+        # 输入存在重叠，使用保守策略
+        networks = sorted(ipaddress.IPv4Network((net, plen)) for net, plen in prefixes)
+        merged = merge_conservative(networks)
+    metrics.incr('merge_input_cidrs', len(prefixes))
+    metrics.incr('merge_output_cidrs', len(merged))
+    return merged
 
 
 def merge_conservative(networks: List[ipaddress.IPv4Network]) -> List[str]:
@@ -184,6 +176,231 @@ def merge_cidrs_aggressive(cidrs: List[str]) -> List[str]:
     return [str(net) for net in merged]
 
 
+def cidr_sort_key(cidr: str) -> Tuple[int, int]:
+    """CIDR 数值排序键 (网络地址, 掩码位数)，避免字符串排序导致 10.x 排在 9.x 之前"""
+    addr, _, plen = cidr.partition('/')
+    try:
+        return int.from_bytes(socket.inet_aton(addr), 'big'), int(plen or 32)
+    except (OSError, ValueError):
+        return -1, 0
+
+
+def cidrs_to_intervals(cidrs: List[str]) -> List[Tuple[int, int]]:
+    """
+    将CIDR字符串列表转换为有序、不相交的整数闭区间 [start, end]
+
+    重叠和首尾相接的网段会被合并为一个区间
+    """
+    return PrefixArray.from_cidrs(cidrs).intervals()
+
+
+def subtract_intervals(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """区间差集 a - b（两者均为有序不相交区间，线性扫描）"""
+    result = []
+    j = 0
+    for start, end in a:
+        cur = start
+        while j < len(b) and b[j][1] < cur:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= end:
+            if b[k][0] > cur:
+                result.append((cur, b[k][0] - 1))
+            cur = max(cur, b[k][1] + 1)
+            k += 1
+        if cur <= end:
+            result.append((cur, end))
+    return result
+
+
+def intersect_intervals(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """区间交集 a ∩ b（两者均为有序不相交区间，线性扫描）"""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        lo = max(a[i][0], b[j][0])
+        hi = min(a[i][1], b[j][1])
+        if lo <= hi:
+            result.append((lo, hi))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def intervals_to_cidrs(intervals: List[Tuple[int, int]]) -> List[str]:
+    """将闭区间列表转换为最少数量的 CIDR 字符串"""
+    return [format_cidr(net, plen) for start, end in intervals for net, plen in range_to_prefixes(start, end)]
+
+
+class _IntervalCounter:
+    """基于前缀和的区间地址计数器：O(log n) 统计任意 [lo, hi] 内被覆盖的地址数"""
+
+    def __init__(self, intervals: List[Tuple[int, int]]):
+        self.starts = [s for s, _ in intervals]
+        self.ends = [e for _, e in intervals]
+        self.cum = [0]
+        for s, e in intervals:
+            self.cum.append(self.cum[-1] + e - s + 1)
+
+    def count(self, lo: int, hi: int) -> int:
+        first = bisect_left(self.ends, lo)
+        last = bisect_right(self.starts, hi) - 1
+        if first > last:
+            return 0
+        total = self.cum[last + 1] - self.cum[first]
+        total -= max(0, lo - self.starts[first])
+        total -= max(0, self.ends[last] - hi)
+        return total
+
+
+def merge_cidrs_budget(results: List[Dict],
+                       max_entries: Optional[int] = None,
+                       max_overshoot: Optional[int] = None,
+                       include_medium: bool = True,
+                       min_prefixlen: int = 8) -> Tuple[List[str], Dict]:
+    """
+    预算合并模式：在条目数或超额覆盖约束下，求条目数最少的聚合方案
+
+    以扫描结果中的阳性网段（high，可选 medium）为叶子构建二叉前缀树，
+    在树上做动态规划：f[节点][k] = 用恰好 k 个条目覆盖该节点下全部阳性地址时
+    最少的超额覆盖地址数。每个节点要么用自身前缀 1 个条目整体覆盖，
+    要么由左右子树的方案组合而成。
+
+    超额覆盖 = 聚合结果中不属于阳性网段的地址，分为两类：
+    - none: 已扫描但判定为非河北移动的地址
+    - unscanned: 未参与扫描的地址（不在任何 ASN 公告范围内）
+
+    Args:
+        results: 扫描结果列表（需包含 cidr 和 status 字段）
+        max_entries: 最大条目数；在此约束下使超额覆盖最少
+        max_overshoot: 最大可容忍的超额覆盖地址数；在此约束下使条目数最少
+        include_medium: 是否把 medium 视为阳性（与 txt 输出保持一致，默认是）
+        min_prefixlen: 聚合条目允许的最短掩码，避免生成过大的超网
+
+    Returns:
+        (合并后的CIDR列表, 超额覆盖报告)
+
+    Raises:
+        ValueError: 未指定任何约束，或约束无法满足
+    """
+    if max_entries is None and max_overshoot is None:
+        raise ValueError("必须指定 max_entries 或 max_overshoot 至少一个约束")
+
+    positive_status = ('high', 'medium') if include_medium else ('high',)
+    positive_nets, none_nets = PrefixArray(), PrefixArray()
+    for r in results:
+        try:
+            net, plen = parse_cidr(r['cidr'])
+        except ValueError as e:
+            print(f"Warning: 无法解析CIDR {r.get('cidr')}: {e}")
+            continue
+        if r['status'] in positive_status:
+            positive_nets.append(net, plen)
+        else:
+            none_nets.append(net, plen)
+
+    report = {
+        'entries': 0,
+        'overshoot': 0,
+        'none_addresses': 0,
+        'unscanned_addresses': 0,
+        'none_overcovered': [],
+        'unscanned_overcovered': [],
+    }
+    if not len(positive_nets):
+        return [], report
+
+    positive = positive_nets.intervals()
+    none = subtract_intervals(none_nets.intervals(), positive)
+    pos_counter = _IntervalCounter(positive)
+
+    # 叶子：阳性地址的最小无损 CIDR 分解（互不相交、按地址排序）
+    blocks = [block for start, end in positive for block in range_to_prefixes(start, end)]
+    starts = [b[0] for b in blocks]
+
+    cap = len(blocks) if max_entries is None else min(max_entries, len(blocks))
+    if cap < 1:
+        raise ValueError(f"max_entries 必须 >= 1: {max_entries}")
+    INF = float('inf')
+
+    def solve(i, j):
+        """返回 (前缀, 叶子数, f, 拆分选择, 左子树, 右子树)"""
+        if j - i == 1:
+            net, plen = blocks[i]
+            return (net, plen), 1, [INF, 0], None, None, None
+        lo = blocks[i][0]
+        hi = blocks[j - 1][0] + (1 << (32 - blocks[j - 1][1])) - 1
+        plen = 32 - (lo ^ hi).bit_length()
+        net = lo & (((1 << plen) - 1) << (32 - plen)) if plen else 0
+        mid = bisect_left(starts, net | (1 << (31 - plen)), i, j)
+        left, right = solve(i, mid), solve(mid, j)
+        n_left, f_left = left[1], left[2]
+        n_right, f_right = right[1], right[2]
+        leaves = n_left + n_right
+        size = min(cap, leaves)
+
+        f = [INF] * (size + 1)
+        choice = [0] * (size + 1)
+        if plen >= min_prefixlen:
+            f[1] = (1 << (32 - plen)) - pos_counter.count(net, net + (1 << (32 - plen)) - 1)
+        for k in range(2, size + 1):
+            best, best_a = INF, 0
+            for a in range(max(1, k - n_right), min(n_left, k - 1) + 1):
+                cost = f_left[a] + f_right[k - a]
+                if cost < best:
+                    best, best_a = cost, a
+            f[k], choice[k] = best, best_a
+        return (net, plen), leaves, f, choice, left, right
+
+    root = solve(0, len(blocks))
+    f_root = root[2]
+
+    chosen_k = None
+    for k in range(1, len(f_root)):
+        if f_root[k] == INF:
+            continue
+        if max_overshoot is not None:
+            if f_root[k] <= max_overshoot:
+                chosen_k = k
+                break
+        elif chosen_k is None or f_root[k] < f_root[chosen_k]:
+            chosen_k = k
+    if chosen_k is None:
+        raise ValueError(f"无法满足约束: max_entries={max_entries}, max_overshoot={max_overshoot}")
+
+    # 回溯得到选中的条目
+    entries = []
+
+    def collect(node, k):
+        prefix, _, _, choice, left, right = node
+        if k == 1:
+            entries.append(prefix)
+            return
+        a = choice[k]
+        collect(left, a)
+        collect(right, k - a)
+
+    collect(root, chosen_k)
+    entries.sort()
+
+    covered = PrefixArray.from_pairs(entries).intervals()
+    over = subtract_intervals(covered, positive)
+    over_none = intersect_intervals(over, none)
+    over_unscanned = subtract_intervals(over, over_none)
+
+    report.update({
+        'entries': len(entries),
+        'overshoot': sum(e - s + 1 for s, e in over),
+        'none_addresses': sum(e - s + 1 for s, e in over_none),
+        'unscanned_addresses': sum(e - s + 1 for s, e in over_unscanned),
+        'none_overcovered': intervals_to_cidrs(over_none),
+        'unscanned_overcovered': intervals_to_cidrs(over_unscanned),
+    })
+    return [format_cidr(net, plen) for net, plen in entries], report
+
+
 def summarize_cidrs(original: List[str], merged: List[str]) -> str:
     """
     生成合并统计摘要
@@ -205,9 +422,9 @@ def summarize_cidrs(original: List[str], merged: List[str]) -> str:
         prefix_counts = {}
         for cidr in cidrs:
             try:
-                prefixlen = ipaddress.IPv4Network(cidr, strict=False).prefixlen
+                prefixlen = parse_cidr(cidr)[1]
                 prefix_counts[prefixlen] = prefix_counts.get(prefixlen, 0) + 1
-            except Exception:
+            except ValueError:
                 pass
         return prefix_counts
     
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+常驻扫描模式
+
+进程常驻内存，保留 ip2region 客户端、前缀列表和上一轮扫描结果：
+- 按 --interval 定时重新获取前缀并扫描
+- 轮询 data/cmcc.txt、xdb、前缀缓存文件的变化，变化后立即触发一轮
+- xdb 变化时在后台线程加载新库，同时获取前缀；加载完成后原子切换（双缓冲），
+  并发查询方（如同进程的查询服务）全程使用旧库，不停顿
+- xdb 未变化时只扫描新增的前缀，复用已有结果（增量）
+
+用法:
+    python src/main.py daemon --interval 86400 --poll 30
+    python src/main.py daemon --serve --port 8053          # 同时提供本地查询服务
+"""
+import argparse
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+
+from asn_loader import load_asns_from_file
+from fetch_prefixes_async import CACHE_PATH, get_prefixes_sync
+from ip2region_client import SEGMENT_CACHE_SIZE, IP2RegionClient
+from ip2region_downloader import download_xdb
+from membership import MembershipSet
+from metrics import metrics
+from prefix_array import PrefixArray
+from region_targets import RegionTable
+from scanner_advanced import scan_prefixes_concurrent, sort_results
+
+
+class HotSwap:
+    """
+    双缓冲引用：读者总是访问 current，属性与方法调用透明转发给 current
+
+    swap 时旧对象保留一代（仍可能有进行中的调用），到下一次 swap 时才关闭，
+    因此切换只是一次引用赋值，读者无需加锁也不会停顿
+    """
+
+    def __init__(self, initial):
+        self.current = initial
+        self._previous = None
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+
+    def __len__(self):
+        return len(self.current)
+
+    def swap(self, new):
+        with self._lock:
+            retired = self._previous
+            self._previous = self.current
+            self.current = new
+            self.generation += 1
+        if retired is not None and hasattr(retired, 'close'):
+            retired.close()
+
+    def close(self):
+        with self._lock:
+            for obj in (self._previous, self.current):
+                if obj is not None and hasattr(obj, 'close'):
+                    obj.close()
+            self._previous = None
+
+
+def load_in_background(factory: Callable[[], object]) -> Callable[[], object]:
+    """
+    在后台线程执行 factory，返回一个等待函数（阻塞至加载完成并返回结果，失败时抛出异常）
+    """
+    box: Dict[str, object] = {}
+
+    def run():
+        try:
+            box['value'] = factory()
+        except Exception as e:
+            box['error'] = e
+
+    thread = threading.Thread(target=run, name='xdb-loader', daemon=True)
+    thread.start()
+
+    def wait():
+        thread.join()
+        if 'error' in box:
+            raise box['error']
+        return box['value']
+
+    return wait
+
+
+class FileWatcher:
+    """按 (mtime, size) 轮询检测文件变化（原子替换产生的新文件同样能检测到）"""
+
+    def __init__(self, paths: Dict[str, Path]):
+        self.paths = paths
+        self._signatures = {name: self._signature(p) for name, p in paths.items()}
+
+    @staticmethod
+    def _signature(path: Path):
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self) -> Set[str]:
+        result = set()
+        for name, path in self.paths.items():
+            sig = self._signature(path)
+            if sig != self._signatures[name]:
+                self._signatures[name] = sig
+                result.add(name)
+        return result
+
+    def reset(self):
+        """以当前状态为基准（本进程自己写入的文件变化不触发下一轮）"""
+        self._signatures = {name: self._signature(p) for name, p in self.paths.items()}
+
+
+class ScanDaemon:
+    """常驻扫描器：状态保留在内存，定时或文件变化时增量重扫"""
+
+    def __init__(self, cmcc: Path, xdb_path: Path, sample: int = 3, scan_workers: int = 24,
+                 fetch_concurrency: int = 20, enable_merge: bool = True, out_dir: Optional[Path] = None):
+        self.cmcc = cmcc
+        self.xdb_path = xdb_path
+        self.sample = sample
+        self.scan_workers = scan_workers
+        self.fetch_concurrency = fetch_concurrency
+        self.enable_merge = enable_merge
+        self.out_dir = out_dir
+
+        # 客户端主要用于按地址顺序的重扫，开启段缓存
+        self.client = HotSwap(IP2RegionClient(str(xdb_path), segment_cache=SEGMENT_CACHE_SIZE))
+        self.members: Optional[HotSwap] = None
+        self.region_table = RegionTable()
+        self.prefixes = PrefixArray()
+        self.results: Dict[str, Dict] = {}
+        self.runs = 0
+        self.watcher = FileWatcher({'cmcc': cmcc, 'xdb': xdb_path, 'prefix_cache': CACHE_PATH})
+
+    def reload_xdb(self) -> Callable[[], None]:
+        """
+        在后台线程开始加载新 xdb，返回完成切换的函数
+
+        加载期间旧客户端继续服务查询，调用方可同时做其他准备（如获取前缀）；
+        调用返回的函数时等待加载完成并原子切换，旧结果全部作废
+        """
+        print(f"🔄 后台加载新 xdb: {self.xdb_path}")
+        start = time.perf_counter()
+        wait = load_in_background(lambda: IP2RegionClient(str(self.xdb_path), segment_cache=SEGMENT_CACHE_SIZE))
+
+        def finish():
+            new_client = wait()
+            self.client.swap(new_client)
+            # 区域数据已变化，旧结果全部作废
+            self.results.clear()
+            self.region_table = RegionTable()
+            print(f"✓ xdb 已切换 (第 {self.client.generation} 代, 加载 {time.perf_counter() - start:.2f}s)")
+
+        return finish
+
+    def refresh_prefixes(self, use_cache: bool):
+        asns = load_asns_from_file(str(self.cmcc))
+        self.prefixes = get_prefixes_sync(asns, use_cache=use_cache, concurrency=self.fetch_concurrency)
+
+    def run_once(self, reasons: Set[str]) -> Dict:
+        """
+        执行一轮扫描
+
+        Args:
+            reasons: 触发原因集合（'startup' / 'schedule' / 'cmcc' / 'xdb' / 'prefix_cache'）
+
+        Returns:
+            本轮统计
+        """
+        from main import save_results
+
+        start = time.perf_counter()
+        print(f"\n⏱ 第 {self.runs + 1} 轮扫描，触发原因: {', '.join(sorted(reasons))}")
+        if 'schedule' in reasons:
+            # 定时检查远端 xdb 是否更新（ETag 未变化时不下载）
+            try:
+                download_xdb(self.xdb_path)
+            except Exception as e:
+                print(f"⚠ xdb 更新检查失败: {e}")
+            reasons = reasons | self.watcher.changed()
+        finish_reload = self.reload_xdb() if 'xdb' in reasons else None
+        try:
+            if reasons & {'startup', 'schedule', 'cmcc', 'prefix_cache'} or not self.prefixes:
+                # 定时触发时绕过缓存，从前缀来源重新获取（与 xdb 加载并行）
+                self.refresh_prefixes(use_cache='schedule' not in reasons)
+        finally:
+            # 扫描前切换到新库
+            if finish_reload is not None:
+                finish_reload()
+
+        current = set(self.prefixes.cidrs())
+        removed = [c for c in self.results if c not in current]
+        for cidr in removed:
+            del self.results[cidr]
+        todo = self.prefixes.exclude(self.results.keys())
+        reused = len(self.results)
+
+        if todo:
+            for res in scan_prefixes_concurrent(todo, self.client, sample_per_cidr=self.sample,
+                                                max_workers=self.scan_workers, region_table=self.region_table):
+                self.results[res['cidr']] = res
+
+        results = sort_results(self.results.values())
+        paths = save_results(results, out_dir=self.out_dir, enable_merge=self.enable_merge)
+        self._swap_members(next(p for p in paths if p.suffix == '.bin'))
+
+        self.runs += 1
+        self.watcher.reset()
+        stats = {
+            'run': self.runs,
+            'scanned': len(todo),
+            'reused': reused,
+            'removed': len(removed),
+            'positives': sum(1 for r in results if r['status'] != 'none'),
+            'seconds': round(time.perf_counter() - start, 2),
+        }
+        print(f"✓ 第 {stats['run']} 轮完成: 扫描 {stats['scanned']}，复用 {stats['reused']}，"
+              f"移除 {stats['removed']}，阳性 {stats['positives']} ({stats['seconds']}s)")
+        metrics.set_gauge('daemon_runs', self.runs)
+        return stats
+
+    def _swap_members(self, bin_path: Path):
+        members = MembershipSet(bin_path)
+        if self.members is None:
+            self.members = HotSwap(members)
+        else:
+            self.members.swap(members)
+
+    def serve_in_background(self, host: str, port: int, unix_path: Optional[str] = None,
+                            window_ms: float = 0.0) -> threading.Thread:
+        """在后台线程运行查询服务，成员集合与 ip2region 客户端都通过 HotSwap 访问"""
+        from query_server import QueryServer
+
+        server = QueryServer(self.members, self.client, window_ms=window_ms)
+        thread = threading.Thread(target=lambda: asyncio.run(server.serve(host, port, unix_path)),
+                                  name='query-server', daemon=True)
+        thread.start()
+        return thread
+
+    def run_forever(self, interval: float, poll: float, on_run: Optional[Callable[[Dict], None]] = None):
+        reasons = {'startup'}
+        next_scheduled = time.monotonic() + interval
+        while True:
+            stats = self.run_once(reasons)
+            if on_run:
+                on_run(stats)
+            reasons = set()
+            while not reasons:
+                time.sleep(poll)
+                reasons = self.watcher.changed()
+                if time.monotonic() >= next_scheduled:
+                    reasons.add('schedule')
+            if 'schedule' in reasons:
+                next_scheduled = time.monotonic() + interval
+
+    def close(self):
+        self.client.close()
+        if self.members is not None:
+            self.members.close()
+
+
+def main(argv=None):
+    project_root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description='常驻扫描模式（定时 / 文件变化触发增量重扫）')
+    parser.add_argument('--cmcc', default='data/cmcc.txt')
+    parser.add_argument('--xdb', default='data/ip2region_v4.xdb')
+    parser.add_argument('--sample', type=int, default=3)
+    parser.add_argument('--fetch-concurrency', type=int, default=20)
+    parser.add_argument('--scan-workers', type=int, default=24)
+    parser.add_argument('--no-merge', action='store_true', help='禁用CIDR合并功能')
+    parser.add_argument('--interval', type=float, default=86400, help='定时重扫间隔（秒）')
+    parser.add_argument('--poll', type=float, default=30, help='文件变化轮询间隔（秒）')
+    parser.add_argument('--metrics-prom', default=None, help='每轮结束后更新 Prometheus textfile')
+    parser.add_argument('--serve', action='store_true', help='同时在本进程内提供查询服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8053)
+    parser.add_argument('--unix', default=None, help='查询服务监听 Unix socket 路径')
+    args = parser.parse_args(argv)
+
+    def resolve(p):
+        p = Path(p)
+        return p if p.is_absolute() else project_root / p
+
+    cmcc, xdb_path = resolve(args.cmcc), resolve(args.xdb)
+    if not cmcc.exists():
+        raise FileNotFoundError(f'cmcc not found: {cmcc.resolve()}')
+    if not xdb_path.exists():
+        download_xdb(xdb_path)
+    if args.metrics_prom:
+        metrics.enable()
+
+    daemon = ScanDaemon(cmcc, xdb_path, sample=args.sample, scan_workers=args.scan_workers,
+                        fetch_concurrency=args.fetch_concurrency, enable_merge=not args.no_merge)
+    serving = {'started': False}
+
+    def on_run(stats):
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+        # 首轮结束后成员文件才存在，此时启动查询服务
+        if args.serve and not serving['started']:
+            daemon.serve_in_background(args.host, args.port, args.unix)
+            serving['started'] = True
+
+    try:
+        daemon.run_forever(args.interval, args.poll, on_run)
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+    finally:
+        daemon.close()
+
+
+if __name__ == '__main__':
+    main()
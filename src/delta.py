@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+增量输出
+对比上一次与本次的河北移动地址集合，输出新增/删除的地址段，
+下游可据此做增量更新，而不必整表重载。
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from cidr_merger import cidrs_to_intervals, intervals_to_cidrs, subtract_intervals
+from prefix_array import format_ip
+
+DELTA_VERSION = 1
+
+
+def load_cidr_file(path: Path) -> List[str]:
+    """读取每行一个 CIDR 的文本文件（不存在时返回空列表）"""
+    if not path.exists():
+        return []
+    return [line.strip() for line in path.read_text(encoding='utf-8').splitlines() if line.strip()]
+
+
+def compute_delta(previous: List[Tuple[int, int]], current: List[Tuple[int, int]]) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    线性扫描两个有序不相交区间列表，求新增和删除的地址区间
+
+    Returns:
+        {'added': current - previous, 'removed': previous - current}
+    """
+    return {
+        'added': subtract_intervals(current, previous),
+        'removed': subtract_intervals(previous, current),
+    }
+
+
+def _addresses(intervals: List[Tuple[int, int]]) -> int:
+    return sum(e - s + 1 for s, e in intervals)
+
+
+def _format_ranges(intervals: List[Tuple[int, int]]) -> List[List[str]]:
+    return [[format_ip(s), format_ip(e)] for s, e in intervals]
+
+
+def write_delta(previous_cidrs: List[str], current_cidrs: List[str], out_dir: Path,
+                prefix: str = 'hebei_cmcc_cidr') -> Tuple[Path, Path, Path]:
+    """
+    写出增量文件
+
+    - <prefix>_delta.json    新增/删除的地址区间（起止地址，按数值排序）及统计
+    - <prefix>_added.txt     新增部分的最小 CIDR 列表
+    - <prefix>_removed.txt   删除部分的最小 CIDR 列表
+
+    Returns:
+        (delta_json_path, added_path, removed_path)
+    """
+    previous = cidrs_to_intervals(previous_cidrs)
+    current = cidrs_to_intervals(current_cidrs)
+    delta = compute_delta(previous, current)
+
+    delta_path = out_dir / f'{prefix}_delta.json'
+    added_path = out_dir / f'{prefix}_added.txt'
+    removed_path = out_dir / f'{prefix}_removed.txt'
+
+    payload = {
+        'version': DELTA_VERSION,
+        'previous_addresses': _addresses(previous),
+        'current_addresses': _addresses(current),
+        'added_addresses': _addresses(delta['added']),
+        'removed_addresses': _addresses(delta['removed']),
+        'added': _format_ranges(delta['added']),
+        'removed': _format_ranges(delta['removed']),
+    }
+    delta_path.write_text(json.dumps(payload, separators=(',', ':'), ensure_ascii=False), encoding='utf-8')
+    added_path.write_text('\n'.join(intervals_to_cidrs(delta['added'])), encoding='utf-8')
+    removed_path.write_text('\n'.join(intervals_to_cidrs(delta['removed'])), encoding='utf-8')
+
+    print(f"增量: +{payload['added_addresses']} / -{payload['removed_addresses']} 个地址 "
+          f"({len(delta['added'])} 个新增区间, {len(delta['removed'])} 个删除区间)")
+    return delta_path, added_path, removed_path
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+采样策略评估（准确率与查询成本）
+
+由 xdb 的段覆盖精确计算每个网段的真实状态（主机地址中命中目标的比例：全部 high / 部分 medium / 无 none），
+再按不同的采样数、种子和采样策略重放采样与查询，统计 high/medium/none 及阳性（high + medium）的
+精确率、召回率，以及查询次数与耗时。结果输出为表格和 JSON 曲线，
+可据此选出满足准确率目标的最便宜配置（--target）。
+
+只有扫描器实际使用的策略（SCANNER_STRATEGIES，即 main.py 的 --sample）参与推荐；
+其余策略标记为探索性，仅供对比，达标时单独列出。
+
+用法:
+    python src/evaluate_sampling.py                                    # 使用 data/prefixes_cache.json 中的前缀
+    python src/evaluate_sampling.py --samples 1,2,3,5,8 --seeds 1,2,3 --strategies random,stratified
+    python src/evaluate_sampling.py --cidrs my_cidrs.txt --limit 20000 --target 0.99 --output eval.json
+"""
+import argparse
+import json
+import random
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ip2region_client import SEGMENT_CACHE_SIZE, IP2RegionClient, is_hebei_mobile_region
+from prefix_array import PrefixArray, format_cidr
+from sample_ips import sample_ips_from_cidr, sample_ips_stratified
+from scanner_advanced import _lookup_regions, make_result
+from xdb_maker import iter_segments
+
+STRATEGIES = {
+    'random': sample_ips_from_cidr,
+    'stratified': sample_ips_stratified,
+}
+# 扫描器（scanner_advanced.scan_single）使用的采样策略，只有这些可以直接通过 main.py --sample 采用
+SCANNER_STRATEGIES = ('random',)
+CLASSES = ('high', 'medium', 'none')
+
+
+class SegmentTruth:
+    """xdb 全部段的起止地址与是否命中目标（紧凑数组，约 9 字节/段）"""
+
+    def __init__(self, db_path, matcher=is_hebei_mobile_region):
+        self.starts = array('I')
+        self.ends = array('I')
+        self.hits = bytearray()
+        for start, end, region in iter_segments(db_path):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.hits.append(1 if matcher(region) else 0)
+
+    def fraction(self, lo: int, hi: int) -> float:
+        """闭区间 [lo, hi] 中命中目标的地址比例（不在任何段内的地址按未命中计）"""
+        starts, ends, hits = self.starts, self.ends, self.hits
+        matched = 0
+        i = max(bisect_right(starts, lo) - 1, 0)
+        while i < len(starts) and starts[i] <= hi:
+            if hits[i]:
+                overlap = min(ends[i], hi) - max(starts[i], lo) + 1
+                if overlap > 0:
+                    matched += overlap
+            i += 1
+        return matched / (hi - lo + 1)
+
+
+def ground_truth(prefixes: PrefixArray, truth: SegmentTruth) -> List[str]:
+    """
+    每个网段的真实状态
+
+    只统计主机地址（与 sample_ips_from_cidr 的采样范围一致：/31、/32 全部地址，其余去掉网络地址和广播地址）
+    """
+    statuses = []
+    for net, plen in prefixes:
+        end = net + (1 << (32 - plen)) - 1
+        if plen < 31:
+            net, end = net + 1, end - 1
+        frac = truth.fraction(net, end)
+        statuses.append('none' if frac == 0 else 'high' if frac == 1 else 'medium')
+    return statuses
+
+
+def _ratio(a: int, b: int) -> Optional[float]:
+    return round(a / b, 4) if b else None
+
+
+def score(predicted: List[str], actual: List[str]) -> Dict:
+    """各状态及阳性（high + medium）的精确率、召回率"""
+    scores = {}
+    for c in CLASSES:
+        tp = sum(1 for p, a in zip(predicted, actual) if p == c and a == c)
+        scores[c] = {
+            'precision': _ratio(tp, sum(1 for p in predicted if p == c)),
+            'recall': _ratio(tp, sum(1 for a in actual if a == c)),
+        }
+    tp = sum(1 for p, a in zip(predicted, actual) if p != 'none' and a != 'none')
+    scores['positive'] = {
+        'precision': _ratio(tp, sum(1 for p in predicted if p != 'none')),
+        'recall': _ratio(tp, sum(1 for a in actual if a != 'none')),
+    }
+    scores['accuracy'] = _ratio(sum(1 for p, a in zip(predicted, actual) if p == a), len(actual))
+    return scores
+
+
+def evaluate(prefixes: PrefixArray, actual: List[str], ip2, sample_per_cidr: int, seed: int,
+             strategy: str = 'random', matcher=is_hebei_mobile_region) -> Dict:
+    """
+    按给定配置重放一次扫描（单线程，随机数派生方式与 scan_single 相同）
+
+    Returns:
+        {'strategy', 'sample', 'seed', 'lookups', 'seconds', 'scores'}
+    """
+    sampler = STRATEGIES[strategy]
+    predicted = []
+    lookups = 0
+    start = time.perf_counter()
+    for prefix in prefixes:
+        cidr = format_cidr(*prefix)
+        ips = sampler(prefix, n=sample_per_cidr, rng=random.Random(f'{seed}:{cidr}'))
+        regions = _lookup_regions(ip2, ips)
+        lookups += len(ips)
+        predicted.append(make_result(cidr, ips, regions, matcher)['status'])
+    return {
+        'strategy': strategy,
+        'sample': sample_per_cidr,
+        'seed': seed,
+        'lookups': lookups,
+        'seconds': round(time.perf_counter() - start, 3),
+        'scores': score(predicted, actual),
+    }
+
+
+def summarize(runs: List[Dict]) -> List[Dict]:
+    """
+    按 (策略, 采样数) 汇总各种子的结果：查询数与耗时取平均，精确率 / 召回率取平均和最小值
+
+    Returns:
+        按查询数升序排列的曲线
+    """
+    groups: Dict[Tuple[str, int], List[Dict]] = {}
+    for run in runs:
+        groups.setdefault((run['strategy'], run['sample']), []).append(run)
+    curve = []
+    for (strategy, sample), group in groups.items():
+        point = {
+            'strategy': strategy,
+            'sample': sample,
+            'seeds': [r['seed'] for r in group],
+            'lookups': round(sum(r['lookups'] for r in group) / len(group)),
+            'seconds': round(sum(r['seconds'] for r in group) / len(group), 3),
+        }
+        for key in (*CLASSES, 'positive'):
+            for metric in ('precision', 'recall'):
+                values = [r['scores'][key][metric] for r in group if r['scores'][key][metric] is not None]
+                point[f'{key}_{metric}'] = round(sum(values) / len(values), 4) if values else None
+                point[f'{key}_{metric}_min'] = min(values) if values else None
+        curve.append(point)
+    return sorted(curve, key=lambda p: (p['lookups'], p['strategy']))
+
+
+def cheapest(curve: List[Dict], target: float, strategies=SCANNER_STRATEGIES) -> Optional[Dict]:
+    """
+    阳性精确率和召回率（各种子中的最小值）都不低于 target 的最便宜配置
+
+    Args:
+        strategies: 参与选择的策略，默认只考虑扫描器支持的策略；传 None 时考虑全部
+    """
+    for point in curve:
+        if strategies is not None and point['strategy'] not in strategies:
+            continue
+        p, r = point['positive_precision_min'], point['positive_recall_min']
+        if p is not None and r is not None and p >= target and r >= target:
+            return point
+    return None
+
+
+def _fmt(v: Optional[float]) -> str:
+    return '   -  ' if v is None else f'{v:.4f}'
+
+
+def print_table(curve: List[Dict]):
+    print(f"\n{'策略':<11}{'采样':>4}{'查询数':>10}{'耗时(s)':>9}   "
+          f"{'high P/R':<15}{'medium P/R':<15}{'none P/R':<15}{'阳性 P/R':<15}")
+    for p in curve:
+        cells = [f"{_fmt(p[f'{k}_precision'])}/{_fmt(p[f'{k}_recall'])}" for k in (*CLASSES, 'positive')]
+        name = p['strategy'] if p['strategy'] in SCANNER_STRATEGIES else p['strategy'] + '*'
+        print(f"{name:<11}{p['sample']:>6}{p['lookups']:>12,}{p['seconds']:>9.2f}   "
+              + ''.join(f'{c:<15}' for c in cells))
+    if any(p['strategy'] not in SCANNER_STRATEGIES for p in curve):
+        print("* 探索性策略：扫描器不支持，仅供对比，不参与 --target 推荐")
+
+
+def load_prefixes(cidrs_path: Optional[str]) -> PrefixArray:
+    """读取待评估的前缀：指定文件（每行一个 CIDR）或前缀缓存（去重后的叶子）"""
+    if cidrs_path:
+        lines = Path(cidrs_path).read_text(encoding='utf-8').split()
+        return PrefixArray.from_cidrs(lines).sorted_unique()
+    from fetch_prefixes_async import build_prefix_set, load_cache
+
+    cache = load_cache()
+    if not cache:
+        raise FileNotFoundError('前缀缓存为空，请先运行一次 main.py 或使用 --cidrs 指定前缀文件')
+    return build_prefix_set(cache)[0]
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(x) for x in value.split(',') if x]
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description='评估采样数 / 种子 / 采样策略的准确率与查询成本')
+    parser.add_argument('--xdb', default=str(project_root / 'data' / 'ip2region_v4.xdb'))
+    parser.add_argument('--cidrs', default=None, help='待评估的 CIDR 文件（每行一个），默认使用前缀缓存')
+    parser.add_argument('--limit', type=int, default=None, help='随机抽取部分网段评估（加快速度）')
+    parser.add_argument('--samples', type=_int_list, default=[1, 2, 3, 5, 8], help='采样数列表，逗号分隔')
+    parser.add_argument('--seeds', type=_int_list, default=[1, 2, 3], help='种子列表，逗号分隔')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES),
+                        help=f"采样策略，逗号分隔（可选: {', '.join(STRATEGIES)}）")
+    parser.add_argument('--target', type=float, default=None, help='阳性精确率与召回率目标，输出满足目标的最便宜配置')
+    parser.add_argument('--output', default=None, help='JSON 结果输出路径')
+    args = parser.parse_args()
+
+    strategies = [s for s in args.strategies.split(',') if s]
+    unknown = [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        parser.error(f"未知采样策略: {', '.join(unknown)}")
+
+    prefixes = load_prefixes(args.cidrs)
+    if args.limit and args.limit < len(prefixes):
+        picked = sorted(random.Random(0).sample(range(len(prefixes)), args.limit))
+        prefixes = PrefixArray.from_pairs(prefixes[i] for i in picked)
+    print(f"📋 评估 {len(prefixes)} 个网段")
+
+    start = time.perf_counter()
+    truth = SegmentTruth(args.xdb)
+    actual = ground_truth(prefixes, truth)
+    counts = {c: actual.count(c) for c in CLASSES}
+    print(f"🎯 真实状态（由 {len(truth.starts)} 个 xdb 段计算，{time.perf_counter() - start:.1f}s）: "
+          + ', '.join(f'{c} {n}' for c, n in counts.items()))
+
+    # 与扫描器相同：按地址顺序重放采样，开启段缓存
+    ip2 = IP2RegionClient(args.xdb, segment_cache=SEGMENT_CACHE_SIZE)
+    runs = []
+    for strategy in strategies:
+        for sample in args.samples:
+            for seed in args.seeds:
+                runs.append(evaluate(prefixes, actual, ip2, sample, seed, strategy))
+    ip2.close()
+
+    curve = summarize(runs)
+    print_table(curve)
+
+    best = exploratory = None
+    if args.target is not None:
+        best = cheapest(curve, args.target)
+        if best:
+            print(f"\n✅ 满足阳性 P/R >= {args.target} 的最便宜配置: --sample {best['sample']} "
+                  f"({best['strategy']}，{best['lookups']:,} 次查询)")
+        elif any(s in SCANNER_STRATEGIES for s in strategies):
+            print(f"\n⚠ 没有扫描器可用的配置满足阳性 P/R >= {args.target}，请增加 --samples 中的采样数")
+        else:
+            print(f"\n⚠ 未评估扫描器可用的策略（{', '.join(SCANNER_STRATEGIES)}），不给出推荐")
+        overall = cheapest(curve, args.target, strategies=None)
+        if overall and overall['strategy'] not in SCANNER_STRATEGIES and (best is None or overall['lookups'] < best['lookups']):
+            exploratory = overall
+            print(f"🔬 探索性策略 {overall['strategy']} 以 {overall['sample']} 个采样达标（{overall['lookups']:,} 次查询），"
+                  f"扫描器暂不支持")
+
+    if args.output:
+        report = {
+            'xdb': str(args.xdb),
+            'prefixes': len(prefixes),
+            'truth': counts,
+            'target': args.target,
+            'scanner_strategies': list(SCANNER_STRATEGIES),
+            'recommended': best,
+            'exploratory': exploratory,
+            'curve': curve,
+            'runs': runs,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n结果已保存: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
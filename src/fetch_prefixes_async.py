@@ -1,11 +1,15 @@
 import aiohttp
 import asyncio
 import json
-import ipaddress
+import math
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+from metrics import metrics
+from prefix_array import PrefixArray, parse_cidr
+from prefix_trie import build_prefix_trie
 
 # 获取项目根目录下的data目录
 CACHE_PATH = Path(__file__).parent.parent / 'data' / 'prefixes_cache.json'
@@ -17,6 +21,90 @@ CACHE_EXPIRY_DAYS = 7
 MAX_RETRIES = 3  # 最大重试次数
 RETRY_DELAY = 2  # 重试延迟（秒）
 REQUEST_DELAY = 0.5  # 请求间延迟（秒），避免触发速率限制
+# 对冲请求配置：请求耗时超过该来源历史 p90 仍未返回时，向备用来源发出一个重复请求，先返回有效结果者胜出
+LATENCY_PATH = Path(__file__).parent.parent / 'data' / 'fetch_latency.json'
+HEDGE_QUANTILE = 0.9
+HEDGE_DEFAULT_DELAY = 10  # 无历史记录时的对冲等待（秒）
+HEDGE_MIN_DELAY = 1
+LATENCY_HISTORY_SIZE = 20  # 每个 (来源, ASN) 保留的最近耗时条数
+FETCH_LATENCY_BUCKETS_S = [0.5, 1, 2, 5, 10, 20, 30, 60, 120, 180]
+
+
+def _parse_announced_prefixes(data: dict) -> List[str]:
+    """announced-prefixes 返回格式: data.prefixes[].prefix"""
+    return [item.get('prefix', '') for item in data.get('data', {}).get('prefixes', [])]
+
+
+def _parse_ris_prefixes(data: dict) -> List[str]:
+    """ris-prefixes 返回格式: data.prefixes.v4.originating[]"""
+    prefixes = data.get('data', {}).get('prefixes', {})
+    if not isinstance(prefixes, dict):
+        return []
+    return list(prefixes.get('v4', {}).get('originating', []))
+
+
+# 前缀来源（按优先级）：首个为主来源，其余作为对冲 / 故障转移的备用来源
+PREFIX_SOURCES = [
+    {'name': 'ripestat', 'url': API_URL, 'parse': _parse_announced_prefixes},
+    {'name': 'ripestat-ris',
+     'url': "https://stat.ripe.net/data/ris-prefixes/data.json?resource=AS{asn}&list_prefixes=true&types=o&af=v4",
+     'parse': _parse_ris_prefixes},
+]
+
+
+class LatencyHistory:
+    """
+    各 (来源, ASN) 最近请求的耗时（含被取消请求的下界，见 record_censored），用于计算对冲阈值，
+    持久化到 data/fetch_latency.json
+
+    同一来源下不同 ASN 的耗时差别很大（AS9808 需要数十秒），因此优先使用该 ASN 自己的历史，
+    没有时退回到该来源全部 ASN 的历史
+    """
+
+    def __init__(self, path: Optional[Path] = LATENCY_PATH):
+        self.path = path
+        self.samples: Dict[str, Dict[str, List[float]]] = {}
+        if path is not None and path.exists():
+            try:
+                self.samples = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                self.samples = {}
+
+    def record(self, source: str, asn: int, seconds: float):
+        recent = self.samples.setdefault(source, {}).setdefault(str(asn), [])
+        recent.append(round(seconds, 3))
+        del recent[:-LATENCY_HISTORY_SIZE]
+
+    def record_censored(self, source: str, asn: int, seconds: float):
+        """
+        记录被取消请求的耗时（真实耗时的下界）
+
+        对冲中落败的慢请求从不完成，只记录成功请求会让历史偏向快的一侧，p90 逐次下降。
+        下界不低于当前 p90 时说明该请求确实位于长尾，按下界记入；低于 p90 的下界不携带信息，忽略。
+        """
+        q = self.quantile(source, asn)
+        if q is None or seconds >= q:
+            self.record(source, asn, seconds)
+
+    def quantile(self, source: str, asn: int, q: float = HEDGE_QUANTILE) -> Optional[float]:
+        by_asn = self.samples.get(source, {})
+        values = by_asn.get(str(asn)) or [v for recent in by_asn.values() for v in recent]
+        if not values:
+            return None
+        values = sorted(values)
+        return values[max(0, math.ceil(q * len(values)) - 1)]
+
+    def hedge_delay(self, source: str, asn: int) -> float:
+        q = self.quantile(source, asn)
+        return HEDGE_DEFAULT_DELAY if q is None else max(HEDGE_MIN_DELAY, q)
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.json.tmp')
+        tmp.write_text(json.dumps(self.samples, indent=2), encoding='utf-8')
+        tmp.replace(self.path)
 
 def is_cache_expired(cache_data: dict) -> bool:
     """检查缓存是否过期"""
@@ -84,103 +172,210 @@ def split_large_prefixes(prefixes: List[str], max_prefixlen: int = 24) -> List[s
     Example:
         ['10.0.0.0/22'] -> ['10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24', '10.0.3.0/24']
     """
-    result = []
+    result = PrefixArray()
     split_count = 0
     
     for cidr in prefixes:
         try:
-            network = ipaddress.IPv4Network(cidr, strict=False)
-            
-            # 如果网段已经是 /24 或更小，直接保留
-            if network.prefixlen >= max_prefixlen:
-                result.append(str(network))
-            else:
-                # 拆分成 /24 子网
-                subnets = list(network.subnets(new_prefix=max_prefixlen))
-                result.extend([str(subnet) for subnet in subnets])
-                split_count += 1
-                
-                # 输出拆分信息（仅对大网段）
-                if network.prefixlen <= 20:  # 只显示 /20 及以上的大网段拆分信息
-                    print(f"  Split {cidr} -> {len(subnets)} x /{max_prefixlen} subnets")
-        
-        except Exception as e:
+            net, plen = parse_cidr(cidr)
+        except ValueError as e:
             print(f"Warning: Failed to parse {cidr}: {e}")
-            result.append(cidr)  # 解析失败，保留原样
+            continue
+        
+        # 如果网段已经是 /24 或更小，直接保留
+        if plen >= max_prefixlen:
+            result.append(net, plen)
+        else:
+            # 拆分成 /24 子网（整数运算，不创建 IPv4Network 对象）
+            count = 1 << (max_prefixlen - plen)
+            step = 1 << (32 - max_prefixlen)
+            result.networks.extend(range(net, net + count * step, step))
+            result.prefixlens.extend(bytes([max_prefixlen]) * count)
+            split_count += 1
+            
+            # 输出拆分信息（仅对大网段）
+            if plen <= 20:  # 只显示 /20 及以上的大网段拆分信息
+                print(f"  Split {cidr} -> {count} x /{max_prefixlen} subnets")
     
+    result = result.sorted_unique()
     if split_count > 0:
         print(f"✓ Split {split_count} large prefixes into {len(result)} subnets (/{max_prefixlen})")
     
-    return sorted(set(result))
+    return result.to_cidrs()
 
-async def fetch_one(session: aiohttp.ClientSession, asn: int, semaphore: asyncio.Semaphore):
+async def _fetch_source(session: aiohttp.ClientSession, asn: int, source: Dict,
+                        history: Optional[LatencyHistory] = None) -> Optional[List[str]]:
     """
-    获取单个 ASN 的前缀，带重试和速率限制
+    从单个来源获取 ASN 的前缀，带重试和速率限制
+
+    Returns:
+        排序去重后的 IPv4 前缀列表；失败时返回 None
     """
-    url = API_URL.format(asn=asn)
-    
-    async with semaphore:  # 限制并发数
-        for attempt in range(MAX_RETRIES):
-            try:
-                # 添加请求延迟，避免触发速率限制
-                if attempt > 0:
-                    delay = RETRY_DELAY * (2 ** (attempt - 1))  # 指数退避
-                    print(f"  AS{asn}: Retry {attempt}/{MAX_RETRIES} after {delay}s...")
-                    await asyncio.sleep(delay)
-                else:
-                    await asyncio.sleep(REQUEST_DELAY)
-                
-                # 使用更长的超时时间，特别是对于大型 ASN（如 AS9808）
-                timeout = aiohttp.ClientTimeout(total=180, sock_read=90)
-                async with session.get(url, timeout=timeout) as r:
-                    # 处理速率限制
-                    if r.status == 429:
-                        retry_after = int(r.headers.get('Retry-After', RETRY_DELAY * 2))
-                        print(f"⚠️  AS{asn}: Rate limited, waiting {retry_after}s...")
-                        await asyncio.sleep(retry_after)
-                        continue
-                    
-                    # 处理服务器错误（502, 503 等）
-                    if r.status in [502, 503, 504]:
-                        print(f"⚠️  AS{asn}: Server error {r.status}, retrying...")
-                        continue
-                    
-                    if r.status != 200:
-                        print(f"⚠️  AS{asn}: HTTP {r.status}")
-                        return str(asn), []
-                    
-                    data = await r.json()
-                    # RIPEstat API 返回格式: data.prefixes[].prefix
-                    prefixes = []
-                    if 'data' in data and 'prefixes' in data['data']:
-                        for item in data['data']['prefixes']:
-                            prefix = item.get('prefix', '')
-                            # 只获取IPv4前缀
-                            if prefix and ':' not in prefix:
-                                prefixes.append(prefix)
-                    
-                    print(f"✓ AS{asn}: {len(prefixes)} IPv4 prefixes")
-                    return str(asn), sorted(set(prefixes))
-                    
-            except asyncio.TimeoutError:
-                print(f"⏱️  AS{asn}: Timeout (attempt {attempt + 1}/{MAX_RETRIES})")
-            except Exception as e:
-                print(f"❌ AS{asn}: {type(e).__name__}: {e}")
-                if attempt == MAX_RETRIES - 1:
-                    return str(asn), []
-        
-        # 所有重试都失败
-        print(f"❌ AS{asn}: Failed after {MAX_RETRIES} attempts")
+    url = source['url'].format(asn=asn)
+    name = source['name']
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            # 添加请求延迟，避免触发速率限制
+            if attempt > 0:
+                metrics.incr('fetch_retries')
+                delay = RETRY_DELAY * (2 ** (attempt - 1))  # 指数退避
+                print(f"  AS{asn} [{name}]: Retry {attempt}/{MAX_RETRIES} after {delay}s...")
+                await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(REQUEST_DELAY)
+
+            # 使用更长的超时时间，特别是对于大型 ASN（如 AS9808）
+            timeout = aiohttp.ClientTimeout(total=180, sock_read=90)
+            metrics.incr('fetch_requests')
+            start = time.perf_counter()
+            async with session.get(url, timeout=timeout) as r:
+                # 处理速率限制
+                if r.status == 429:
+                    metrics.incr('fetch_429')
+                    retry_after = int(r.headers.get('Retry-After', RETRY_DELAY * 2))
+                    print(f"⚠️  AS{asn} [{name}]: Rate limited, waiting {retry_after}s...")
+                    await asyncio.sleep(retry_after)
+                    continue
+
+                # 处理服务器错误（502, 503 等）
+                if r.status in [502, 503, 504]:
+                    metrics.incr('fetch_5xx')
+                    print(f"⚠️  AS{asn} [{name}]: Server error {r.status}, retrying...")
+                    continue
+
+                if r.status != 200:
+                    print(f"⚠️  AS{asn} [{name}]: HTTP {r.status}")
+                    return None
+
+                body = await r.read()
+                metrics.incr('fetch_bytes', len(body))
+                # 只获取IPv4前缀
+                prefixes = [p for p in source['parse'](json.loads(body)) if p and ':' not in p]
+            elapsed = time.perf_counter() - start
+            if history is not None:
+                history.record(name, asn, elapsed)
+            metrics.observe('fetch_latency_seconds', elapsed, FETCH_LATENCY_BUCKETS_S)
+
+            print(f"✓ AS{asn}: {len(prefixes)} IPv4 prefixes [{name}, {elapsed:.1f}s]")
+            return sorted(set(prefixes))
+
+        except asyncio.TimeoutError:
+            metrics.incr('fetch_timeouts')
+            print(f"⏱️  AS{asn} [{name}]: Timeout (attempt {attempt + 1}/{MAX_RETRIES})")
+        except Exception as e:
+            metrics.incr('fetch_errors')
+            print(f"❌ AS{asn} [{name}]: {type(e).__name__}: {e}")
+            if attempt == MAX_RETRIES - 1:
+                return None
+
+    # 所有重试都失败
+    print(f"❌ AS{asn} [{name}]: Failed after {MAX_RETRIES} attempts")
+    return None
+
+async def fetch_one(session: aiohttp.ClientSession, asn: int, semaphore: asyncio.Semaphore,
+                    sources: Optional[List[Dict]] = None, history: Optional[LatencyHistory] = None,
+                    hedge: bool = True, stats: Optional[Dict[str, int]] = None) -> Tuple[str, List[str]]:
+    """
+    获取单个 ASN 的前缀（对冲请求）
+
+    先请求主来源；超过其历史 p90 耗时仍未返回时，向下一个来源发出一个重复请求，
+    先返回有效结果的一方胜出，另一方立即取消，其已等待的耗时作为下界记入历史。
+    某个来源失败时直接改用下一个来源。
+
+    Args:
+        sources: 前缀来源列表，默认 PREFIX_SOURCES
+        history: 耗时历史（用于对冲阈值）
+        hedge: 是否启用对冲（关闭时只在失败后转移到备用来源）
+        stats: 可选的计数字典（hedges / hedge_wins / cancelled）
+    """
+    sources = sources or PREFIX_SOURCES
+    history = history or LatencyHistory(path=None)
+    stats = stats if stats is not None else {}
+    alternates = iter(sources[1:])
+
+    async with semaphore:  # 限制并发数（对冲请求与原请求共用一个名额）
+        start = time.perf_counter()
+        deadline = start + REQUEST_DELAY + history.hedge_delay(sources[0]['name'], asn)
+        pending: Dict[asyncio.Task, Dict] = {}
+        launched_at: Dict[asyncio.Task, float] = {}
+
+        def launch(source):
+            task = asyncio.create_task(_fetch_source(session, asn, source, history))
+            pending[task] = source
+            launched_at[task] = time.perf_counter()
+
+        launch(sources[0])
+        hedged = False
+        hedge_source = None
+        winner = None
+        try:
+            while pending:
+                can_hedge = hedge and not hedged and len(sources) > 1
+                timeout = max(0.0, deadline - time.perf_counter()) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 超过历史 p90 仍未返回：向备用来源发出对冲请求
+                    source = next(alternates, None)
+                    hedged = True
+                    if source is not None:
+                        print(f"🪁 AS{asn}: {sources[0]['name']} exceeded p90 "
+                              f"({deadline - start:.1f}s), hedging to {source['name']}")
+                        metrics.incr('fetch_hedges')
+                        stats['hedges'] = stats.get('hedges', 0) + 1
+                        hedge_source = source
+                        launch(source)
+                    continue
+                for task in done:
+                    source = pending.pop(task)
+                    prefixes = task.result()
+                    if prefixes is not None and winner is None:
+                        winner = source, prefixes
+                if winner is not None:
+                    break
+                if not pending:
+                    # 已有请求全部失败：改用下一个来源
+                    source = next(alternates, None)
+                    if source is not None:
+                        hedged = True
+                        metrics.incr('fetch_failovers')
+                        launch(source)
+        finally:
+            # 取消落败（或仍在重试中）的请求
+            for task in pending:
+                task.cancel()
+            if pending and winner is not None:
+                # 落败请求的耗时至少为已等待的时间（扣除请求前延迟），作为下界记入历史
+                now = time.perf_counter()
+                for task, source in pending.items():
+                    history.record_censored(source['name'], asn, max(0.0, now - launched_at[task] - REQUEST_DELAY))
+            if pending:
+                metrics.incr('fetch_hedge_cancelled', len(pending))
+                stats['cancelled'] = stats.get('cancelled', 0) + len(pending)
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    if winner is None:
         return str(asn), []
+    source, prefixes = winner
+    if source is hedge_source:
+        metrics.incr('fetch_hedge_wins')
+        stats['hedge_wins'] = stats.get('hedge_wins', 0) + 1
+    return str(asn), prefixes
 
-async def fetch_all(asns: List[int], use_cache=True, concurrency=5):
+async def fetch_announcements(asns: List[int], use_cache=True, concurrency=5, hedge=True,
+                              sources: Optional[List[Dict]] = None) -> Dict[str, List[str]]:
     """
-    并发获取多个 ASN 的前缀
-    
+    并发获取多个 ASN 的宣告前缀（大网段已拆分为 /24），并写回前缀缓存
+
     Args:
         asns: ASN 列表
         use_cache: 是否使用缓存
         concurrency: 并发数（默认 5，避免触发 API 速率限制）
+        hedge: 慢请求是否向备用来源发出对冲请求（见 fetch_one）
+        sources: 前缀来源列表，默认 PREFIX_SOURCES
+
+    Returns:
+        {asn: [cidr...]}（与前缀缓存格式相同，包含缓存中的全部 ASN）
     """
     print(f"\n🔍 Total ASNs to process: {len(asns)}")
     print(f"🔢 ASN list: {sorted(asns)}")
@@ -199,6 +394,8 @@ async def fetch_all(asns: List[int], use_cache=True, concurrency=5):
         uncached.append(asn)
     
     print(f"📊 Cached: {len(asns) - len(uncached)}, Need to fetch: {len(uncached)}")
+    metrics.incr('prefix_cache_hits', len(asns) - len(uncached))
+    metrics.incr('prefix_cache_misses', len(uncached))
 
     if not uncached:
         print("✓ All ASNs found in cache")
@@ -211,9 +408,16 @@ async def fetch_all(asns: List[int], use_cache=True, concurrency=5):
     # 设置全局超时，特别是针对大型 ASN（如 AS9808）
     timeout = aiohttp.ClientTimeout(total=180, sock_read=90)
     
+    history = LatencyHistory()
+    hedge_stats: Dict[str, int] = {}
     async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = [fetch_one(session, asn, semaphore) for asn in uncached]
+        tasks = [fetch_one(session, asn, semaphore, sources=sources, history=history, hedge=hedge, stats=hedge_stats)
+                 for asn in uncached]
         results = await asyncio.gather(*tasks, return_exceptions=True)
+    if uncached:
+        history.save()
+        print(f"🪁 Hedged {hedge_stats.get('hedges', 0)}/{len(uncached)} ASNs, "
+              f"alternate won {hedge_stats.get('hedge_wins', 0)}, cancelled {hedge_stats.get('cancelled', 0)}")
 
     for item in results:
         if isinstance(item, Exception):
@@ -234,17 +438,43 @@ async def fetch_all(asns: List[int], use_cache=True, concurrency=5):
     print(f"📊 Prefixes after split: {total_after}")
     
     save_cache(cache)
+    return cache
 
-    all_prefixes = []
-    for v in cache.values():
-        all_prefixes.extend(v)
-    
-    unique_count = len(set(all_prefixes))
-    print(f"📊 Total unique prefixes to return: {unique_count}")
-    
-    return sorted(set(all_prefixes))
+def build_prefix_set(announcements: Dict[str, List[str]]) -> Tuple[PrefixArray, Dict[str, Tuple[int, ...]]]:
+    """
+    前缀树去重：重叠的宣告拆为互不相交的叶子，并保留每个叶子的起源 ASN
+
+    Returns:
+        (按地址排序、互不相交的 PrefixArray, {cidr: (起源 ASN...)})
+    """
+    trie = build_prefix_trie(announcements)
+    prefixes, asn_sets = trie.leaf_array()
+    leaf_addresses = prefixes.total_addresses()
+    print(f"📊 Total disjoint prefixes to return: {len(prefixes)} "
+          f"(from {trie.inserted} announcements, {trie.input_addresses - leaf_addresses} overlapping addresses removed)")
+    metrics.set_gauge('prefix_overlap_addresses', trie.input_addresses - leaf_addresses)
+    metrics.set_gauge('prefix_array_bytes', prefixes.nbytes)
 
-def get_prefixes_sync(asns, use_cache=True, concurrency=5):
+    # 起源映射以字符串为键，与扫描结果中的 cidr 对应
+    return prefixes, {c: tuple(sorted(asns)) for c, asns in zip(prefixes.cidrs(), asn_sets)}
+
+async def fetch_all(asns: List[int], use_cache=True, concurrency=5, with_origins=False, hedge=True,
+                    sources: Optional[List[Dict]] = None):
+    """
+    并发获取多个 ASN 的前缀并去重（参数见 fetch_announcements）
+
+    Args:
+        with_origins: 为 True 时同时返回 {cidr: (起源 ASN...)}
+
+    Returns:
+        按地址排序、互不相交的 PrefixArray；with_origins 时为 (PrefixArray, 起源映射)
+    """
+    cache = await fetch_announcements(asns, use_cache=use_cache, concurrency=concurrency, hedge=hedge,
+                                      sources=sources)
+    prefixes, origins = build_prefix_set(cache)
+    return (prefixes, origins) if with_origins else prefixes
+
+def get_prefixes_sync(asns, use_cache=True, concurrency=5, with_origins=False, hedge=True):
     """
     同步方式获取前缀（内部使用异步）
     
@@ -252,5 +482,12 @@ def get_prefixes_sync(asns, use_cache=True, concurrency=5):
         asns: ASN 列表
         use_cache: 是否使用缓存
         concurrency: 并发数（默认 5）
+        with_origins: 同时返回每个前缀的起源 ASN（见 fetch_all）
+        hedge: 是否启用对冲请求
     """
-    return asyncio.run(fetch_all(asns, use_cache=use_cache, concurrency=concurrency))
+    return asyncio.run(fetch_all(asns, use_cache=use_cache, concurrency=concurrency, with_origins=with_origins,
+                                 hedge=hedge))
+
+def get_announcements_sync(asns, use_cache=True, concurrency=5, hedge=True) -> Dict[str, List[str]]:
+    """同步方式获取宣告前缀（见 fetch_announcements），去重由 build_prefix_set 单独完成"""
+    return asyncio.run(fetch_announcements(asns, use_cache=use_cache, concurrency=concurrency, hedge=hedge))
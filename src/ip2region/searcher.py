@@ -6,6 +6,8 @@
 # Author Leon<chenxin619315@gmail.com>
 
 import io
+import os
+import threading
 import ip2region.util as util
 from typing import Union
 
@@ -19,6 +21,8 @@ class Searcher(object):
         self.version = version
         self.__db_path = db_path
         self.__io_count = 0
+        self.__io_total = 0
+        self.__lock = threading.Lock()
         if c_buffer != None:
             self.__handle = None
             self.vector_index = None
@@ -34,6 +38,10 @@ class Searcher(object):
     def get_io_count(self):
         return self.__io_count
 
+    def get_io_total(self):
+        # cumulative file reads since creation (get_io_count is reset on every search)
+        return self.__io_total
+
     def search(self, ip: Union[bytes, str]):
         # check and parse the string ip
         ip_bytes = None
@@ -102,9 +110,14 @@ class Searcher(object):
             return self.c_buffer[offset:offset+length]
         
         # load the buffer from file
-        self.__handle.seek(offset)
+        # use pread where available so concurrent searches on one handle don't race on seek/read
         self.__io_count += 1
-        return self.__handle.read(length)
+        self.__io_total += 1
+        if hasattr(os, "pread"):
+            return os.pread(self.__handle.fileno(), length, offset)
+        with self.__lock:
+            self.__handle.seek(offset)
+            return self.__handle.read(length)
 
     def close(self):
         if self.__handle != None:
@@ -1,4 +1,8 @@
 import io
+import socket
+import struct
+import threading
+import time
 from pathlib import Path
 import sys
 
@@ -7,10 +11,47 @@ sys.path.insert(0, str(Path(__file__).parent / 'ip2region'))
 
 import util
 import searcher as xdb_searcher
+from metrics import metrics
+
+# 按地址顺序查询（扫描、细化）时每个线程缓存最近命中的 xdb 段数，相邻采样点大多落在同一段
+SEGMENT_CACHE_SIZE = 8
+# IPv4 segment index 条目: 起始IP u32 | 结束IP u32 | 区域长度 u16 | 区域偏移 u32（小端）
+_V4_INDEX = struct.Struct('<IIHI')
+
+
+def is_hebei_mobile_region(region):
+    """判断区域字符串是否属于河北移动
+    
+    支持多种数据库格式:
+    - 标准v3: 国家|省份|城市|ISP
+    - 增强版: |国家|省份|城市|区域|街道|ISP|经度|维度
+    - qqwry: 中国–省份|ISP
+    - n版本: 国家|省份||||ISP
+    """
+    if not region:
+        return False
+    
+    # 将整个字符串转为小写进行匹配，提高容错性
+    region_lower = region.lower()
+    
+    # 检查是否包含"河北"和"移动"关键字（在整个字符串中搜索）
+    has_hebei = '河北' in region
+    has_mobile = '移动' in region or 'mobile' in region_lower
+    
+    return has_hebei and has_mobile
 
 
 class IP2RegionClient:
-    def __init__(self, db_path):
+    """
+    ip2region xdb 查询客户端
+
+    每个线程保留最近命中的 segment_cache 个段 [起始IP, 结束IP] 及其区域（最近使用的在前），
+    落在缓存段内的 IPv4 地址只需几次整数比较，不再查 vector index 和二分查找。
+    默认关闭（segment_cache=0）：随机顺序的查询（查询服务、单个 IP 判断）几乎不命中，
+    每次额外的解析和缓存扫描反而更慢；只在按地址顺序查询的扫描 / 细化路径传入 SEGMENT_CACHE_SIZE
+    """
+
+    def __init__(self, db_path, segment_cache: int = 0):
         self.db_path = str(Path(db_path))
         
         # 打开xdb文件
@@ -27,44 +68,129 @@ class IP2RegionClient:
         v_index = util.load_vector_index(handle)
         handle.close()
         
-        # 创建searcher
+        # 创建searcher（段边界查询在本类中实现，复用同一 vector index，不修改上游 searcher.py）
+        self.v_index = v_index
         self.searcher = xdb_searcher.new_with_vector_index(self.version, self.db_path, v_index)
+        # 段缓存只用于 IPv4 字符串查询（IPv6 库的段通常很小，收益有限）
+        self.segment_cache = segment_cache if self.version.byte_num == 4 else 0
+        self._local = threading.local()
+
+    def _ip_bytes(self, ip) -> bytes:
+        if isinstance(ip, bytes):
+            return ip
+        if not isinstance(ip, str):
+            raise ValueError("invalid ip address `{}`".format(ip))
+        if self.version.byte_num != 4:
+            return util.parse_ip(ip)
+        try:
+            # inet_pton 只接受标准点分十进制，与 util.parse_ip 的校验一致
+            return socket.inet_pton(socket.AF_INET, ip)
+        except OSError:
+            raise ValueError("invalid ip address `{}`".format(ip))
+
+    def _search_segment(self, ip_bytes: bytes):
+        """
+        与 Searcher.search 相同的 vector index 定位 + segment index 二分查找，额外返回命中段的边界
+
+        Returns:
+            (区域, 段起始, 段结束)，段边界为整数（未命中任何段时为 None）
+        """
+        n = len(ip_bytes)
+        if n != self.version.byte_num:
+            raise ValueError("invalid ip address `{}` ({} expected)".format(
+                util.ip_to_string(ip_bytes), self.version.name))
+        idx = ip_bytes[0] * util.VectorIndexCols * util.VectorIndexSize + ip_bytes[1] * util.VectorIndexSize
+        s_ptr = util.le_get_uint32(self.v_index, idx)
+        e_ptr = util.le_get_uint32(self.v_index, idx + 4)
+        index_size = self.version.index_size
+        read = self.searcher.read
+        l, h = 0, (e_ptr - s_ptr) // index_size
+        if n == 4:
+            x = int.from_bytes(ip_bytes, 'big')
+            while l <= h:
+                m = (l + h) >> 1
+                sip, eip, d_len, d_ptr = _V4_INDEX.unpack(read(s_ptr + m * index_size, index_size))
+                if x < sip:
+                    h = m - 1
+                elif x > eip:
+                    l = m + 1
+                else:
+                    return (read(d_ptr, d_len).decode('utf-8') if d_len else ''), sip, eip
+            return '', None, None
+        compare = self.version.ip_sub_compare
+        while l <= h:
+            m = (l + h) >> 1
+            buff = read(s_ptr + m * index_size, index_size)
+            if compare(ip_bytes, buff, 0) < 0:
+                h = m - 1
+            elif compare(ip_bytes, buff, n) > 0:
+                l = m + 1
+            else:
+                d_len = util.le_get_uint16(buff, n << 1)
+                d_ptr = util.le_get_uint32(buff, (n << 1) + 2)
+                region = read(d_ptr, d_len).decode('utf-8') if d_len else ''
+                return region, int.from_bytes(buff[0:n], 'big'), int.from_bytes(buff[n:n << 1], 'big')
+        return '', None, None
+
+    def _segment(self, ip):
+        """先查本线程的段缓存，未命中时查询 xdb 并把命中的段放到缓存最前面；返回 (区域, 段起始, 段结束)"""
+        ip_bytes = self._ip_bytes(ip)
+        if len(ip_bytes) != 4:
+            return self._search_segment(ip_bytes)
+        n = int.from_bytes(ip_bytes, 'big')
+        segments = getattr(self._local, 'segments', None)
+        if segments is None:
+            segments = self._local.segments = []
+        for i, seg in enumerate(segments):
+            if seg[1] <= n <= seg[2]:
+                if i:
+                    segments.insert(0, segments.pop(i))
+                if metrics.enabled:
+                    metrics.incr('segment_cache_hits')
+                return seg
+        seg = self._search_segment(ip_bytes)
+        if seg[1] is not None:
+            segments.insert(0, seg)
+            del segments[self.segment_cache:]
+        return seg
+
+    def _search_cached(self, ip):
+        return self._segment(ip)[0]
+
+    def search_with_segment(self, ip):
+        """查询IP地址的区域信息及所在 xdb 段：(区域, 段起始, 段结束)，段边界为整数（未命中任何段时为 None）"""
+        if metrics.enabled:
+            metrics.incr('lookups')
+        if self.segment_cache:
+            return self._segment(ip)
+        return self._search_segment(self._ip_bytes(ip))
 
     def search(self, ip):
         """查询IP地址的区域信息"""
-        return self.searcher.search(ip)
+        lookup = self._search_cached if self.segment_cache else self.searcher.search
+        if not metrics.enabled:
+            return lookup(ip)
+        start = time.perf_counter()
+        region = lookup(ip)
+        metrics.observe('lookup_latency_us', (time.perf_counter() - start) * 1e6)
+        metrics.incr('lookups')
+        return region
     
     def lookup_region_str(self, ip):
         """查询IP地址的区域信息（兼容旧API）"""
         return self.search(ip)
     
     def is_hebei_mobile(self, ip):
-        """判断IP是否属于河北移动
-        
-        支持多种数据库格式:
-        - 标准v3: 国家|省份|城市|ISP
-        - 增强版: |国家|省份|城市|区域|街道|ISP|经度|维度
-        - qqwry: 中国–省份|ISP
-        - n版本: 国家|省份||||ISP
-        """
+        """判断IP是否属于河北移动（判断规则见 is_hebei_mobile_region）"""
         try:
-            region = self.search(ip)
-            if not region:
-                return False
-            
-            # 将整个字符串转为小写进行匹配，提高容错性
-            region_lower = region.lower()
-            full_text = region  # 保留原文用于检查
-            
-            # 检查是否包含"河北"和"移动"关键字（在整个字符串中搜索）
-            has_hebei = '河北' in full_text or '河北省' in full_text
-            has_mobile = '移动' in full_text or '中国移动' in full_text or 'mobile' in region_lower
-            
-            return has_hebei and has_mobile
-            
+            return is_hebei_mobile_region(self.search(ip))
         except Exception:
             return False
     
+    def io_reads(self):
+        """累计文件读取次数（buffer 模式下为 0）"""
+        return self.searcher.get_io_total()
+    
     def close(self):
         """关闭searcher"""
         if self.searcher:
@@ -1,20 +1,54 @@
-import requests
+#!/usr/bin/env python3
+"""
+ip2region 数据库下载
+
+- 并发探测所有镜像（1 字节 Range 请求），按响应时间选择最快的镜像，失败时依次换下一个
+- 支持 Range 的镜像用多个并行 Range 请求分块下载到 .part 文件，进度记录在 .part.json，
+  中断后再次运行只下载缺失的分块
+- 下载完成后校验大小、sha256（可选）和 xdb 结构，通过后原子替换正式文件
+- 已下载的文件在同名 .meta.json 中记录 ETag / Last-Modified / sha256，
+  远端未变化时跳过下载；网络不可用时继续使用校验通过的本地文件
+
+用法:
+    python src/ip2region_downloader.py                      # 缺失或远端有更新时下载
+    python src/ip2region_downloader.py --min-size 40000000  # 过滤过小的镜像（如官方免费版）
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+from ip2region import util
+from metrics import metrics
 
 URLS = [
     # ip2region_update 增强版 (n版) - 推荐使用
     # 数据更全面，识别率比官方免费版提升 23%
     "https://github.com/hel2o/ip2region_update/releases/download/250820/ip2region_n.xdb",
-    
+
     # CDN 镜像加速
     "https://ghproxy.net/https://github.com/hel2o/ip2region_update/releases/download/250820/ip2region_n.xdb",
     "https://gh-proxy.org/https://github.com/hel2o/ip2region_update/releases/download/250820/ip2region_n.xdb",
-    
+
     # 备用：官方免费版（数据不全，不推荐）
     "https://raw.githubusercontent.com/lionsoul2014/ip2region/master/data/ip2region_v4.xdb",
 ]
 
+# 每个 Range 分块大小与并行连接数
+CHUNK_SIZE = 4 * 1024 * 1024
+DOWNLOAD_WORKERS = 4
+PROBE_TIMEOUT = 10
+READ_TIMEOUT = 60
+CHUNK_RETRY = 3
+
 def get_db_path():
     """获取数据库文件的绝对路径"""
     from pathlib import Path
@@ -22,34 +56,304 @@ def get_db_path():
 
 DB_PATH = get_db_path()
 
-def http_download(url, file_path, retry=3):
-    for i in range(retry):
+
+def _sidecar(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name + suffix)
+
+
+def _read_json(path: Path) -> Optional[Dict]:
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: Path, data: Dict):
+    """先写临时文件再原子替换"""
+    tmp = _sidecar(path, '.tmp')
+    tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(path)
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def check_xdb(path) -> Optional[str]:
+    """
+    检查 xdb 文件结构完整性（util.verify + 版本 + 索引区未被截断）
+
+    Returns:
+        None 表示通过，否则为错误描述
+    """
+    try:
+        with io.open(str(path), 'rb') as handle:
+            util.verify(handle)
+            header = util.load_header(handle)
+            version = util.version_from_header(header)
+            if version is None:
+                return 'unknown xdb version'
+            size = os.fstat(handle.fileno()).st_size
+            if header.startIndexPtr > header.endIndexPtr or header.endIndexPtr + version.index_size > size:
+                return f'truncated xdb: index ends at {header.endIndexPtr + version.index_size}, file has {size} bytes'
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def probe_mirror(url: str, validators: Optional[Dict] = None) -> Dict:
+    """
+    用 1 字节 Range 请求探测镜像：响应时间、文件大小、是否支持 Range、ETag/Last-Modified
+
+    validators: 上次下载记录的 {'etag', 'last_modified'}，用于条件请求（304 表示未变化）
+    """
+    headers = {'Range': 'bytes=0-0'}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    result = {'url': url, 'ok': False}
+    start = time.perf_counter()
+    try:
+        with requests.get(url, headers=headers, timeout=PROBE_TIMEOUT, stream=True) as r:
+            result['latency'] = time.perf_counter() - start
+            result['status'] = r.status_code
+            result['etag'] = r.headers.get('ETag')
+            result['last_modified'] = r.headers.get('Last-Modified')
+            if r.status_code == 304:
+                result['ok'] = True
+                result['not_modified'] = True
+                return result
+            r.raise_for_status()
+            content_range = r.headers.get('Content-Range', '')
+            if r.status_code == 206 and '/' in content_range and not content_range.endswith('/*'):
+                result['size'] = int(content_range.rsplit('/', 1)[1])
+                result['ranges'] = True
+            else:
+                result['size'] = int(r.headers.get('Content-Length') or 0) or None
+                result['ranges'] = False
+            result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def probe_mirrors(urls: List[str], validators: Optional[Dict] = None) -> List[Dict]:
+    """并发探测所有镜像，可用的按响应时间排序在前，不可用的保持原顺序在后"""
+    with ThreadPoolExecutor(max_workers=len(urls) or 1) as ex:
+        probes = list(ex.map(lambda u: probe_mirror(u, validators.get(u) if validators else None), urls))
+    ok = sorted((p for p in probes if p['ok']), key=lambda p: p['latency'])
+    return ok + [p for p in probes if not p['ok']]
+
+
+def _fetch_range(url: str, part_path: Path, start: int, end: int) -> int:
+    """下载 [start, end] 字节写入 part 文件对应位置，返回字节数"""
+    last_error = None
+    for attempt in range(CHUNK_RETRY):
         try:
-            print(f"Downloading: {url} (attempt {i+1}/{retry})")
-            with requests.get(url, timeout=30, stream=True) as r:
-                r.raise_for_status()
-                with open(file_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-            return True
+            with requests.get(url, headers={'Range': f'bytes={start}-{end}'},
+                              timeout=(PROBE_TIMEOUT, READ_TIMEOUT), stream=True) as r:
+                if r.status_code != 206:
+                    raise RuntimeError(f'expected 206 for range {start}-{end}, got {r.status_code}')
+                written = 0
+                with open(part_path, 'r+b') as f:
+                    f.seek(start)
+                    for data in r.iter_content(chunk_size=256 * 1024):
+                        f.write(data)
+                        written += len(data)
+            if written != end - start + 1:
+                raise RuntimeError(f'short read for range {start}-{end}: {written} bytes')
+            return written
         except Exception as e:
-            print(f"[WARN] failed: {e}")
-            time.sleep(1)
-    return False
+            last_error = e
+            metrics.incr('download_retries')
+            time.sleep(0.5 * (attempt + 1))
+    raise RuntimeError(f'range {start}-{end} failed: {last_error}')
+
+
+def download_ranged(url: str, part_path: Path, size: int, etag: Optional[str] = None,
+                    workers: int = DOWNLOAD_WORKERS, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    并行 Range 分块下载，已完成的分块记录在 <part>.json，可断点续传
+
+    Returns:
+        本次实际下载的字节数
+    """
+    state_path = _sidecar(part_path, '.json')
+    chunks = [(i, i * chunk_size, min(size, (i + 1) * chunk_size) - 1)
+              for i in range((size + chunk_size - 1) // chunk_size)]
+
+    state = _read_json(state_path)
+    done = set()
+    if (state and part_path.exists() and part_path.stat().st_size == size
+            and state.get('size') == size and state.get('chunk_size') == chunk_size
+            and state.get('etag') == etag):
+        done = set(state.get('done', []))
+        if done:
+            print(f"↻ 断点续传: 已完成 {len(done)}/{len(chunks)} 个分块")
+    else:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+    state = {'url': url, 'size': size, 'etag': etag, 'chunk_size': chunk_size, 'done': sorted(done)}
+    _write_json(state_path, state)
+
+    lock = threading.Lock()
+    fetched = 0
+    pending = [c for c in chunks if c[0] not in done]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(_fetch_range, url, part_path, start, end): i for i, start, end in pending}
+        for fut in as_completed(futures):
+            n = fut.result()
+            with lock:
+                fetched += n
+                done.add(futures[fut])
+                state['done'] = sorted(done)
+                _write_json(state_path, state)
+            metrics.incr('download_bytes', n)
+    return fetched
+
+
+def download_stream(url: str, part_path: Path) -> int:
+    """镜像不支持 Range 时单连接下载到 part 文件"""
+    written = 0
+    with requests.get(url, timeout=(PROBE_TIMEOUT, READ_TIMEOUT), stream=True) as r:
+        r.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for data in r.iter_content(chunk_size=256 * 1024):
+                f.write(data)
+                written += len(data)
+    metrics.incr('download_bytes', written)
+    return written
+
 
+def download_xdb(db_path=None, urls: Optional[List[str]] = None, workers: int = DOWNLOAD_WORKERS,
+                 min_size: int = 0, expected_sha256: Optional[str] = None, force: bool = False) -> Path:
+    """
+    确保本地 xdb 可用且为最新
 
-def download_xdb():
-    p = Path(DB_PATH)
+    Args:
+        db_path: 目标路径（默认 data/ip2region_v4.xdb）
+        urls: 镜像列表（默认 URLS）
+        workers: 并行 Range 连接数
+        min_size: 小于该字节数的镜像文件视为不合格（跳过）
+        expected_sha256: 期望的 sha256，提供时强制校验
+        force: 忽略本地文件和 ETag，强制重新下载
+    """
+    p = Path(db_path or DB_PATH)
+    urls = urls or URLS
     p.parent.mkdir(parents=True, exist_ok=True)
+    meta_path = _sidecar(p, '.meta.json')
+    part_path = _sidecar(p, '.part')
+    meta = _read_json(meta_path) or {}
 
-    if p.exists() and p.stat().st_size > 0:
-        print("ip2region_v4.xdb already exists, skip download.")
-        return
+    # 本地文件：结构完整才算存在（半截文件不再被当作"已存在"）
+    local_ok = p.exists() and not force and check_xdb(p) is None
+    if local_ok and expected_sha256 and meta.get('sha256') != expected_sha256:
+        local_ok = file_sha256(p) == expected_sha256
+    if local_ok and not meta.get('url'):
+        # 手动放置的文件，没有可比较的远端信息
+        print(f"{p.name} already exists, skip download.")
+        return p
+    if p.exists() and not local_ok and not force:
+        print(f"⚠ 本地 {p.name} 校验未通过，重新下载")
 
-    for url in URLS:
-        if http_download(url, DB_PATH):
-            print(f"[OK] downloaded from {url}")
-            return
+    validators = None
+    if local_ok:
+        validators = {meta['url']: {'etag': meta.get('etag'), 'last_modified': meta.get('last_modified')}}
+    probes = probe_mirrors(urls, validators)
 
+    if local_ok:
+        for probe in probes:
+            if probe['url'] != meta['url'] or not probe['ok']:
+                continue
+            unchanged = probe.get('not_modified') or (
+                probe.get('size') == meta.get('size') and (
+                    (probe.get('etag') and probe['etag'] == meta.get('etag')) or
+                    (probe.get('last_modified') and probe['last_modified'] == meta.get('last_modified'))))
+            if unchanged:
+                print(f"✓ {p.name} 未变化 (ETag/Last-Modified)，跳过下载")
+                return p
+        if not any(probe['ok'] for probe in probes if probe['url'] == meta['url']):
+            # 无法确认上次下载源是否更新（不同镜像的 ETag 不可比较），保留本地文件
+            print(f"⚠ 无法访问上次的下载源，继续使用本地 {p.name}")
+            return p
+
+    for probe in probes:
+        url = probe['url']
+        if not probe['ok']:
+            print(f"[WARN] probe failed: {url}: {probe.get('error')}")
+            continue
+        size = probe.get('size')
+        if min_size and size and size < min_size:
+            print(f"[WARN] skip {url}: {size} bytes < {min_size}")
+            continue
+        print(f"Downloading: {url} ({probe['latency'] * 1000:.0f} ms"
+              f"{', ' + format(size / 1024 / 1024, '.1f') + ' MB' if size else ''}"
+              f"{', ranged x' + str(workers) if probe.get('ranges') else ''})")
+        start = time.perf_counter()
+        try:
+            if probe.get('ranges') and size:
+                fetched = download_ranged(url, part_path, size, probe.get('etag'), workers)
+            else:
+                fetched = download_stream(url, part_path)
+        except Exception as e:
+            print(f"[WARN] failed: {e}")
+            continue
+
+        # 校验: 大小 -> sha256 -> xdb 结构，任何一项失败都丢弃 part 换下一个镜像
+        actual_size = part_path.stat().st_size
+        digest = file_sha256(part_path)
+        error = None
+        if size and actual_size != size:
+            error = f'size mismatch: {actual_size} != {size}'
+        elif min_size and actual_size < min_size:
+            error = f'file too small: {actual_size} < {min_size}'
+        elif expected_sha256 and digest != expected_sha256:
+            error = f'sha256 mismatch: {digest}'
+        else:
+            error = check_xdb(part_path)
+        if error:
+            print(f"[WARN] verification failed for {url}: {error}")
+            part_path.unlink(missing_ok=True)
+            _sidecar(part_path, '.json').unlink(missing_ok=True)
+            continue
+
+        part_path.replace(p)
+        _sidecar(part_path, '.json').unlink(missing_ok=True)
+        _write_json(meta_path, {
+            'url': url,
+            'size': actual_size,
+            'sha256': digest,
+            'etag': probe.get('etag'),
+            'last_modified': probe.get('last_modified'),
+            'downloaded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        elapsed = time.perf_counter() - start
+        print(f"[OK] downloaded from {url} ({fetched / 1024 / 1024:.1f} MB in {elapsed:.1f}s, sha256 {digest[:12]})")
+        return p
+
+    if local_ok:
+        print(f"⚠ 所有镜像下载失败，继续使用本地 {p.name}")
+        return p
     raise RuntimeError("❌ All download URLs failed! Please check network.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载并校验 ip2region xdb 数据库')
+    parser.add_argument('--output', default=str(DB_PATH))
+    parser.add_argument('--url', action='append', default=None, help='镜像地址（可多次指定，默认内置列表）')
+    parser.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS, help='并行 Range 连接数')
+    parser.add_argument('--min-size', type=int, default=0, help='小于该字节数的文件视为不合格')
+    parser.add_argument('--sha256', default=None, help='期望的 sha256')
+    parser.add_argument('--force', action='store_true', help='强制重新下载')
+    args = parser.parse_args()
+    download_xdb(args.output, args.url, args.workers, args.min_size, args.sha256, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+ip2region + 纯真 预合并区间表
+
+构建时用扫描线同时遍历两个数据库的全部区间，在每个基本区间（两库边界切分后的最小区间）上
+执行一次 multi_source_client.choose_best_result 选择策略，合并相邻的相同结果后写出单一区间表，
+每个区间带来源标签。扫描时每个 IP 只需在该表上做一次二分查找，不再需要两次查询；
+两库的分歧统计在构建时顺带得出。
+
+表文件按两个源文件的 sha256 缓存（data/joined/<key>.bin），源文件不变时直接复用。
+
+文件格式（全部大端）:
+    header (52 字节): magic 'HBJT' | version u16 | reserved u16 | count u32 | region_count u32
+                      | created_at u32 | key 32 字节 (ASCII)
+    ranges: count 个 (start u32, end u32, value u32)，value = region_id << 8 | source_id
+    region 表: region_count 个 (offset u32, length u32)，偏移相对于字符串区起点
+    字符串区: UTF-8
+
+用法:
+    python src/joined_table.py --xdb data/ip2region_v4.xdb --qqwry data/qqwry.dat
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import socket
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from membership import _BEUint32View
+from metrics import metrics
+from multi_source_client import SOURCE_METRIC_NAMES, choose_best_result
+from qqwry_client import QQWryClient
+from region_targets import normalize_province, parse_region
+from xdb_maker import iter_segments
+
+try:
+    import numpy as np
+except ImportError:  # numpy 可选，缺失时退化为 bisect
+    np = None
+
+MAGIC = b'HBJT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>4sHHIII32s')
+HEADER_SIZE = HEADER.size
+RANGE = struct.Struct('>III')
+RANGE_SIZE = RANGE.size
+# source_id -> 来源标签（0 表示两库均无数据）
+SOURCES: List[Optional[str]] = [None, 'ip2region', 'qqwry_补充', 'ip2region_incomplete', 'qqwry_fallback']
+SOURCE_IDS = {s: i for i, s in enumerate(SOURCES)}
+# 分歧统计中保留的 (ip2region 省份, 纯真结果) 组合数
+TOP_DISAGREEMENTS = 20
+
+Range = Tuple[int, int, str]
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def table_key(xdb_path, qqwry_path) -> str:
+    """由两个源文件内容决定的缓存键（32 位十六进制）"""
+    combined = f'{file_sha256(xdb_path)}:{file_sha256(qqwry_path)}:{FORMAT_VERSION}'
+    return hashlib.sha256(combined.encode('ascii')).hexdigest()[:32]
+
+
+def sweep_join(primary: Iterator[Range], secondary: Iterator[Range]
+               ) -> Iterator[Tuple[int, int, Optional[str], Optional[str]]]:
+    """
+    扫描线合并两组有序、各自互不相交的区间
+
+    Yields:
+        (start, end, primary 区域或 None, secondary 区域或 None)，两者都不覆盖的空洞不输出
+    """
+    a = next(primary, None)
+    b = next(secondary, None)
+    pos = 0
+    while True:
+        while a is not None and a[1] < pos:
+            a = next(primary, None)
+        while b is not None and b[1] < pos:
+            b = next(secondary, None)
+        if a is None and b is None:
+            return
+
+        a_in = a is not None and a[0] <= pos
+        b_in = b is not None and b[0] <= pos
+        if not a_in and not b_in:
+            pos = min(x[0] for x in (a, b) if x is not None)
+            continue
+
+        # 基本区间在任一区间的结束或另一区间的开始处截断
+        end = 0xFFFFFFFF
+        for x, inside in ((a, a_in), (b, b_in)):
+            if x is not None:
+                end = min(end, x[1] if inside else x[0] - 1)
+        yield pos, end, a[2] if a_in else None, b[2] if b_in else None
+        if end >= 0xFFFFFFFF:
+            return
+        pos = end + 1
+
+
+class _DisagreementStats:
+    """两库都有数据的基本区间上，按地址数加权统计省份 / ISP 是否一致"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.pairs: Dict[Tuple[str, str], int] = {}
+        self._fields: Dict[str, Tuple[str, str, str, str]] = {}
+
+    def _add(self, key: str, n: int):
+        self.counts[key] = self.counts.get(key, 0) + n
+
+    def add(self, start: int, end: int, ip2region: Optional[str], qqwry: Optional[str]):
+        n = end - start + 1
+        if not ip2region or not qqwry:
+            self._add('ip2region_only' if ip2region else 'qqwry_only', n)
+            return
+        self._add('both', n)
+        fields = self._fields.get(ip2region)
+        if fields is None:
+            fields = self._fields[ip2region] = parse_region(ip2region)
+        province = normalize_province(fields[1])
+        isp = fields[3]
+        if not province:
+            self._add('ip2region_province_missing', n)
+        elif province in qqwry:
+            self._add('province_agree', n)
+        else:
+            self._add('province_disagree', n)
+            pair = (province, qqwry)
+            self.pairs[pair] = self.pairs.get(pair, 0) + n
+        if isp:
+            self._add('isp_agree' if isp in qqwry else 'isp_disagree', n)
+
+    def to_dict(self) -> Dict:
+        top = sorted(self.pairs.items(), key=lambda x: -x[1])[:TOP_DISAGREEMENTS]
+        return {
+            'addresses': dict(sorted(self.counts.items())),
+            'top_province_disagreements': [
+                {'ip2region': p, 'qqwry': q, 'addresses': n} for (p, q), n in top
+            ],
+        }
+
+
+def build_table(xdb_path, qqwry_path) -> Tuple[List[Tuple[int, int, str, Optional[str]]], Dict]:
+    """
+    合并两库并应用选择策略
+
+    Returns:
+        (合并后的区间列表 [(start, end, 最终区域, 来源标签)], 统计信息)
+    """
+    qqwry = QQWryClient(qqwry_path)
+    if not qqwry.db:
+        raise ValueError(f"failed to load qqwry database: {qqwry_path}")
+
+    decisions: Dict[Tuple[Optional[str], Optional[str]], Tuple[str, Optional[str]]] = {}
+    disagreement = _DisagreementStats()
+    source_addresses: Dict[str, int] = {}
+    elementary = 0
+    ranges: List[Tuple[int, int, str, Optional[str]]] = []
+    try:
+        for start, end, a, q in sweep_join(iter_segments(xdb_path), qqwry.iter_ranges()):
+            elementary += 1
+            a = a or None
+            q = q or None
+            disagreement.add(start, end, a, q)
+            decision = decisions.get((a, q))
+            if decision is None:
+                final, source = choose_best_result(a, q)
+                decision = decisions[(a, q)] = (final or '', source)
+            final, source = decision
+            label = source or 'none'
+            source_addresses[label] = source_addresses.get(label, 0) + end - start + 1
+            if ranges and ranges[-1][1] + 1 == start and ranges[-1][2:] == decision:
+                ranges[-1] = (ranges[-1][0], end, final, source)
+            else:
+                ranges.append((start, end, final, source))
+    finally:
+        qqwry.close()
+
+    stats = {
+        'elementary_intervals': elementary,
+        'ranges': len(ranges),
+        'source_addresses': dict(sorted(source_addresses.items(), key=lambda x: -x[1])),
+        'disagreement': disagreement.to_dict(),
+    }
+    return ranges, stats
+
+
+def write_table(path, ranges: List[Tuple[int, int, str, Optional[str]]], key: str = '') -> Path:
+    """写出区间表（先写临时文件再原子替换）"""
+    region_ids: Dict[str, int] = {}
+    blobs: List[bytes] = []
+    body = bytearray(len(ranges) * RANGE_SIZE)
+    for i, (start, end, region, source) in enumerate(ranges):
+        rid = region_ids.get(region)
+        if rid is None:
+            rid = region_ids[region] = len(blobs)
+            blobs.append(region.encode('utf-8'))
+        RANGE.pack_into(body, i * RANGE_SIZE, start, end, (rid << 8) | SOURCE_IDS[source])
+
+    region_index = bytearray(len(blobs) * 8)
+    offset = 0
+    for i, raw in enumerate(blobs):
+        struct.pack_into('>II', region_index, i * 8, offset, len(raw))
+        offset += len(raw)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(ranges), len(blobs), int(time.time()),
+                            key.encode('ascii').ljust(32, b'\x00')))
+        f.write(body)
+        f.write(region_index)
+        f.write(b''.join(blobs))
+    tmp.replace(path)
+    return path
+
+
+def ensure_joined_table(xdb_path, qqwry_path, cache_dir=None, force: bool = False) -> Path:
+    """
+    返回与两个源文件对应的区间表路径，缓存不存在（或 force）时构建
+
+    统计信息写在同名 .json 中
+    """
+    if cache_dir is None:
+        cache_dir = Path(__file__).parent.parent / 'data' / 'joined'
+    cache_dir = Path(cache_dir)
+    key = table_key(xdb_path, qqwry_path)
+    path = cache_dir / f'{key}.bin'
+    if path.exists() and not force:
+        print(f"✓ 使用已缓存的合并区间表: {path}")
+        return path
+
+    print("🔄 构建 ip2region + 纯真 合并区间表...")
+    start = time.perf_counter()
+    ranges, stats = build_table(xdb_path, qqwry_path)
+    stats['key'] = key
+    stats['build_seconds'] = round(time.perf_counter() - start, 3)
+    write_table(path, ranges, key)
+    stats_path = path.with_suffix('.json')
+    stats_path.write_text(json.dumps(stats, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"✓ 合并区间表: {stats['elementary_intervals']} 个基本区间 -> {stats['ranges']} 个区间 "
+          f"({stats['build_seconds']}s)")
+    return path
+
+
+def _ip_to_int(ip: Union[str, bytes, int]) -> int:
+    if isinstance(ip, int):
+        return ip
+    if isinstance(ip, bytes):
+        return int.from_bytes(ip, 'big')
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+
+class JoinedTableClient:
+    """
+    合并区间表查询客户端（mmap，单次二分查找）
+
+    实现了扫描器所需的 lookup_region_str / lookup_many 接口，并与 MultiSourceIPClient
+    一样累计各来源命中数
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count, region_count, created_at, key = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"invalid joined table `{self.path}`")
+        if version != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"unsupported joined table version {version}")
+
+        self.count = count
+        self.created_at = created_at
+        self.key = key.rstrip(b'\x00').decode('ascii')
+        self.starts = _BEUint32View(self._mm, HEADER_SIZE, count, RANGE_SIZE)
+        self._region_index = HEADER_SIZE + count * RANGE_SIZE
+        self._blob_base = self._region_index + region_count * 8
+        self._regions: List[Optional[str]] = [None] * region_count
+
+        self._np_ranges = None
+        if np is not None:
+            # 零拷贝视图: 每行 (start, end, value)
+            self._np_ranges = np.frombuffer(self._mm, dtype='>u4', count=count * 3,
+                                            offset=HEADER_SIZE).reshape(count, 3)
+            # 单 IP 查询的 bisect 走本地字节序的 array，比逐项 unpack 的视图快数倍
+            self.starts = array('I', self._np_ranges[:, 0].astype(np.uint32).tobytes())
+
+        self._lock = threading.Lock()
+        self.source_counts: Dict[str, int] = {}
+
+    def __len__(self):
+        return self.count
+
+    def _region(self, rid: int) -> str:
+        region = self._regions[rid]
+        if region is None:
+            offset, length = struct.unpack_from('>II', self._mm, self._region_index + rid * 8)
+            start = self._blob_base + offset
+            region = self._regions[rid] = self._mm[start:start + length].decode('utf-8')
+        return region
+
+    def _locate(self, x: int) -> Tuple[Optional[str], Optional[str]]:
+        i = bisect_right(self.starts, x) - 1
+        if i < 0:
+            return None, None
+        _, end, value = RANGE.unpack_from(self._mm, HEADER_SIZE + i * RANGE_SIZE)
+        if x > end:
+            return None, None
+        return self._region(value >> 8) or None, SOURCES[value & 0xFF]
+
+    def lookup(self, ip) -> Tuple[Optional[str], Optional[str]]:
+        """
+        查询单个 IP
+
+        Returns:
+            (最终区域, 来源标签)，无数据时为 (None, None)
+        """
+        try:
+            x = _ip_to_int(ip)
+        except (OSError, TypeError):
+            return None, None
+        return self._locate(x)
+
+    def _record(self, sources: List[Optional[str]]):
+        with self._lock:
+            for source in sources:
+                key = source or 'none'
+                self.source_counts[key] = self.source_counts.get(key, 0) + 1
+        if metrics.enabled:
+            for source in sources:
+                metrics.incr(f"source_{SOURCE_METRIC_NAMES.get(source, 'none')}")
+
+    def lookup_region_str(self, ip) -> Optional[str]:
+        region, source = self.lookup(ip)
+        self._record([source])
+        return region
+
+    def search_with_segment(self, ip) -> Tuple[str, Optional[int], Optional[int]]:
+        """
+        查询单个 IP 及其所在区间（相邻的相同结果已在构建时合并）
+
+        Returns:
+            (区域, 区间起始, 区间结束)，不在任何区间内时为 ('', None, None)
+        """
+        x = _ip_to_int(ip)
+        i = bisect_right(self.starts, x) - 1
+        if i < 0:
+            self._record([None])
+            return '', None, None
+        start, end, value = RANGE.unpack_from(self._mm, HEADER_SIZE + i * RANGE_SIZE)
+        if x > end:
+            self._record([None])
+            return '', None, None
+        self._record([SOURCES[value & 0xFF]])
+        return self._region(value >> 8), start, end
+
+    def lookup_many(self, ips: List) -> List[Optional[str]]:
+        """批量查询（有 numpy 时用 searchsorted 向量化定位）"""
+        if self._np_ranges is None or not self.count:
+            pairs = [self.lookup(ip) for ip in ips]
+        else:
+            values = np.zeros(len(ips), dtype=np.uint32)
+            valid = np.ones(len(ips), dtype=bool)
+            for k, ip in enumerate(ips):
+                try:
+                    values[k] = _ip_to_int(ip)
+                except (OSError, TypeError):
+                    valid[k] = False
+            idx = np.searchsorted(self._np_ranges[:, 0], values, side='right') - 1
+            rows = self._np_ranges[np.maximum(idx, 0)]
+            found = valid & (idx >= 0) & (values <= rows[:, 1])
+            pairs = []
+            for ok, value in zip(found.tolist(), rows[:, 2].tolist()):
+                if ok:
+                    pairs.append((self._region(value >> 8) or None, SOURCES[value & 0xFF]))
+                else:
+                    pairs.append((None, None))
+        self._record([source for _, source in pairs])
+        return [region for region, _ in pairs]
+
+    def iter_ranges(self) -> Iterator[Range]:
+        """按地址顺序遍历全部区间 (start, end, 区域)"""
+        for i in range(self.count):
+            start, end, value = RANGE.unpack_from(self._mm, HEADER_SIZE + i * RANGE_SIZE)
+            yield start, end, self._region(value >> 8)
+
+    def source_stats(self) -> Dict[str, int]:
+        """各来源命中数（来源标签 -> 次数）"""
+        with self._lock:
+            return dict(sorted(self.source_counts.items(), key=lambda x: -x[1]))
+
+    def io_reads(self) -> int:
+        """mmap 访问，无显式文件读取"""
+        return 0
+
+    def close(self):
+        self._np_ranges = None
+        self._mm.close()
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description='构建 ip2region + 纯真 合并区间表')
+    parser.add_argument('--xdb', default=str(project_root / 'data' / 'ip2region_v4.xdb'))
+    parser.add_argument('--qqwry', default=str(project_root / 'data' / 'qqwry.dat'))
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--force', action='store_true', help='忽略缓存重新构建')
+    args = parser.parse_args()
+
+    path = ensure_joined_table(args.xdb, args.qqwry, args.cache_dir, args.force)
+    stats = json.loads(path.with_suffix('.json').read_text(encoding='utf-8'))
+    print("\n来源（按地址数）:")
+    for source, n in stats['source_addresses'].items():
+        print(f"  {source:<22} {n:>12,}")
+    print("\n两库分歧（按地址数）:")
+    for key, n in stats['disagreement']['addresses'].items():
+        print(f"  {key:<28} {n:>12,}")
+
+
+if __name__ == '__main__':
+    main()
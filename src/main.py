@@ -1,36 +1,81 @@
 #!/usr/bin/env python3
 import argparse
+import sys
+import time
 from asn_loader import load_asns_from_file
-from fetch_prefixes_async import get_prefixes_sync
-from ip2region_downloader import download_xdb
-from ip2region_client import IP2RegionClient
-from scanner_advanced import scan_prefixes_concurrent
-from cidr_merger import merge_cidrs, summarize_cidrs
+from fetch_prefixes_async import build_prefix_set, get_announcements_sync
+from ip2region_downloader import download_xdb, file_sha256
+from ip2region_client import SEGMENT_CACHE_SIZE, IP2RegionClient
+from multi_source_client import MultiSourceIPClient
+from joined_table import JoinedTableClient, ensure_joined_table
+from scanner_advanced import scan_prefixes_concurrent, sort_results
+from checkpoint import Checkpoint, build_manifest, stop_on_signals
+from anytime_scan import AnytimeScanner
+from refine import DEFAULT_MIN_PREFIXLEN, refine_prefixes, refined_origins
+from cidr_merger import cidr_sort_key, cidrs_to_intervals, merge_cidrs, merge_cidrs_budget, summarize_cidrs
+from delta import load_cidr_file, write_delta
+from metrics import metrics
+from membership import write_membership
+from region_targets import RegionTable, classify_targets, normalize_province, save_target_results
+from result_io import write_result_file
+from pipeline_cache import (StageCache, announcements_digest, load_output_hashes, load_prefix_set, load_scan,
+                            results_digest, digest, save_output_hashes, save_prefix_set, save_scan)
+from sharding import WEIGHTS, parse_shard, partition, prefixes_hash, shard_path
+from slash24_set import Slash24Set, load_set
 from pathlib import Path
 import json, csv
 
-def summarize_by_province(prefixes, ip2):
+def summarize_by_province(results, region_table):
+    """按省份统计阳性网段数（直接复用扫描时记录的区域 ID，无需二次查询）
+
+    每个网段归属于其采样点中出现次数最多的省份
+    """
     stats = {}
-    for cidr in prefixes:
-        try:
-            net = __import__('ipaddress').ip_network(cidr)
-            ip = str(net.network_address)
-            region = ip2.lookup_region_str(ip) or ''
-            parts = region.split('|')
-            prov = parts[1] if len(parts) > 1 else '未知'
-            prov = prov.replace('省','').replace('市','')
-            stats[prov] = stats.get(prov, 0) + 1
-        except Exception:
-            stats['未知'] = stats.get('未知', 0) + 1
+    for r in results:
+        counts = {}
+        for rid in r.get('region_ids') or []:
+            prov = normalize_province(region_table.fields(rid)[1])
+            counts[prov] = counts.get(prov, 0) + 1
+        prov = max(counts, key=counts.get) if counts else '未知'
+        stats[prov] = stats.get(prov, 0) + 1
     return stats
 
+def summarize_by_asn(results, origins):
+    """
+    按起源 ASN 统计扫描结果（一个叶子网段被多个 ASN 宣告时计入每个 ASN）
+
+    Returns:
+        {asn: {'prefixes', 'addresses', 'high', 'medium', 'none', 'positive_addresses'}}，按阳性地址数降序
+    """
+    stats = {}
+    for r in results:
+        size = 1 << (32 - int(r['cidr'].rsplit('/', 1)[1]))
+        for asn in origins.get(r['cidr'], ()):
+            s = stats.get(asn)
+            if s is None:
+                s = stats[asn] = {'prefixes': 0, 'addresses': 0, 'high': 0, 'medium': 0, 'none': 0,
+                                  'positive_addresses': 0}
+            s['prefixes'] += 1
+            s['addresses'] += size
+            s[r['status']] += 1
+            if r['status'] != 'none':
+                s['positive_addresses'] += size
+    return {f'AS{asn}': s for asn, s in sorted(stats.items(), key=lambda x: (-x[1]['positive_addresses'], x[0]))}
+
+def save_asn_stats(asn_stats, out_dir=None):
+    if out_dir is None:
+        out_dir = Path(__file__).parent.parent / 'output'
+    path = out_dir / 'hebei_cmcc_asn_stats.json'
+    path.write_text(json.dumps(asn_stats, indent=2, ensure_ascii=False), encoding='utf-8')
+    return path
+
 def generate_stats_markdown(stats: dict):
     lines = ['| 省份 | 命中 IP 段数 |', '|------|------------:|']
-    for p, count in sorted(stats.items(), key=lambda x: -x[1]):
+    for p, count in sorted(stats.items(), key=lambda x: (-x[1], x[0])):
         lines.append(f'| {p} | {count} |')
     return '\n'.join(lines)
 
-def save_results(results, out_dir=None, enable_merge=True):
+def save_results(results, out_dir=None, enable_merge=True, budget=None, enable_delta=True):
     if out_dir is None:
         # 获取项目根目录（src的父目录）
         out_dir = Path(__file__).parent.parent / 'output'
@@ -39,10 +84,23 @@ def save_results(results, out_dir=None, enable_merge=True):
     txt_merged_path = out_dir / 'hebei_cmcc_cidr_merged.txt'
     csv_path = out_dir / 'hebei_cmcc_cidr.csv'
     json_path = out_dir / 'hebei_cmcc_cidr.json'
+    bin_path = out_dir / 'hebei_cmcc_cidr.bin'
+    budget_path = out_dir / 'hebei_cmcc_cidr_budget.txt'
+    overcover_path = out_dir / 'hebei_cmcc_cidr_budget_overcover.txt'
+    tentative_path = out_dir / 'hebei_cmcc_cidr_tentative.txt'
+
+    # 限时扫描中尚未完成全部采样的网段（complete=False）只是初步结论：
+    # 不写入 txt / 合并 / bin / 预算文件，阳性的单独列入 tentative 文件
+    confirmed = [r for r in results if r.get('complete', True)]
+    tentative = sorted((r['cidr'] for r in results if r['status'] != 'none' and not r.get('complete', True)),
+                       key=cidr_sort_key)
+
+    # txt: include high + medium（按地址数值排序）
+    lines = sorted((r['cidr'] for r in confirmed if r['status'] != 'none'), key=cidr_sort_key)
+
+    # 覆盖写入前读取上一次的结果，用于增量输出
+    previous_lines = load_cidr_file(txt_path) if enable_delta else []
 
-    # txt: include high + medium
-    lines = [r['cidr'] for r in results if r['status'] != 'none']
-    
     # 保存原始未合并结果
     txt_path.write_text('\n'.join(lines), encoding='utf-8')
     
@@ -58,25 +116,64 @@ def save_results(results, out_dir=None, enable_merge=True):
     else:
         merged_lines = lines
 
+    # 增量输出：与上一次结果的差异（线性扫描）
+    delta_paths = write_delta(previous_lines, lines, out_dir) if enable_delta else ()
+
+    # 二进制成员判断文件（mmap 加载，见 membership.py）
+    write_membership(cidrs_to_intervals(lines), bin_path)
+
+    # 预算合并：在条目数/超额覆盖约束下聚合（用于路由表、防火墙集合）
+    if budget and lines:
+        budget_lines, report = merge_cidrs_budget(confirmed, **budget)
+        budget_path.write_text('\n'.join(budget_lines), encoding='utf-8')
+        overcover = [f'{c}\tnone' for c in report['none_overcovered']]
+        overcover += [f'{c}\tunscanned' for c in report['unscanned_overcovered']]
+        overcover_path.write_text('\n'.join(overcover), encoding='utf-8')
+        print(f"预算合并: {len(lines)} -> {report['entries']} 条, 超额覆盖 {report['overshoot']} 个地址 "
+              f"(none: {report['none_addresses']}, unscanned: {report['unscanned_addresses']})")
+        print(f"预算合并文件: {budget_path}")
+
+    if tentative:
+        tentative_path.write_text('\n'.join(tentative), encoding='utf-8')
+        print(f"未完成全部采样的阳性网段 {len(tentative)} 个，未写入结果列表: {tentative_path}")
+    elif tentative_path.exists():
+        tentative_path.unlink()
+
     # csv: detailed
+    # 限时扫描的结果带 confidence / complete 列
+    with_confidence = any('confidence' in r for r in results)
     with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=['cidr','status','hits','samples','sampled_ips'])
+        fieldnames = (['cidr','status','hits','samples','sampled_ips']
+                      + (['confidence', 'complete'] if with_confidence else []))
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         for r in results:
-            writer.writerow({
+            row = {
                 'cidr': r['cidr'],
                 'status': r['status'],
                 'hits': r['hits'],
                 'samples': r['samples'],
                 'sampled_ips': '|'.join(r['sampled'])
-            })
+            }
+            if with_confidence:
+                row['confidence'] = r.get('confidence', '')
+                row['complete'] = int(r.get('complete', True))
+            writer.writerow(row)
     # json
-    json_path.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+    json_results = [{k: v for k, v in r.items() if k != 'region_ids'} for r in results]
+    json_path.write_text(json.dumps(json_results, indent=2, ensure_ascii=False), encoding='utf-8')
     
+    paths = [txt_path]
     if enable_merge and lines:
-        return txt_path, txt_merged_path, csv_path, json_path
-    else:
-        return txt_path, csv_path, json_path
+        paths.append(txt_merged_path)
+    paths.append(bin_path)
+    paths.extend(delta_paths)
+    if budget and lines:
+        paths.extend([budget_path, overcover_path])
+    if tentative:
+        paths.append(tentative_path)
+    paths.extend([csv_path, json_path])
+    return tuple(paths)
 
 def update_readme_with_stats(readme_path: Path, stats_md: str):
     # 如果readme_path是相对路径，转为项目根目录下的绝对路径
@@ -97,14 +194,77 @@ def update_readme_with_stats(readme_path: Path, stats_md: str):
     readme_path.write_text(content, encoding='utf-8')
 
 def main():
+    # 子命令：python src/main.py serve ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from query_server import main as serve_main
+        return serve_main(sys.argv[2:])
+    # 子命令：python src/main.py daemon ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'daemon':
+        from daemon import main as daemon_main
+        return daemon_main(sys.argv[2:])
+    # 子命令：python src/main.py combine output/shards/*.jsonl
+    if len(sys.argv) > 1 and sys.argv[1] == 'combine':
+        from sharding import combine_main
+        return combine_main(sys.argv[2:])
+    # 子命令：python src/main.py lookup ips.txt > ips.tsv
+    if len(sys.argv) > 1 and sys.argv[1] == 'lookup':
+        from bulk_lookup import main as lookup_main
+        return lookup_main(sys.argv[2:])
+
     parser = argparse.ArgumentParser(description='Scan CMCC prefixes and filter Hebei Mobile')
     parser.add_argument('--cmcc', default='data/cmcc.txt')
     parser.add_argument('--sample', type=int, default=3)
     parser.add_argument('--use-cache', action='store_true')
     parser.add_argument('--fetch-concurrency', type=int, default=20)
+    parser.add_argument('--no-hedge', action='store_true', help='禁用前缀获取的对冲请求（慢请求不向备用来源重复请求）')
     parser.add_argument('--scan-workers', type=int, default=24)
     parser.add_argument('--no-merge', action='store_true', help='禁用CIDR合并功能')
+    parser.add_argument('--no-delta', action='store_true', help='不输出与上一次结果的增量文件')
+    parser.add_argument('--multi-target', action='store_true', help='同时输出各(省份, ISP)及河北各地市的CIDR列表')
+    parser.add_argument('--qqwry', nargs='?', const='data/qqwry.dat', default=None,
+                        help='启用纯真 IP 补充（仅对 ip2region 省份为空的 IP 查询纯真），可指定路径')
+    parser.add_argument('--joined-table', action='store_true',
+                        help='配合 --qqwry：预先合并两库为单一区间表（按文件哈希缓存），每个 IP 只查一次')
+    parser.add_argument('--budget-entries', type=int, default=None, help='预算合并：最大条目数')
+    parser.add_argument('--budget-overshoot', type=int, default=None, help='预算合并：最大可容忍超额覆盖地址数')
+    parser.add_argument('--shard', default=None, help='分片扫描：只扫描第 i/N 片（i 从 1 开始），结果写入 output/shards/')
+    parser.add_argument('--shard-weight', choices=WEIGHTS, default='lookups',
+                        help='分片均衡依据：预计查询次数（默认）或地址数')
+    parser.add_argument('--exclude', action='append', default=[], metavar='FILE',
+                        help='排除列表（CIDR 文本或 .s24 文件，可重复），按 /24 粒度从扫描前缀中去掉')
+    parser.add_argument('--seed', type=int, default=None, help='采样随机种子（固定后结果可复现）')
+    parser.add_argument('--resume', action='store_true', help='从上次中断的断点继续（输入一致时跳过已完成的网段）')
+    parser.add_argument('--checkpoint-interval', type=float, default=30, help='断点落盘间隔（秒）')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='限时扫描：整次运行的时间上限（秒），到时输出带置信度的部分结果')
+    parser.add_argument('--refine', action='store_true',
+                        help='自适应细化：只在区域混杂处二分（按 xdb 段边界判断），替代固定拆分为 /24')
+    parser.add_argument('--min-prefixlen', type=int, default=DEFAULT_MIN_PREFIXLEN,
+                        help=f'细化模式最长细化到的掩码位数（默认 /{DEFAULT_MIN_PREFIXLEN}）')
+    parser.add_argument('--no-memo', action='store_true', help='不复用 data/pipeline/ 中的阶段缓存（全部重新计算）')
+    parser.add_argument('--explain', action='store_true', help='结束时打印各阶段是复用缓存还是重新计算及原因')
+    parser.add_argument('--metrics-json', default=None, help='输出 JSON 运行报告（各阶段耗时、计数器、延迟直方图）')
+    parser.add_argument('--metrics-prom', default=None, help='输出 Prometheus textfile')
     args = parser.parse_args()
+    started = time.monotonic()
+    if args.time_budget is not None and args.time_budget <= 0:
+        parser.error('--time-budget 必须大于 0')
+    if args.time_budget is not None and (args.resume or args.shard):
+        # 分片结果文件不记录 complete / confidence，combine 会把未完成的网段当作已完成
+        parser.error('--time-budget 不能与 --resume / --shard 同时使用')
+    if args.refine and (args.resume or args.time_budget is not None):
+        parser.error('--refine 不能与 --resume / --time-budget 同时使用')
+    if args.refine and args.qqwry and not args.joined_table:
+        # 纯真补充模式的多源查询没有统一的段边界，细化只能靠少量采样判断整块是否单一，不可靠
+        parser.error('--refine 需要段边界：与 --qqwry 同用时请加 --joined-table')
+    if not 1 <= args.min_prefixlen <= 32:
+        parser.error('--min-prefixlen 必须在 1..32 之间')
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
 
     # 获取项目根目录
     project_root = Path(__file__).parent.parent
@@ -116,30 +276,238 @@ def main():
     if not cmcc.exists():
         raise FileNotFoundError(f'cmcc not found: {cmcc.resolve()}')
 
+    if args.metrics_json or args.metrics_prom:
+        metrics.enable()
+
     # download ip2region xdb if needed
-    download_xdb()
+    with metrics.stage('download_xdb'):
+        download_xdb()
+
+    # 阶段缓存：上游输入不变的阶段直接复用（见 pipeline_cache.py）
+    memo = StageCache(project_root / 'data' / 'pipeline', enabled=not args.no_memo)
 
     # load asns and fetch prefixes
-    asns = load_asns_from_file(str(cmcc))
-    prefixes = get_prefixes_sync(asns, use_cache=args.use_cache, concurrency=args.fetch_concurrency)
+    with metrics.stage('fetch_prefixes'):
+        asns = load_asns_from_file(str(cmcc))
+        announcements = get_announcements_sync(asns, use_cache=args.use_cache, concurrency=args.fetch_concurrency,
+                                               hedge=not args.no_hedge)
+        announcements_sha256 = announcements_digest(announcements)
+        memo.note('announcements', 'computed', f"外部输入（{'前缀缓存' if args.use_cache else 'RIPEstat'}），"
+                                              f"内容 {announcements_sha256[:12]}")
+        prefixes, origins = memo.run('prefixes', {'announcements_sha256': announcements_sha256, 'split_prefixlen': 24},
+                                     lambda: build_prefix_set(announcements), save_prefix_set, load_prefix_set)
+    metrics.set_gauge('asns', len(asns))
+    metrics.set_gauge('prefixes', len(prefixes))
     
     print(f"\n🎯 Received {len(prefixes)} prefixes from fetch_prefixes")
+    if args.exclude:
+        excluded = Slash24Set()
+        for path in args.exclude:
+            path = Path(path)
+            excluded = excluded | load_set(path if path.is_absolute() else project_root / path)
+        before = len(prefixes)
+        prefixes = excluded.exclude_prefixes(prefixes)
+        metrics.set_gauge('excluded_prefixes', before - len(prefixes))
+        print(f"🚫 排除 {len(excluded)} 个 /24: {before} -> {len(prefixes)} prefixes")
+    if shard:
+        all_prefixes_hash = prefixes_hash(prefixes)
+        prefixes = partition(prefixes, shard[1], weight=args.shard_weight, sample_per_cidr=args.sample)[shard[0] - 1]
+        metrics.set_gauge('shard_prefixes', len(prefixes))
+        print(f"🧩 Shard {shard[0]}/{shard[1]}: {len(prefixes)} prefixes (weight={args.shard_weight})")
     print(f"📋 Starting scan with sample={args.sample}, workers={args.scan_workers}")
 
     xdb_path = project_root / 'data' / 'ip2region_v4.xdb'
-    ip2 = IP2RegionClient(str(xdb_path))
+    qqwry_path = None
+    if args.qqwry:
+        qqwry_path = Path(args.qqwry)
+        if not qqwry_path.is_absolute():
+            qqwry_path = project_root / qqwry_path
+        if not qqwry_path.exists():
+            print(f"⚠ 纯真 IP 数据库不存在: {qqwry_path}，仅使用 ip2region")
+            qqwry_path = None
+    backend = 'joined' if qqwry_path and args.joined_table else 'multi' if qqwry_path else 'ip2region'
+    ip2 = None
+    checkpoint = None
+
+    def run_scan():
+        nonlocal ip2, checkpoint
+        # 普通扫描与细化按地址顺序查询，开启段缓存；限时扫描按优先级调度，顺序随机，不开启
+        segment_cache = 0 if args.time_budget is not None else SEGMENT_CACHE_SIZE
+        with metrics.stage('load_xdb'):
+            if backend == 'joined':
+                ip2 = JoinedTableClient(ensure_joined_table(xdb_path, qqwry_path))
+            elif backend == 'multi':
+                ip2 = MultiSourceIPClient(str(xdb_path), str(qqwry_path), segment_cache=segment_cache)
+            else:
+                ip2 = IP2RegionClient(str(xdb_path), segment_cache=segment_cache)
+
+        region_table = RegionTable()
+        if args.time_budget is not None:
+            # 限时模式：按优先级调度采样，到截止时间（预留输出时间）即停止，输出带置信度的结果
+            reserve = min(30.0, max(1.0, args.time_budget * 0.05))
+            scanner = AnytimeScanner(prefixes, ip2, sample_per_cidr=args.sample, seed=args.seed,
+                                     max_workers=args.scan_workers, region_table=region_table)
+            with metrics.stage('scan'):
+                with stop_on_signals() as stop:
+                    progress = scanner.run(started + args.time_budget - reserve, stop)
+                results = scanner.results()
+            print(f"⏳ 限时扫描: 探测 {progress['probed']}/{progress['prefixes']} 个网段，"
+                  f"{progress['complete']} 个已完成全部采样，查询 {progress['lookups']} 次 ({progress['seconds']}s)")
+        elif args.refine:
+            # 细化模式：结果网段与输入前缀不一一对应，不写断点
+            with metrics.stage('scan'):
+                results = refine_prefixes(prefixes, ip2, sample_per_cidr=args.sample,
+                                          min_prefixlen=args.min_prefixlen, max_workers=args.scan_workers,
+                                          region_table=region_table, seed=args.seed)
+            print(f"🔬 自适应细化: {len(prefixes)} 个前缀 -> {len(results)} 个网段 "
+                  f"(最长 /{args.min_prefixlen})")
+        else:
+            checkpoint_dir = project_root / 'output' / 'checkpoint'
+            if shard:
+                checkpoint_dir /= f'shard-{shard[0]}-of-{shard[1]}'
+            checkpoint = Checkpoint(checkpoint_dir, build_manifest(asns, xdb_path, args.sample, seed=args.seed,
+                                                                   qqwry_path=qqwry_path, backend=backend,
+                                                                   shard=args.shard),
+                                    region_table, interval=args.checkpoint_interval)
+            restored = checkpoint.load() if args.resume else {}
+            checkpoint.start(resumed=bool(restored))
+            todo = prefixes.exclude(restored.keys())
+            done = [restored[cidr] for cidr in prefixes.cidrs() if cidr in restored] if restored else []
+            if done:
+                print(f"♻ 从断点恢复 {len(done)} 个网段，剩余 {len(todo)} 个")
+            metrics.set_gauge('resumed_prefixes', len(done))
+            with metrics.stage('scan'):
+                try:
+                    with stop_on_signals() as stop:
+                        results = scan_prefixes_concurrent(todo, ip2, sample_per_cidr=args.sample,
+                                                           max_workers=args.scan_workers, region_table=region_table,
+                                                           seed=args.seed, checkpoint=checkpoint, stop=stop)
+                except KeyboardInterrupt:
+                    checkpoint.close()
+                    print(f"\n⏸ 已中断，断点已保存 ({checkpoint.completed} 个网段)，使用 --resume 继续")
+                    sys.exit(130)
+                results = sort_results(results + done)
+        return results, region_table
+
+    scan_inputs = {
+        'prefixes_sha256': prefixes_hash(prefixes),
+        'xdb_sha256': file_sha256(xdb_path),
+        'qqwry_sha256': file_sha256(qqwry_path) if qqwry_path else None,
+        'backend': backend,
+        'sample': args.sample,
+        'seed': args.seed,
+        'refine': args.min_prefixlen if args.refine else None,
+    }
+    # 结果不可复现时不缓存：限时扫描取决于运行时间，未固定种子时每次应重新随机采样
+    scan_skip = ('--time-budget 的结果取决于运行时间' if args.time_budget is not None
+                 else '未固定 --seed，每次重新随机采样' if args.seed is None else None)
+    results, region_table = memo.run('scan', scan_inputs, run_scan, save_scan, load_scan, skip_reason=scan_skip)
+    if args.refine:
+        origins = refined_origins(results, prefixes, origins)
+    if ip2 is not None:
+        metrics.set_gauge('xdb_io_reads', ip2.io_reads())
+    metrics.set_gauge('regions', len(region_table))
+    if qqwry_path and ip2 is not None:
+        source_stats = ip2.source_stats()
+        print("\n🔀 数据源命中统计:")
+        for source, count in source_stats.items():
+            print(f"  {source}: {count}")
+
+    if shard:
+        # 分片模式只写部分结果文件，常规输出由 combine 子命令统一生成
+        with metrics.stage('save_results'):
+            output_paths = (write_result_file(
+                shard_path(project_root / 'output', *shard), results, region_table, origins=origins,
+                shard=shard[0], shards=shard[1], weight=args.shard_weight, sample=args.sample,
+                refine=args.min_prefixlen if args.refine else None, prefixes_sha256=all_prefixes_hash),)
+        if checkpoint is not None:
+            checkpoint.remove()
+        if args.metrics_json:
+            output_paths += (metrics.write_json(args.metrics_json),)
+        if args.metrics_prom:
+            output_paths += (metrics.write_prometheus(args.metrics_prom),)
+        if args.explain:
+            print('\n' + memo.explain())
+        print('\nDone. Outputs:')
+        for path in output_paths:
+            print(f'  {path}')
+        return
+
+    # 限时扫描未完成全部网段时结果不完整：不覆盖已发布的列表文件和 README，改写到 output/partial/
+    out_dir = project_root / 'output'
+    partial = False
+    if args.time_budget is not None:
+        finished = sum(1 for r in results if r.get('complete', True))
+        if not results and len(prefixes):
+            print(f"❌ 限时扫描在截止前未探测任何网段（前缀获取 / 加载数据库已用完 {args.time_budget}s 预算），"
+                  f"未写出任何结果，请增大 --time-budget")
+            sys.exit(1)
+        if finished < len(prefixes):
+            partial = True
+            out_dir = out_dir / 'partial'
+            print(f"⚠ 限时扫描只完成 {finished}/{len(prefixes)} 个网段，结果写入 {out_dir}（不覆盖已发布的结果与 README）")
+
+    budget = None
+    if args.budget_entries is not None or args.budget_overshoot is not None:
+        budget = {'max_entries': args.budget_entries, 'max_overshoot': args.budget_overshoot}
+
+    # 按起源 ASN 统计命中情况
+    asn_stats = summarize_by_asn(results, origins)
+    for asn, s in list(asn_stats.items())[:10]:
+        print(f"  {asn}: {s['high'] + s['medium']}/{s['prefixes']} 个网段命中")
 
-    results = scan_prefixes_concurrent(prefixes, ip2, sample_per_cidr=args.sample, max_workers=args.scan_workers)
+    # 限时扫描时未探测 / 未完成的网段不在结果列表中，与上一次对比会被误报为删除，因此不输出增量
+    enable_delta = not args.no_delta and args.time_budget is None
+    if not args.no_delta and not enable_delta:
+        print("⏳ 限时扫描不输出增量文件（未完成的网段会被误报为删除）")
 
-    output_paths = save_results(results, enable_merge=not args.no_merge)
+    def write_outputs():
+        with metrics.stage('save_results'):
+            paths = save_results(results, out_dir, enable_merge=not args.no_merge, budget=budget,
+                                 enable_delta=enable_delta)
+        paths += (save_asn_stats(asn_stats, out_dir),)
+        # 多目标分类：复用同一次扫描的区域 ID
+        if args.multi_target:
+            with metrics.stage('multi_target'):
+                paths += (save_target_results(classify_targets(results, region_table), out_dir / 'targets'),)
+        return paths
+
+    previous_txt = out_dir / 'hebei_cmcc_cidr.txt'
+    output_inputs = {
+        'results_sha256': results_digest(results, region_table),
+        'origins_sha256': digest(sorted(origins.items())),
+        'merge': not args.no_merge,
+        'budget': budget,
+        'multi_target': args.multi_target,
+        'partial': partial,
+        # 增量文件依赖上一次的输出
+        'previous_txt_sha256': file_sha256(previous_txt) if enable_delta and previous_txt.exists() else None,
+        # 限时扫描：未完成全部采样的网段不进入结果列表
+        'incomplete_sha256': digest(sorted(r['cidr'] for r in results if not r.get('complete', True))),
+    }
+    output_paths = memo.run('outputs', output_inputs, write_outputs, save_output_hashes, load_output_hashes)
 
     # summarize by province using positive prefixes (high + medium)
-    positives = [r['cidr'] for r in results if r['status'] != 'none']
-    stats = summarize_by_province(positives, ip2)
-    stats_md = generate_stats_markdown(stats)
+    with metrics.stage('summarize'):
+        positives = [r for r in results if r['status'] != 'none' and r.get('complete', True)]
+        stats = summarize_by_province(positives, region_table)
+        stats_md = generate_stats_markdown(stats)
+
+        # update README with stats table（结果不完整时不更新）
+        if not partial:
+            update_readme_with_stats(Path('README.md'), stats_md)
+
+    # 输出全部写完后删除断点
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    if args.metrics_json:
+        output_paths += (metrics.write_json(args.metrics_json),)
+    if args.metrics_prom:
+        output_paths += (metrics.write_prometheus(args.metrics_prom),)
 
-    # update README with stats table
-    update_readme_with_stats(Path('README.md'), stats_md)
+    if args.explain:
+        print('\n' + memo.explain())
 
     print('\nDone. Outputs:')
     for path in output_paths:
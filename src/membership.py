@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+河北移动 IP 成员判断（二进制区间文件 + mmap）
+
+文件格式（全部大端）:
+    header (16 字节): magic 'HBCM' | version u16 | reserved u16 | count u32 | checksum u32（body 的 CRC32）
+    body: count 个 (start u32, end u32) 闭区间，按 start 升序、互不相交
+
+加载时只做 mmap，不解析任何内容；多个进程打开同一文件时共享页缓存。
+头中不含生成时间，相同的区间总是生成逐字节相同的文件（提交到仓库时只在内容变化时产生差异）。
+
+用法:
+    from membership import MembershipSet
+    s = MembershipSet('output/hebei_cmcc_cidr.bin')
+    s.contains('111.11.0.1')
+    s.contains_many(['111.11.0.1', '8.8.8.8'])
+"""
+import mmap
+import socket
+import struct
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+from typing import Iterable, List, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy 可选，缺失时退化为 bisect
+    np = None
+
+MAGIC = b'HBCM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>4sHHII')
+HEADER_SIZE = HEADER.size
+RANGE_SIZE = 8
+
+
+def ip_to_int(ip: Union[str, int]) -> int:
+    """
+    IPv4 字符串 -> 整数（整数原样返回）
+
+    使用 inet_pton 严格校验（inet_aton 会接受 '10'、'1.2'、'0x7f.1' 等简写和尾随字符），
+    无效地址抛出 OSError（含 NUL 字符时为 ValueError）
+    """
+    if isinstance(ip, int):
+        return ip
+    return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+
+
+def write_membership(intervals: List[Tuple[int, int]], path) -> Path:
+    """
+    写出成员判断文件（先写临时文件再原子替换）
+
+    Args:
+        intervals: 有序不相交的闭区间列表（见 cidr_merger.cidrs_to_intervals）
+        path: 输出路径
+    """
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    body = bytearray(len(intervals) * RANGE_SIZE)
+    for i, (start, end) in enumerate(intervals):
+        struct.pack_into('>II', body, i * RANGE_SIZE, start, end)
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(intervals), zlib.crc32(body)))
+        f.write(body)
+    tmp.replace(path)
+    return path
+
+
+class _BEUint32View:
+    """mmap 上按固定步长读取大端 uint32 的只读序列（供 bisect 使用）"""
+
+    def __init__(self, buf, offset: int, count: int, stride: int = RANGE_SIZE):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self._stride = stride
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return struct.unpack_from('>I', self._buf, self._offset + i * self._stride)[0]
+
+
+class MembershipSet:
+    """基于 mmap 的 IPv4 区间集合，O(log n) 成员判断"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count, checksum = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"invalid membership file `{self.path}`")
+        if version != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"unsupported membership file version {version}")
+        if len(self._mm) != HEADER_SIZE + count * RANGE_SIZE:
+            self._mm.close()
+            raise ValueError(f"truncated membership file `{self.path}`")
+
+        self.count = count
+        self.checksum = checksum
+        self.starts = _BEUint32View(self._mm, HEADER_SIZE, count)
+        self.ends = _BEUint32View(self._mm, HEADER_SIZE + 4, count)
+
+        self._np_starts = self._np_ends = None
+        if np is not None:
+            # 零拷贝视图，不解析文件内容
+            pairs = np.frombuffer(self._mm, dtype='>u4', count=count * 2, offset=HEADER_SIZE)
+            self._np_starts = pairs[0::2]
+            self._np_ends = pairs[1::2]
+
+    def __len__(self):
+        return self.count
+
+    def contains(self, ip: Union[str, int]) -> bool:
+        """判断单个 IP 是否在集合内"""
+        x = ip_to_int(ip)
+        i = bisect_right(self.starts, x) - 1
+        return i >= 0 and x <= self.ends[i]
+
+    def __contains__(self, ip):
+        return self.contains(ip)
+
+    def contains_many(self, ips: Iterable[Union[str, int]]):
+        """
+        批量判断
+
+        有 numpy 时使用 searchsorted 向量化查询；传入 numpy 数组时返回 numpy bool 数组，
+        否则返回 bool 列表
+        """
+        if self._np_starts is None:
+            return [self.contains(ip) for ip in ips]
+
+        is_array = isinstance(ips, np.ndarray)
+        if is_array:
+            values = ips.astype(np.uint32, copy=False)
+        else:
+            values = np.fromiter((ip_to_int(ip) for ip in ips), dtype=np.uint32)
+        idx = np.searchsorted(self._np_starts, values, side='right') - 1
+        found = idx >= 0
+        safe = np.where(found, idx, 0)
+        if self.count:
+            found &= values <= self._np_ends[safe]
+        else:
+            found[:] = False
+        return found if is_array else found.tolist()
+
+    def overlap(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """返回集合与闭区间 [start, end] 的交集（裁剪后的区间列表）"""
+        i = max(0, bisect_right(self.starts, start) - 1)
+        result = []
+        while i < self.count:
+            s, e = self.starts[i], self.ends[i]
+            if s > end:
+                break
+            if e >= start:
+                result.append((max(s, start), min(e, end)))
+            i += 1
+        return result
+
+    def close(self):
+        self._np_starts = self._np_ends = None
+        self._mm.close()
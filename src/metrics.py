@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+运行指标
+记录各阶段的耗时（wall/CPU）与峰值内存，以及查询数、I/O 次数、缓存命中、
+重试、429、下载字节数等计数器和查询延迟直方图；
+输出 JSON 运行报告，可选输出 Prometheus textfile。
+
+默认关闭，关闭时热路径只有一次属性判断:
+    from metrics import metrics
+    if metrics.enabled:
+        metrics.incr('lookups')
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块
+    resource = None
+
+# 延迟直方图桶上限（微秒）
+LATENCY_BUCKETS_US = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, 10000]
+PROM_PREFIX = 'hebei_cmcc'
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    # ru_maxrss 单位：macOS 为字节，Linux 等为 KB
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class _Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'buckets': {str(b): c for b, c in zip(self.buckets, self.counts)},
+            'overflow': self.counts[-1],
+            'sum': round(self.sum, 3),
+            'count': self.count,
+            'avg': round(self.sum / self.count, 3) if self.count else 0,
+        }
+
+
+class Metrics:
+    """进程内指标注册表（线程安全）"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, _Histogram] = {}
+        self.stages: List[Dict] = []
+        self.started_at = time.time()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def incr(self, name: str, n: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_gauge(self, name: str, value: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: List[float] = LATENCY_BUCKETS_US):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = _Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个阶段的 wall/CPU 时间和结束时的进程峰值 RSS"""
+        if not self.enabled:
+            yield
+            return
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'stage': name,
+                'wall_seconds': round(time.perf_counter() - wall_start, 4),
+                'cpu_seconds': round(time.process_time() - cpu_start, 4),
+                'peak_rss_bytes': _peak_rss_bytes(),
+            })
+
+    def report(self) -> Dict:
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'total_seconds': round(time.time() - self.started_at, 3),
+            'peak_rss_bytes': _peak_rss_bytes(),
+            'stages': self.stages,
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': dict(sorted(self.gauges.items())),
+            'histograms': {k: v.to_dict() for k, v in sorted(self.histograms.items())},
+        }
+
+    def write_json(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(), indent=2, ensure_ascii=False), encoding='utf-8')
+        return path
+
+    def write_prometheus(self, path) -> Path:
+        """输出 Prometheus textfile（node_exporter textfile collector 格式），先写临时文件再原子替换"""
+        lines = []
+        if self.stages:
+            lines.append(f'# TYPE {PROM_PREFIX}_stage_wall_seconds gauge')
+            lines.append(f'# TYPE {PROM_PREFIX}_stage_cpu_seconds gauge')
+        for stage in self.stages:
+            label = f'stage="{stage["stage"]}"'
+            lines.append(f'{PROM_PREFIX}_stage_wall_seconds{{{label}}} {stage["wall_seconds"]}')
+            lines.append(f'{PROM_PREFIX}_stage_cpu_seconds{{{label}}} {stage["cpu_seconds"]}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'# TYPE {PROM_PREFIX}_{name}_total counter')
+            lines.append(f'{PROM_PREFIX}_{name}_total {value}')
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {PROM_PREFIX}_{name} gauge')
+            lines.append(f'{PROM_PREFIX}_{name} {value}')
+        for name, hist in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {PROM_PREFIX}_{name} histogram')
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'{PROM_PREFIX}_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{PROM_PREFIX}_{name}_bucket{{le="+Inf"}} {hist.count}')
+            lines.append(f'{PROM_PREFIX}_{name}_sum {hist.sum}')
+            lines.append(f'{PROM_PREFIX}_{name}_count {hist.count}')
+        peak = _peak_rss_bytes()
+        if peak is not None:
+            lines.append(f'{PROM_PREFIX}_peak_rss_bytes {peak}')
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        tmp.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        tmp.replace(path)
+        return path
+
+
+# 全局单例
+metrics = Metrics()
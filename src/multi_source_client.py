@@ -5,11 +5,65 @@
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import sys
+import threading
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from ip2region_client import IP2RegionClient
 from qqwry_client import QQWryClient
+from metrics import metrics
+
+
+# 来源标签 -> 指标名（Prometheus 指标名只能用 ASCII）
+SOURCE_METRIC_NAMES = {
+    'ip2region': 'ip2region',
+    'qqwry_补充': 'qqwry_supplement',
+    'ip2region_incomplete': 'ip2region_incomplete',
+    'qqwry_fallback': 'qqwry_fallback',
+}
+
+
+def needs_fallback(ip2region_result: Optional[str]) -> bool:
+    """n版结果缺失或省份字段为空时才需要查询纯真"""
+    if not ip2region_result or '|' not in ip2region_result:
+        return True
+    parts = ip2region_result.split('|')
+    province = parts[1] if len(parts) > 1 else ''
+    return not province or province == '0'
+
+
+def choose_best_result(ip2region_result: Optional[str],
+                       qqwry_result: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    从多个数据源中选择最佳结果
+
+    优化策略 (针对 n 版 + 纯真):
+    1. n版优先：如果省份字段有值且不为空，直接使用
+    2. 智能补充：n版省份为空时，检查纯真是否明确显示"河北"
+    3. 保守原则：纯真显示其他省份时，保持 n版 结果（避免误判）
+
+    Returns:
+        (最终结果, 来源标签)
+    """
+    # 检查 n版 是否有完整省份信息
+    if ip2region_result and '|' in ip2region_result:
+        # n版有省份信息，直接使用
+        if not needs_fallback(ip2region_result):
+            return ip2region_result, 'ip2region'
+
+        # n版省份缺失，检查是否可以用纯真补充
+        if qqwry_result and '河北' in qqwry_result and '移动' in qqwry_result:
+            # 纯真明确显示"河北+移动"，可以使用
+            return qqwry_result, 'qqwry_补充'
+
+        # 纯真没有河北信息，保持 n版 原结果
+        return ip2region_result, 'ip2region_incomplete'
+
+    # n版无数据，尝试纯真
+    if qqwry_result:
+        return qqwry_result, 'qqwry_fallback'
+
+    return None, None
 
 
 class MultiSourceIPClient:
@@ -21,17 +75,22 @@ class MultiSourceIPClient:
     2. 如果 n 版省份字段为空（约10%的情况），使用纯真 IP 补充
     3. 补充时需验证纯真数据准确性：
        - 只在纯真明确显示"河北"时才使用
-       - 如果纯真显示其他省份，保持 n 版结果（避免误判）
+       - 如果纯真显示其他省份，保持 n版 结果（避免误判）
     4. 优势：可将识别率从 3,544 提升至 ~3,900+
+
+    纯真只在 n 版无法给出省份时才查询（惰性补充），
+    因此整体查询开销约为单库的 1.1 倍而不是 2 倍。
+    实现了扫描器所需的 lookup_region_str / lookup_many 接口，可直接传给 scan_prefixes_concurrent。
     """
     
-    def __init__(self, ip2region_path=None, qqwry_path=None):
+    def __init__(self, ip2region_path=None, qqwry_path=None, segment_cache: int = 0):
         """
         初始化多数据源客户端
         
         Args:
             ip2region_path: ip2region 数据库路径
             qqwry_path: 纯真 IP 数据库路径
+            segment_cache: ip2region 的段缓存大小（见 IP2RegionClient，按地址顺序扫描时开启）
         """
         # 默认路径
         if ip2region_path is None:
@@ -43,7 +102,7 @@ class MultiSourceIPClient:
         self.ip2region = None
         if Path(ip2region_path).exists():
             try:
-                self.ip2region = IP2RegionClient(ip2region_path)
+                self.ip2region = IP2RegionClient(ip2region_path, segment_cache=segment_cache)
                 print(f"✓ 已加载 ip2region 数据库")
             except Exception as e:
                 print(f"✗ ip2region 加载失败: {e}")
@@ -60,7 +119,39 @@ class MultiSourceIPClient:
                 print(f"✗ 纯真 IP 加载失败: {e}")
         else:
             print(f"⚠ 纯真 IP 数据库不存在: {qqwry_path} (可选)")
-    
+
+        # 各来源命中数及纯真实际查询数（扫描线程共享）
+        self._lock = threading.Lock()
+        self.source_counts: Dict[str, int] = {}
+        self.qqwry_queries = 0
+
+    def _search_ip2region(self, ip) -> Optional[str]:
+        if self.ip2region:
+            try:
+                return self.ip2region.search(ip)
+            except Exception:
+                pass
+        return None
+
+    def _search_qqwry(self, ip) -> Optional[str]:
+        if self.qqwry:
+            try:
+                return self.qqwry.search(ip)
+            except Exception:
+                pass
+        return None
+
+    def _record(self, sources: List[Optional[str]], qqwry_queries: int):
+        with self._lock:
+            for source in sources:
+                key = source or 'none'
+                self.source_counts[key] = self.source_counts.get(key, 0) + 1
+            self.qqwry_queries += qqwry_queries
+        if metrics.enabled:
+            for source in sources:
+                metrics.incr(f"source_{SOURCE_METRIC_NAMES.get(source, 'none')}")
+            metrics.incr('qqwry_lookups', qqwry_queries)
+
     def search(self, ip: str) -> Dict[str, str]:
         """
         查询 IP 地址的地理信息
@@ -69,69 +160,77 @@ class MultiSourceIPClient:
             ip: IP 地址字符串
             
         Returns:
-            字典包含各数据源的查询结果
+            字典包含各数据源的查询结果（未查询纯真时 qqwry 为 None）
         """
-        results = {
+        ip2region_result = self._search_ip2region(ip)
+        qqwry_result = None
+        if self.qqwry and needs_fallback(ip2region_result):
+            qqwry_result = self._search_qqwry(ip)
+        final, source = choose_best_result(ip2region_result, qqwry_result)
+        return {
             'ip': ip,
-            'ip2region': None,
-            'qqwry': None,
-            'final': None,
-            'source': None
+            'ip2region': ip2region_result,
+            'qqwry': qqwry_result,
+            'final': final,
+            'source': source
         }
-        
-        # 查询 ip2region
-        if self.ip2region:
-            try:
-                results['ip2region'] = self.ip2region.search(ip)
-            except:
-                pass
-        
-        # 查询纯真 IP
-        if self.qqwry:
-            try:
-                results['qqwry'] = self.qqwry.search(ip)
-            except:
-                pass
-        
-        # 决定最终结果
-        results['final'], results['source'] = self._choose_best_result(results)
-        
-        return results
-    
-    def _choose_best_result(self, results: Dict) -> Tuple[Optional[str], Optional[str]]:
+
+    def lookup_region_str(self, ip) -> Optional[str]:
         """
-        从多个数据源中选择最佳结果
-        
-        优化策略 (针对 n 版 + 纯真):
-        1. n版优先：如果省份字段有值且不为空，直接使用
-        2. 智能补充：n版省份为空时，检查纯真是否明确显示"河北"
-        3. 保守原则：纯真显示其他省份时，保持 n版 结果（避免误判）
+        只返回最终区域字符串（扫描热路径，不构造结果字典），并累计来源命中数
         """
-        ip2region_result = results.get('ip2region')
-        qqwry_result = results.get('qqwry')
-        
-        # 检查 n版 是否有完整省份信息
-        if ip2region_result and '|' in ip2region_result:
-            parts = ip2region_result.split('|')
-            province = parts[1] if len(parts) > 1 else ''
-            
-            # n版有省份信息，直接使用
-            if province and province not in ['0', '']:
-                return ip2region_result, 'ip2region'
-            
-            # n版省份缺失，检查是否可以用纯真补充
-            if qqwry_result and '河北' in qqwry_result and '移动' in qqwry_result:
-                # 纯真明确显示"河北+移动"，可以使用
-                return qqwry_result, 'qqwry_补充'
-            
-            # 纯真没有河北信息，保持 n版 原结果
-            return ip2region_result, 'ip2region_incomplete'
-        
-        # n版无数据，尝试纯真
-        if qqwry_result:
-            return qqwry_result, 'qqwry_fallback'
-        
-        return None, None
+        ip2region_result = self._search_ip2region(ip)
+        qqwry_result = None
+        queried = 0
+        if self.qqwry and needs_fallback(ip2region_result):
+            qqwry_result = self._search_qqwry(ip)
+            queried = 1
+        final, source = choose_best_result(ip2region_result, qqwry_result)
+        self._record([source], queried)
+        return final
+
+    def lookup_many(self, ips: List[str]) -> List[Optional[str]]:
+        """
+        批量查询：先用 ip2region 查全部 IP，再把未解析出省份的 IP 一次性交给纯真 search_many
+
+        Returns:
+            与 ips 一一对应的最终区域字符串
+        """
+        primary = [self._search_ip2region(ip) for ip in ips]
+        secondary: List[Optional[str]] = [None] * len(ips)
+        pending = [i for i, r in enumerate(primary) if needs_fallback(r)] if self.qqwry else []
+        if pending:
+            try:
+                found = self.qqwry.search_many([ips[i] for i in pending])
+            except Exception:
+                found = [self._search_qqwry(ips[i]) for i in pending]
+            for i, r in zip(pending, found):
+                secondary[i] = r
+
+        finals, sources = [], []
+        for p, q in zip(primary, secondary):
+            final, source = choose_best_result(p, q)
+            finals.append(final)
+            sources.append(source)
+        self._record(sources, len(pending))
+        return finals
+
+    def source_stats(self) -> Dict[str, int]:
+        """各来源命中数（来源标签 -> 次数）及纯真实际查询次数"""
+        with self._lock:
+            stats = dict(sorted(self.source_counts.items(), key=lambda x: -x[1]))
+            stats['qqwry_queries'] = self.qqwry_queries
+        return stats
+
+    def io_reads(self) -> int:
+        """ip2region 累计文件读取次数"""
+        return self.ip2region.io_reads() if self.ip2region else 0
+
+    def close(self):
+        if self.ip2region:
+            self.ip2region.close()
+        if self.qqwry:
+            self.qqwry.close()
     
     def is_hebei_mobile(self, ip: str) -> Tuple[bool, str]:
         """
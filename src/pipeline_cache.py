@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+流水线阶段缓存（内容寻址）
+
+一次运行分为以下阶段，每个可缓存阶段的结果存放在 data/pipeline/<阶段>/<输入哈希>/：
+    announcements  RIPEstat 宣告前缀（外部输入，不缓存，只计算内容哈希）
+    prefixes       拆分 + 前缀树去重后的前缀集合（输入：宣告内容哈希）
+    scan           扫描结果（输入：前缀集合哈希、xdb/纯真文件 sha256、查询后端、采样数、种子、细化参数）
+    outputs        txt/csv/json/bin/合并/增量/ASN 统计/多目标输出（输入：扫描结果哈希、输出参数、上一次 txt 的哈希）
+上游输入不变时直接复用，从第一个失效的阶段开始重新计算；--explain 打印每个阶段复用与否及原因。
+
+每个条目目录写完后才写入 done 标记再整体改名，中途退出不会留下半个条目；
+每个阶段只保留最近使用的 KEEP_ENTRIES 个条目。
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ip2region_downloader import file_sha256
+from prefix_array import PrefixArray
+from region_targets import RegionTable
+from result_io import RESULT_FIELDS, iter_result_file, write_result_file
+
+MEMO_VERSION = 1
+KEEP_ENTRIES = 3
+
+
+def digest(obj) -> str:
+    """JSON 可序列化对象的规范化 sha256（键排序，与插入顺序无关）"""
+    data = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def announcements_digest(announcements: Dict[str, List[str]]) -> str:
+    """宣告前缀的内容哈希（每个 ASN 的前缀排序后计算，与 API 返回顺序无关）"""
+    return digest({asn: sorted(prefixes) for asn, prefixes in announcements.items()})
+
+
+def results_digest(results: List[Dict], region_table: RegionTable) -> str:
+    """扫描结果的内容哈希（region_ids 还原为区域字符串，与区域表编号无关）"""
+    regions = region_table.regions
+    return digest([{k: ([regions[i] for i in v] if k == 'region_ids' else v)
+                    for k, v in r.items() if k in RESULT_FIELDS} for r in results])
+
+
+class StageCache:
+    """
+    阶段缓存
+
+    Args:
+        directory: 缓存根目录
+        enabled: 为 False 时每个阶段都重新计算（仍记录 explain 信息）
+    """
+
+    def __init__(self, directory: Path, enabled: bool = True):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.report: List[Dict[str, str]] = []
+
+    def note(self, stage: str, status: str, reason: str):
+        self.report.append({'stage': stage, 'status': status, 'reason': reason})
+
+    def _last_inputs(self, stage: str) -> Optional[Dict]:
+        try:
+            return json.loads((self.directory / stage / 'last.json').read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _miss_reason(self, stage: str, inputs: Dict) -> str:
+        last = self._last_inputs(stage)
+        if last is None:
+            return '无缓存条目'
+        changed = sorted(k for k in set(last) | set(inputs) if last.get(k) != inputs.get(k))
+        if not changed:
+            return '缓存条目已被清理'
+        return '输入变化: ' + ', '.join(changed)
+
+    def run(self, stage: str, inputs: Dict, compute: Callable, save: Callable, load: Callable,
+            skip_reason: Optional[str] = None):
+        """
+        复用或计算一个阶段
+
+        Args:
+            stage: 阶段名
+            inputs: 本阶段的全部输入（JSON 可序列化，大的输入传其哈希）
+            compute: 无参函数，计算阶段结果
+            save: save(value, entry_dir)，把结果写入条目目录
+            load: load(entry_dir)，读回结果；条目不可用时抛出 OSError / ValueError
+            skip_reason: 非空时本次不使用缓存（如结果不可复现），原因写入 explain
+
+        Returns:
+            阶段结果
+        """
+        if skip_reason or not self.enabled:
+            self.note(stage, 'computed', skip_reason or '缓存已禁用 (--no-memo)')
+            return compute()
+
+        key = digest({'stage': stage, 'version': MEMO_VERSION, 'inputs': inputs})
+        stage_dir = self.directory / stage
+        entry = stage_dir / key
+        if (entry / 'done').exists():
+            try:
+                value = load(entry)
+            except (OSError, ValueError) as e:
+                reason = f'缓存条目不可用: {e}'
+            else:
+                os.utime(entry / 'done')
+                self.note(stage, 'reused', f'输入未变化 ({key[:12]})')
+                return value
+        else:
+            reason = self._miss_reason(stage, inputs)
+
+        value = compute()
+        tmp = stage_dir / f'{key}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        save(value, tmp)
+        (tmp / 'inputs.json').write_text(json.dumps(inputs, indent=2, ensure_ascii=False), encoding='utf-8')
+        (tmp / 'done').write_text(time.strftime('%Y-%m-%dT%H:%M:%S'), encoding='utf-8')
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp.replace(entry)
+        last_tmp = stage_dir / 'last.json.tmp'
+        last_tmp.write_text(json.dumps(inputs, indent=2, ensure_ascii=False), encoding='utf-8')
+        last_tmp.replace(stage_dir / 'last.json')
+        self._evict(stage_dir)
+        self.note(stage, 'computed', reason)
+        return value
+
+    def _evict(self, stage_dir: Path):
+        """每个阶段只保留最近使用的 KEEP_ENTRIES 个条目"""
+        entries = [p for p in stage_dir.iterdir() if (p / 'done').exists()]
+        entries.sort(key=lambda p: (p / 'done').stat().st_mtime, reverse=True)
+        for p in entries[KEEP_ENTRIES:]:
+            shutil.rmtree(p, ignore_errors=True)
+
+    def explain(self) -> str:
+        lines = ['🧾 流水线阶段:']
+        for item in self.report:
+            mark = '♻' if item['status'] == 'reused' else '⚙'
+            lines.append(f"  {mark} {item['stage']:<14} {item['status']:<9} {item['reason']}")
+        return '\n'.join(lines)
+
+
+# ---
+# 各阶段结果的读写
+
+def save_prefix_set(value: Tuple[PrefixArray, Dict[str, Tuple[int, ...]]], entry: Path):
+    prefixes, origins = value
+    with open(entry / 'networks.bin', 'wb') as f:
+        prefixes.networks.tofile(f)
+    with open(entry / 'prefixlens.bin', 'wb') as f:
+        prefixes.prefixlens.tofile(f)
+    # 起源与前缀按下标一一对应
+    (entry / 'origins.json').write_text(
+        json.dumps([origins.get(c, []) for c in prefixes.cidrs()], separators=(',', ':')), encoding='utf-8')
+
+
+def load_prefix_set(entry: Path) -> Tuple[PrefixArray, Dict[str, Tuple[int, ...]]]:
+    networks, prefixlens = array('I'), array('B')
+    networks.frombytes((entry / 'networks.bin').read_bytes())
+    prefixlens.frombytes((entry / 'prefixlens.bin').read_bytes())
+    prefixes = PrefixArray(networks, prefixlens)
+    asn_lists = json.loads((entry / 'origins.json').read_text(encoding='utf-8'))
+    if len(asn_lists) != len(prefixes):
+        raise ValueError('origins 与前缀数量不一致')
+    return prefixes, {c: tuple(a) for c, a in zip(prefixes.cidrs(), asn_lists) if a}
+
+
+def save_scan(value: Tuple[List[Dict], RegionTable], entry: Path):
+    results, region_table = value
+    write_result_file(entry / 'results.jsonl', results, region_table)
+
+
+def load_scan(entry: Path) -> Tuple[List[Dict], RegionTable]:
+    from scanner_advanced import sort_results
+
+    region_table = RegionTable()
+    results = sort_results(list(iter_result_file(entry / 'results.jsonl', region_table)))
+    return results, region_table
+
+
+def _output_files(paths) -> List[Path]:
+    files = []
+    for p in map(Path, paths):
+        files.extend(sorted(f for f in p.rglob('*') if f.is_file()) if p.is_dir() else [p])
+    return files
+
+
+def save_output_hashes(paths, entry: Path):
+    record = {
+        'paths': [str(p) for p in paths],
+        'files': {str(f): file_sha256(f) for f in _output_files(paths)},
+    }
+    (entry / 'outputs.json').write_text(json.dumps(record, indent=2, ensure_ascii=False), encoding='utf-8')
+
+
+def load_output_hashes(entry: Path) -> Tuple[Path, ...]:
+    """输出文件仍在且内容与记录一致时返回输出路径，否则抛出 ValueError（需重新生成）"""
+    record = json.loads((entry / 'outputs.json').read_text(encoding='utf-8'))
+    for path, sha in record['files'].items():
+        if not Path(path).is_file() or file_sha256(path) != sha:
+            raise ValueError(f'输出文件已变化: {Path(path).name}')
+    return tuple(Path(p) for p in record['paths'])
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+紧凑的 IPv4 前缀数组
+
+前缀以 (网络地址 uint32, 掩码位数 uint8) 存放在两个 array 中，每个前缀 5 字节
+（字符串 + IPv4Network 对象约数百字节）。拆分、排序、去重、区间转换、合并都在整数上完成，
+只在读写缓存 / 输出结果时格式化为字符串。
+"""
+import socket
+from array import array
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+_INET_PTON = socket.inet_pton
+_AF_INET = socket.AF_INET
+_INET_NTOA = socket.inet_ntoa
+
+
+def parse_cidr(cidr: str) -> Tuple[int, int]:
+    """
+    解析 'a.b.c.d/len' 为 (网络地址, 掩码位数)，主机位清零（等价于 strict=False）
+
+    与 ipaddress 一样只接受十进制点分四段（inet_pton），拒绝 inet_aton 接受的八进制 / 十六进制 / 简写形式，
+    如 '010.1.1.0/24' 不会被解析为 8.1.1.0/24
+
+    Raises:
+        ValueError: 不是合法的 IPv4 前缀
+    """
+    ip, sep, plen = cidr.partition('/')
+    try:
+        if sep and not (plen.isascii() and plen.isdigit()):
+            raise ValueError
+        addr = int.from_bytes(_INET_PTON(_AF_INET, ip), 'big')
+        plen = int(plen) if plen else 32
+    except (OSError, ValueError):
+        raise ValueError(f"invalid IPv4 prefix `{cidr}`")
+    if not 0 <= plen <= 32:
+        raise ValueError(f"invalid IPv4 prefix `{cidr}`")
+    return addr & ((0xFFFFFFFF << (32 - plen)) & 0xFFFFFFFF), plen
+
+
+def format_ip(addr: int) -> str:
+    return _INET_NTOA(addr.to_bytes(4, 'big'))
+
+
+def format_cidr(net: int, plen: int) -> str:
+    return f'{_INET_NTOA(net.to_bytes(4, "big"))}/{plen}'
+
+
+def range_to_prefixes(start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """闭区间 [start, end] 的最少 CIDR 分解（与 ipaddress.summarize_address_range 相同）"""
+    while start <= end:
+        # 以 start 对齐的最大块，再缩小到不超过 end
+        size = (start & -start) if start else 1 << 32
+        while start + size - 1 > end:
+            size >>= 1
+        plen = 33 - size.bit_length()
+        yield start, plen
+        start += size
+
+
+class PrefixArray:
+    """IPv4 前缀数组（网络地址与掩码位数分列存储）"""
+
+    __slots__ = ('networks', 'prefixlens')
+
+    def __init__(self, networks: Optional[array] = None, prefixlens: Optional[array] = None):
+        self.networks = networks if networks is not None else array('I')
+        self.prefixlens = prefixlens if prefixlens is not None else array('B')
+
+    @classmethod
+    def from_cidrs(cls, cidrs: Iterable[str], strict: bool = False) -> 'PrefixArray':
+        """
+        由 CIDR 字符串构建
+
+        Args:
+            strict: 为 True 时遇到无法解析的前缀抛出 ValueError，否则打印警告并跳过
+        """
+        pa = cls()
+        networks, prefixlens = pa.networks, pa.prefixlens
+        for cidr in cidrs:
+            try:
+                net, plen = parse_cidr(cidr)
+            except ValueError as e:
+                if strict:
+                    raise
+                print(f"Warning: Failed to parse {cidr}: {e}")
+                continue
+            networks.append(net)
+            prefixlens.append(plen)
+        return pa
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[int, int]]) -> 'PrefixArray':
+        pa = cls()
+        for net, plen in pairs:
+            pa.networks.append(net)
+            pa.prefixlens.append(plen)
+        return pa
+
+    def append(self, net: int, plen: int):
+        self.networks.append(net)
+        self.prefixlens.append(plen)
+
+    def __len__(self):
+        return len(self.networks)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.networks, self.prefixlens)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PrefixArray(self.networks[i], self.prefixlens[i])
+        return self.networks[i], self.prefixlens[i]
+
+    def __eq__(self, other):
+        return (isinstance(other, PrefixArray) and self.networks == other.networks
+                and self.prefixlens == other.prefixlens)
+
+    def __repr__(self):
+        return f'PrefixArray({len(self)} prefixes)'
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.networks) * self.networks.itemsize + len(self.prefixlens) * self.prefixlens.itemsize
+
+    def cidr(self, i: int) -> str:
+        return format_cidr(self.networks[i], self.prefixlens[i])
+
+    def cidrs(self) -> Iterator[str]:
+        """逐个格式化为字符串（输出边界使用）"""
+        return (format_cidr(net, plen) for net, plen in zip(self.networks, self.prefixlens))
+
+    def to_cidrs(self) -> List[str]:
+        return list(self.cidrs())
+
+    def num_addresses(self, i: int) -> int:
+        return 1 << (32 - self.prefixlens[i])
+
+    def total_addresses(self) -> int:
+        return sum(1 << (32 - plen) for plen in self.prefixlens)
+
+    def sorted_unique(self) -> 'PrefixArray':
+        """按 (网络地址, 掩码位数) 排序并去重"""
+        keys = sorted(set((net << 6) | plen for net, plen in zip(self.networks, self.prefixlens)))
+        return PrefixArray(array('I', [k >> 6 for k in keys]), array('B', [k & 63 for k in keys]))
+
+    def split(self, max_prefixlen: int = 24) -> 'PrefixArray':
+        """把掩码短于 max_prefixlen 的前缀拆分为 /max_prefixlen（其余保持不变）"""
+        out = PrefixArray()
+        networks, prefixlens = out.networks, out.prefixlens
+        step = 1 << (32 - max_prefixlen)
+        for net, plen in zip(self.networks, self.prefixlens):
+            if plen >= max_prefixlen:
+                networks.append(net)
+                prefixlens.append(plen)
+            else:
+                count = 1 << (max_prefixlen - plen)
+                networks.extend(range(net, net + count * step, step))
+                prefixlens.extend(bytes([max_prefixlen]) * count)
+        return out
+
+    def exclude(self, cidrs: Set[str]) -> 'PrefixArray':
+        """去掉字符串形式在 cidrs 中的前缀（用于跳过已有结果的网段）"""
+        if not cidrs:
+            return self
+        out = PrefixArray()
+        for net, plen in zip(self.networks, self.prefixlens):
+            if format_cidr(net, plen) not in cidrs:
+                out.append(net, plen)
+        return out
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        """有序、不相交的闭区间 [start, end]（重叠和首尾相接的前缀合并为一个区间）"""
+        spans = sorted((net, net + (1 << (32 - plen)) - 1) for net, plen in zip(self.networks, self.prefixlens))
+        intervals: List[Tuple[int, int]] = []
+        for start, end in spans:
+            if intervals and start <= intervals[-1][1] + 1:
+                if end > intervals[-1][1]:
+                    intervals[-1] = (intervals[-1][0], end)
+            else:
+                intervals.append((start, end))
+        return intervals
+
+    def collapse(self) -> 'PrefixArray':
+        """合并为覆盖同一地址集合的最少前缀（与 ipaddress.collapse_addresses 相同）"""
+        return PrefixArray.from_pairs(p for start, end in self.intervals() for p in range_to_prefixes(start, end))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+前缀二叉树（按位展开）
+用于对各 ASN 宣告的前缀做结构化去重：覆盖关系（如 A 宣告 /22，B 宣告其中的 /24、/25）
+会被拆成互不相交的叶子网段，每个叶子记录所有覆盖它的起源 ASN 集合。
+扫描只针对叶子进行，同一地址不会被重复扫描，同时可按 ASN 统计命中情况。
+
+节点用两个 array 存储左右子节点下标（0 表示不存在，根节点为 0），避免每个节点一个 Python 对象。
+"""
+from array import array
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from prefix_array import PrefixArray, format_cidr, parse_cidr
+
+
+class PrefixTrie:
+    """IPv4 前缀二叉树，记录每个宣告前缀的起源 ASN"""
+
+    def __init__(self):
+        self.left = array('l', [0])
+        self.right = array('l', [0])
+        self.origins: Dict[int, Set[int]] = {}
+        self.inserted = 0
+        self.input_addresses = 0
+
+    def insert(self, cidr: str, asn: int):
+        """插入一条宣告（重复插入相同前缀只会合并起源 ASN）"""
+        addr, plen = parse_cidr(cidr)
+        left, right = self.left, self.right
+        node = 0
+        for depth in range(plen):
+            children = right if (addr >> (31 - depth)) & 1 else left
+            child = children[node]
+            if not child:
+                child = len(left)
+                left.append(0)
+                right.append(0)
+                children[node] = child
+            node = child
+        self.origins.setdefault(node, set()).add(asn)
+        self.inserted += 1
+        self.input_addresses += 1 << (32 - plen)
+
+    def __len__(self):
+        return len(self.left)
+
+    def leaf_array(self, split_prefixlen: int = 24) -> Tuple[PrefixArray, List[FrozenSet[int]]]:
+        """
+        返回互不相交的叶子网段及其起源 ASN 集合（按地址排序）
+
+        叶子的起源集合 = 所有覆盖它的宣告前缀的 ASN 并集。
+        掩码短于 split_prefixlen 的叶子拆分为 /split_prefixlen（与 split_large_prefixes 一致）
+
+        Returns:
+            (叶子前缀数组, 与之一一对应的起源 ASN 集合列表)
+        """
+        interned: Dict[FrozenSet[int], FrozenSet[int]] = {}
+        blocks: List[Tuple[int, int, FrozenSet[int]]] = []
+        left, right, origins = self.left, self.right, self.origins
+
+        stack = [(0, 0, 0, frozenset())]
+        while stack:
+            node, addr, depth, inherited = stack.pop()
+            own = origins.get(node)
+            if own and not own <= inherited:
+                merged = inherited | own
+                inherited = interned.setdefault(merged, merged)
+            l, r = left[node], right[node]
+            if not l and not r:
+                if inherited:
+                    blocks.append((addr, depth, inherited))
+                continue
+            # 有更具体的宣告：存在的子树继续展开，缺失的一半由当前覆盖集合整体继承
+            half = 1 << (31 - depth)
+            for child, child_addr in ((l, addr), (r, addr | half)):
+                if child:
+                    stack.append((child, child_addr, depth + 1, inherited))
+                elif inherited:
+                    blocks.append((child_addr, depth + 1, inherited))
+
+        blocks.sort()
+        prefixes = PrefixArray()
+        asn_sets: List[FrozenSet[int]] = []
+        step = 1 << (32 - split_prefixlen)
+        for addr, plen, asns in blocks:
+            if plen < split_prefixlen:
+                count = 1 << (split_prefixlen - plen)
+                prefixes.networks.extend(range(addr, addr + count * step, step))
+                prefixes.prefixlens.extend(bytes([split_prefixlen]) * count)
+                asn_sets.extend([asns] * count)
+            else:
+                prefixes.append(addr, plen)
+                asn_sets.append(asns)
+        return prefixes, asn_sets
+
+    def leaves(self, split_prefixlen: int = 24) -> List[Tuple[str, FrozenSet[int]]]:
+        """leaf_array 的字符串形式: [(cidr, frozenset(asn...))]"""
+        prefixes, asn_sets = self.leaf_array(split_prefixlen)
+        return [(format_cidr(net, plen), asns) for (net, plen), asns in zip(prefixes, asn_sets)]
+
+
+def build_prefix_trie(prefixes_by_asn: Dict[str, Iterable[str]]) -> PrefixTrie:
+    """由 {asn: [cidr...]}（与前缀缓存格式相同）构建前缀树，无法解析的前缀跳过"""
+    trie = PrefixTrie()
+    for asn, prefixes in prefixes_by_asn.items():
+        for cidr in prefixes:
+            try:
+                trie.insert(cidr, int(asn))
+            except ValueError as e:
+                print(f"Warning: Failed to parse {cidr}: {e}")
+    return trie
@@ -1,10 +1,31 @@
 """
 纯真 IP 数据库查询客户端
 用于补充 ip2region 数据不全的问题
+
+实现要点:
+- mmap 方式访问 qqwry.dat，不整体读入内存
+- 加载时一次性解码索引区的起始 IP 和记录偏移到 array('I')，查询用 bisect
+- 按记录偏移缓存解码后的字符串，相同记录只做一次 GBK 解码
+- 提供 search_many 批量查询（有 numpy 时使用 searchsorted 向量化定位）
 """
-import struct
+import mmap
 import socket
+import struct
+from array import array
+from bisect import bisect_right
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy 可选
+    np = None
+
+INDEX_ENTRY_SIZE = 7
+# 记录字符串缓存上限（条），超过后清空重建
+RECORD_CACHE_LIMIT = 200000
+
+_u32 = struct.Struct('<I')
 
 
 class QQWryClient:
@@ -21,35 +42,59 @@ class QQWryClient:
         self.db = None
         self.idx_start = 0
         self.idx_end = 0
+        self._starts = array('I')
+        self._offsets = array('I')
+        self._np_starts = None
+        self._cache = {}
         
         try:
             self._load_db()
         except Exception as e:
             print(f"Warning: Failed to load QQWry database: {e}")
-            self.db = None
+            self.close()
     
     def _load_db(self):
-        """加载数据库文件"""
+        """mmap 数据库文件并解码索引区"""
         with open(self.db_path, 'rb') as f:
-            self.db = f.read()
+            self.db = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         
         # 读取索引区起始和结束位置
-        self.idx_start = struct.unpack('<I', self.db[0:4])[0]
-        self.idx_end = struct.unpack('<I', self.db[4:8])[0]
+        self.idx_start, self.idx_end = struct.unpack_from('<II', self.db, 0)
+        count = (self.idx_end - self.idx_start) // INDEX_ENTRY_SIZE + 1
+        index = self.db[self.idx_start:self.idx_start + count * INDEX_ENTRY_SIZE]
+        
+        if np is not None:
+            raw = np.frombuffer(index, dtype=np.uint8).reshape(count, INDEX_ENTRY_SIZE)
+            starts = raw[:, 0:4].copy().view('<u4').ravel()
+            offsets = np.zeros((count, 4), dtype=np.uint8)
+            offsets[:, 0:3] = raw[:, 4:7]
+            self._starts = array('I', starts.astype(np.uint32).tobytes())
+            self._offsets = array('I', offsets.view('<u4').ravel().astype(np.uint32).tobytes())
+            self._np_starts = starts.astype(np.uint32)
+        else:
+            self._starts = array('I', (_u32.unpack_from(index, i)[0]
+                                       for i in range(0, len(index), INDEX_ENTRY_SIZE)))
+            self._offsets = array('I', (int.from_bytes(index[i + 4:i + 7], 'little')
+                                        for i in range(0, len(index), INDEX_ENTRY_SIZE)))
+    
+    def _read_ptr(self, offset):
+        """读取 3 字节小端偏移"""
+        db = self.db
+        return db[offset] | (db[offset + 1] << 8) | (db[offset + 2] << 16)
+    
+    def _read_cstring(self, offset):
+        """读取以 \x00 结尾的原始字节串，返回 (bytes, 结束位置)"""
+        end = self.db.find(b'\x00', offset)
+        if end == -1:
+            return b'', offset
+        return self.db[offset:end], end
     
     def _read_string(self, offset):
         """读取以 \x00 结尾的字符串"""
         if not self.db or offset >= len(self.db):
             return ""
-        
-        end = self.db.find(b'\x00', offset)
-        if end == -1:
-            return ""
-        
-        try:
-            return self.db[offset:end].decode('gbk', errors='ignore')
-        except:
-            return ""
+        raw, _ = self._read_cstring(offset)
+        return raw.decode('gbk', errors='ignore')
     
     def _read_area(self, offset):
         """读取地区信息"""
@@ -60,12 +105,40 @@ class QQWryClient:
         
         if mode == 0x01 or mode == 0x02:
             # 重定向模式
-            offset = struct.unpack('<I', self.db[offset+1:offset+4] + b'\x00')[0]
+            offset = self._read_ptr(offset + 1)
             if offset == 0:
                 return ""
-            return self._read_string(offset)
-        else:
-            return self._read_string(offset)
+        return self._read_string(offset)
+    
+    def _country_and_area_offset(self, offset):
+        """解析国家字符串，返回 (国家, 地区信息偏移)"""
+        if self.db[offset] == 0x02:
+            # 国家重定向，地区紧随其后
+            return self._read_string(self._read_ptr(offset + 1)), offset + 4
+        # 国家内联，地区在字符串结束符之后（直接用字节长度，避免 encode 往返）
+        raw, end = self._read_cstring(offset)
+        return raw.decode('gbk', errors='ignore'), end + 1
+    
+    def _record(self, rec_offset):
+        """按记录偏移解析并缓存结果字符串"""
+        cached = self._cache.get(rec_offset)
+        if cached is not None:
+            return cached
+        result = self._parse_record(rec_offset + 4)
+        if len(self._cache) >= RECORD_CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[rec_offset] = result
+        return result
+    
+    def _locate(self, ip_int):
+        """返回 ip 所在记录的偏移，未命中返回 None"""
+        i = bisect_right(self._starts, ip_int) - 1
+        if i < 0:
+            return None
+        rec_offset = self._offsets[i]
+        if ip_int > _u32.unpack_from(self.db, rec_offset)[0]:
+            return None
+        return rec_offset
     
     def search(self, ip):
         """
@@ -81,35 +154,57 @@ class QQWryClient:
             return None
         
         try:
-            ip_int = struct.unpack('!I', socket.inet_aton(ip))[0]
-        except:
+            ip_int = int.from_bytes(socket.inet_aton(ip), 'big')
+        except (OSError, TypeError):
             return None
         
-        # 二分查找
-        left = 0
-        right = (self.idx_end - self.idx_start) // 7
+        rec_offset = self._locate(ip_int)
+        if rec_offset is None:
+            return None
+        return self._record(rec_offset)
+    
+    def search_many(self, ips: Iterable[str]) -> List[Optional[str]]:
+        """
+        批量查询，结果顺序与输入一致
+
+        有 numpy 时用 searchsorted 一次性定位所有 IP 的索引位置
+        """
+        ips = list(ips)
+        if not self.db:
+            return [None] * len(ips)
+        if self._np_starts is None:
+            return [self.search(ip) for ip in ips]
         
-        while left <= right:
-            mid = (left + right) // 2
-            offset = self.idx_start + mid * 7
-            
-            start_ip = struct.unpack('<I', self.db[offset:offset+4])[0]
-            
-            if ip_int < start_ip:
-                right = mid - 1
+        values = np.zeros(len(ips), dtype=np.uint32)
+        valid = np.ones(len(ips), dtype=bool)
+        for k, ip in enumerate(ips):
+            try:
+                values[k] = int.from_bytes(socket.inet_aton(ip), 'big')
+            except (OSError, TypeError):
+                valid[k] = False
+        idx = np.searchsorted(self._np_starts, values, side='right') - 1
+        
+        results = []
+        offsets = self._offsets
+        for k, i in enumerate(idx.tolist()):
+            if not valid[k] or i < 0:
+                results.append(None)
+                continue
+            rec_offset = offsets[i]
+            if int(values[k]) > _u32.unpack_from(self.db, rec_offset)[0]:
+                results.append(None)
             else:
-                # 读取记录偏移
-                rec_offset = struct.unpack('<I', self.db[offset+4:offset+7] + b'\x00')[0]
-                end_ip = struct.unpack('<I', self.db[rec_offset:rec_offset+4])[0]
-                
-                if ip_int > end_ip:
-                    left = mid + 1
-                else:
-                    # 找到了
-                    return self._parse_record(rec_offset + 4)
-        
-        return None
+                results.append(self._record(rec_offset))
+        return results
     
+    def iter_ranges(self) -> Iterator[Tuple[int, int, str]]:
+        """按地址顺序遍历所有记录 (start, end, 地理信息)，不经过记录缓存"""
+        if not self.db:
+            return
+        for start, rec_offset in zip(self._starts, self._offsets):
+            end = _u32.unpack_from(self.db, rec_offset)[0]
+            yield start, end, self._parse_record(rec_offset + 4) or ''
+
     def _parse_record(self, offset):
         """解析记录"""
         if not self.db or offset >= len(self.db):
@@ -119,32 +214,20 @@ class QQWryClient:
         
         if mode == 0x01:
             # 国家和地区都重定向
-            offset = struct.unpack('<I', self.db[offset+1:offset+4] + b'\x00')[0]
-            mode = self.db[offset]
-            
-            if mode == 0x02:
-                # 国家重定向，地区可能重定向
-                country_offset = struct.unpack('<I', self.db[offset+1:offset+4] + b'\x00')[0]
-                country = self._read_string(country_offset)
-                area = self._read_area(offset + 4)
-            else:
-                # 国家和地区都在这里
-                country = self._read_string(offset)
-                area = self._read_area(offset + len(country.encode('gbk')) + 1)
-        
-        elif mode == 0x02:
-            # 国家重定向
-            country_offset = struct.unpack('<I', self.db[offset+1:offset+4] + b'\x00')[0]
-            country = self._read_string(country_offset)
-            area = self._read_area(offset + 4)
+            offset = self._read_ptr(offset + 1)
         
-        else:
-            # 国家和地区都在这里
-            country = self._read_string(offset)
-            area = self._read_area(offset + len(country.encode('gbk')) + 1)
+        country, area_offset = self._country_and_area_offset(offset)
+        area = self._read_area(area_offset)
         
         return f"{country} {area}".strip()
     
+    def close(self):
+        """释放 mmap"""
+        self._np_starts = None
+        if self.db is not None:
+            self.db.close()
+        self.db = None
+    
     def is_hebei_mobile(self, ip):
         """
         判断 IP 是否属于河北移动
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+本地查询服务
+常驻进程一次性加载扫描结果（及可选的 ip2region 数据库），
+通过本地 TCP 或 Unix socket 提供 HTTP 查询，避免每次查询都重新加载。
+
+接口:
+    GET  /contains?ip=1.2.3.4     单个 IP 判断
+    POST /batch                   请求体为换行分隔的 IP 列表，返回 TSV: ip<TAB>0|1[<TAB>region]
+    GET  /overlap?cidr=1.2.0.0/16 CIDR 与结果集的交集
+    GET  /stats                   请求数、QPS、延迟分布
+
+并发请求会被合并为一次向量化查询（micro-batch）。
+
+用法:
+    python src/main.py serve --port 8053
+    python src/main.py serve --unix /tmp/hebei.sock --xdb data/ip2region_v4.xdb
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from membership import MembershipSet, ip_to_int, np
+
+# 延迟直方图桶上限（毫秒）
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000]
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class ServerStats:
+    """请求计数、QPS 与延迟直方图"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = 0
+        self.ips = 0
+        self.batches = 0
+        self.errors = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._last_qps = 0.0
+
+    def observe(self, latency_ms: float):
+        self.requests += 1
+        self.latency_sum_ms += latency_ms
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                self.latency_buckets[i] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+
+        # 10 秒滑动窗口的近期 QPS
+        now = time.monotonic()
+        self._window_count += 1
+        if now - self._window_start >= 10:
+            self._last_qps = self._window_count / (now - self._window_start)
+            self._window_start = now
+            self._window_count = 0
+
+    def snapshot(self) -> Dict:
+        uptime = time.time() - self.started_at
+        buckets = {f'le_{b}ms': c for b, c in zip(LATENCY_BUCKETS_MS, self.latency_buckets)}
+        buckets['gt_1000ms'] = self.latency_buckets[-1]
+        return {
+            'uptime_seconds': round(uptime, 1),
+            'requests': self.requests,
+            'ips': self.ips,
+            'batches': self.batches,
+            'avg_ips_per_batch': round(self.ips / self.batches, 1) if self.batches else 0,
+            'errors': self.errors,
+            'qps': round(self.requests / uptime, 1) if uptime > 0 else 0,
+            'recent_qps': round(self._last_qps, 1),
+            'avg_latency_ms': round(self.latency_sum_ms / self.requests, 3) if self.requests else 0,
+            'latency_histogram': buckets,
+        }
+
+
+class MicroBatcher:
+    """将短时间窗口内的并发请求合并为一次 contains_many 查询"""
+
+    def __init__(self, members: MembershipSet, stats: ServerStats, region_client=None,
+                 window_ms: float = 0.0, max_batch: int = 65536):
+        self.members = members
+        self.stats = stats
+        self.region_client = region_client
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, ips: List[int], with_region: bool = False):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((ips, with_region, fut))
+        return await fut
+
+    async def _run(self):
+        while True:
+            items = [await self.queue.get()]
+            # 让出事件循环，收集同一轮（或合并窗口内）到达的其他请求
+            await asyncio.sleep(self.window)
+            size = len(items[0][0])
+            while size < self.max_batch and not self.queue.empty():
+                item = self.queue.get_nowait()
+                items.append(item)
+                size += len(item[0])
+
+            try:
+                if self.region_client is not None and any(with_region for _, with_region, _ in items):
+                    # 区域查询是阻塞的文件读取（pread），放到线程池执行，不阻塞事件循环
+                    results = await asyncio.get_running_loop().run_in_executor(None, self._resolve, items)
+                else:
+                    results = self._resolve(items)
+            except Exception as e:
+                for _, _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, _, fut), result in zip(items, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def _resolve(self, items) -> List[Tuple[List[bool], Optional[List[str]]]]:
+        """批量查询一组请求，返回与 items 一一对应的 (标志列表, 区域列表或 None)"""
+        all_ips = [ip for ips, _, _ in items for ip in ips]
+        if np is not None:
+            flags = self.members.contains_many(np.array(all_ips, dtype=np.uint32)).tolist()
+        else:
+            flags = self.members.contains_many(all_ips)
+        self.stats.batches += 1
+        self.stats.ips += len(all_ips)
+
+        results = []
+        pos = 0
+        for ips, with_region, _ in items:
+            chunk = flags[pos:pos + len(ips)]
+            regions = None
+            if with_region and self.region_client is not None:
+                regions = [self.region_client.lookup_region_str(ipaddress.IPv4Address(ip).packed) or ''
+                           for ip in ips]
+            pos += len(ips)
+            results.append((chunk, regions))
+        return results
+
+
+class QueryServer:
+    """极简 HTTP/1.1 服务（支持 keep-alive），只依赖标准库 asyncio"""
+
+    def __init__(self, members: MembershipSet, region_client=None, window_ms: float = 0.0):
+        self.members = members
+        self.region_client = region_client
+        self.stats = ServerStats()
+        self.batcher = MicroBatcher(members, self.stats, region_client, window_ms=window_ms)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'bad request'})
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    k, _, v = line.decode('latin-1').partition(':')
+                    headers[k.strip().lower()] = v.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {'error': 'invalid content-length'})
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': 'body too large'})
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                start = time.perf_counter()
+                status, payload = await self._dispatch(method, target, body)
+                self.stats.observe((time.perf_counter() - start) * 1000)
+                if status >= 400:
+                    self.stats.errors += 1
+                await self._respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        with_region = query.get('region', ['0'])[0] in ('1', 'true')
+
+        if url.path == '/contains' and method == 'GET':
+            ip = query.get('ip', [''])[0]
+            try:
+                value = ip_to_int(ip)
+            except (OSError, ValueError):
+                return 400, {'error': f'invalid ip `{ip}`'}
+            flags, regions = await self.batcher.submit([value], with_region)
+            result = {'ip': ip, 'hebei_mobile': bool(flags[0])}
+            if regions is not None:
+                result['region'] = regions[0]
+            return 200, result
+
+        if url.path == '/batch' and method == 'POST':
+            raw = [line.strip() for line in body.decode('utf-8', errors='ignore').splitlines()]
+            raw = [ip for ip in raw if ip]
+            values, valid = [], []
+            for ip in raw:
+                try:
+                    values.append(ip_to_int(ip))
+                    valid.append(True)
+                except (OSError, ValueError):
+                    valid.append(False)
+            flags, regions = await self.batcher.submit(values, with_region) if values else ([], None)
+            lines, j = [], 0
+            for ip, ok in zip(raw, valid):
+                if not ok:
+                    lines.append(f'{ip}\tinvalid')
+                    continue
+                line = f'{ip}\t{1 if flags[j] else 0}'
+                if regions is not None:
+                    line += f'\t{regions[j]}'
+                lines.append(line)
+                j += 1
+            return 200, '\n'.join(lines) + ('\n' if lines else '')
+
+        if url.path == '/overlap' and method == 'GET':
+            cidr = query.get('cidr', [''])[0]
+            try:
+                net = ipaddress.IPv4Network(cidr, strict=False)
+            except ValueError:
+                return 400, {'error': f'invalid cidr `{cidr}`'}
+            ranges = self.members.overlap(int(net.network_address), int(net.broadcast_address))
+            cidrs = []
+            for s, e in ranges:
+                cidrs.extend(str(n) for n in ipaddress.summarize_address_range(
+                    ipaddress.IPv4Address(s), ipaddress.IPv4Address(e)))
+            covered = sum(e - s + 1 for s, e in ranges)
+            return 200, {
+                'cidr': str(net),
+                'overlap_addresses': covered,
+                'overlap_ratio': covered / net.num_addresses,
+                'overlap': cidrs,
+            }
+
+        if url.path == '/stats' and method == 'GET':
+            return 200, self.stats.snapshot()
+
+        return 404, {'error': 'not found'}
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload):
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            ctype = 'text/tab-separated-values; charset=utf-8'
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            ctype = 'application/json; charset=utf-8'
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large'}.get(status, '')
+        writer.write(
+            f'HTTP/1.1 {status} {reason}\r\nContent-Type: {ctype}\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8053, unix_path: Optional[str] = None):
+        self.batcher.start()
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+            print(f"🚀 查询服务已启动: unix:{unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"🚀 查询服务已启动: http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+
+def main(argv=None):
+    project_root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description='本地河北移动 IP 查询服务')
+    parser.add_argument('--membership', default=str(project_root / 'output' / 'hebei_cmcc_cidr.bin'),
+                        help='成员判断文件（save_results 生成的 .bin）')
+    parser.add_argument('--xdb', default=None, help='可选：同时加载 ip2region 数据库以返回区域信息')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8053)
+    parser.add_argument('--unix', default=None, help='监听 Unix socket 路径（替代 TCP）')
+    parser.add_argument('--batch-window-ms', type=float, default=0.0,
+                        help='micro-batch 合并窗口（毫秒），0 表示只合并同一轮事件循环内到达的请求')
+    args = parser.parse_args(argv)
+
+    members = MembershipSet(args.membership)
+    print(f"✓ 已加载 {len(members)} 个区间: {args.membership}")
+
+    region_client = None
+    if args.xdb:
+        from ip2region_client import IP2RegionClient
+        region_client = IP2RegionClient(args.xdb)
+        print(f"✓ 已加载 ip2region 数据库: {args.xdb}")
+
+    server = QueryServer(members, region_client, window_ms=args.batch_window_ms)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        members.close()
+        if region_client:
+            region_client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+自适应前缀细化（替代固定拆分为 /24）
+
+固定拆分把短于 /24 的前缀全部拆成 /24：区域单一的 /12 也要采样 4096 个网段，
+而区域混杂的 /24 又无法再细分。细化模式自顶向下二分：
+1. 互不相交的前缀先合并为最少的对齐块，再切到不长于 /16（并行任务的单位）
+2. 查询块首地址所在的段（IP2RegionClient / JoinedTableClient 的 search_with_segment），
+   段覆盖整块即整块同一区域，一次查询即可定论。
+   不能给出段边界的后端（如 MultiSourceIPClient）无法判断，不支持细化：
+   几个采样点区域相同不足以说明一个 /16 区域单一
+3. 区域混杂的块一分为二继续判断，直到 min_prefixlen（如 /26），最小块按普通扫描采样
+
+结果字段与 scan_single 相同，cidr 为细化后的块，按地址顺序排列。
+
+用法:
+    python src/main.py --refine --min-prefixlen 26
+"""
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from ip2region_client import is_hebei_mobile_region
+from metrics import metrics
+from prefix_array import PrefixArray, format_cidr, format_ip, parse_cidr
+from region_targets import RegionTable
+from scanner_advanced import make_result, scan_single, sort_results
+
+DEFAULT_MIN_PREFIXLEN = 26
+# 合并后的块切到不长于此长度，作为并行任务的单位
+TASK_PREFIXLEN = 16
+
+
+def refine_block(prefix: Tuple[int, int], ip2, sample_per_cidr: int = 3,
+                 min_prefixlen: int = DEFAULT_MIN_PREFIXLEN, seed=None,
+                 matcher=is_hebei_mobile_region) -> List[Dict]:
+    """
+    细化单个块
+
+    Args:
+        prefix: (网络地址, 掩码位数)
+        ip2: 查询后端，须实现 search_with_segment(ip) -> (区域, 段起始, 段结束)
+        min_prefixlen: 最长细化到的掩码位数
+
+    Returns:
+        按地址排序的结果列表（带 regions，与 scan_single 相同）
+    """
+    segment_of = getattr(ip2, 'search_with_segment', None)
+    if segment_of is None:
+        raise ValueError(f"{type(ip2).__name__} 不能给出段边界，不支持细化")
+    results = []
+    stack = [prefix]
+    while stack:
+        net, plen = stack.pop()
+        if plen >= min_prefixlen:
+            results.append(scan_single((net, plen), ip2, sample_per_cidr, matcher, seed=seed))
+            continue
+        end = net + (1 << (32 - plen)) - 1
+        ip = format_ip(net)
+        try:
+            region, _, seg_end = segment_of(ip)
+        except Exception:
+            region, seg_end = '', None
+        if seg_end is not None and seg_end >= end:
+            results.append(make_result(format_cidr(net, plen), [ip], [region or ''], matcher))
+            continue
+        # 区域混杂：先压入高半块，保证按地址顺序输出
+        half = 1 << (31 - plen)
+        stack.append((net + half, plen + 1))
+        stack.append((net, plen + 1))
+    return results
+
+
+def refine_prefixes(prefixes, ip2, sample_per_cidr: int = 3, min_prefixlen: int = DEFAULT_MIN_PREFIXLEN,
+                    max_workers: int = 24, region_table: Optional[RegionTable] = None, seed=None,
+                    matcher=is_hebei_mobile_region) -> List[Dict]:
+    """
+    并发细化扫描（参数含义同 scan_prefixes_concurrent）
+
+    Args:
+        prefixes: 互不相交的前缀（PrefixArray 或 CIDR 字符串列表）
+        ip2: 查询后端，须实现 search_with_segment（见 refine_block）
+        min_prefixlen: 最长细化到的掩码位数
+
+    Returns:
+        排序后的结果列表（high -> medium -> none）
+    """
+    if getattr(ip2, 'search_with_segment', None) is None:
+        raise ValueError(f"{type(ip2).__name__} 不能给出段边界，不支持细化")
+    if not isinstance(prefixes, PrefixArray):
+        prefixes = PrefixArray.from_cidrs(prefixes)
+    blocks = prefixes.collapse().split(TASK_PREFIXLEN)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        parts = ex.map(lambda b: refine_block(b, ip2, sample_per_cidr, min_prefixlen, seed, matcher), blocks)
+        for part in tqdm(parts, total=len(blocks), desc='Refining CIDR'):
+            for res in part:
+                regions = res.pop('regions')
+                if region_table is not None:
+                    res['region_ids'] = [region_table.intern(r) for r in regions]
+                results.append(res)
+                if metrics.enabled:
+                    metrics.incr('cidrs_scanned')
+                    metrics.incr('samples', res['samples'])
+                    metrics.incr(f"status_{res['status']}")
+    metrics.set_gauge('refine_blocks', len(blocks))
+    metrics.set_gauge('refine_leaves', len(results))
+    return sort_results(results)
+
+
+def refined_origins(results: List[Dict], prefixes: PrefixArray,
+                    origins: Dict[str, Tuple[int, ...]]) -> Dict[str, Tuple[int, ...]]:
+    """
+    把按输入前缀记录的起源 ASN 映射到细化后的网段（取与之重叠的全部输入前缀的起源并集）
+
+    Args:
+        results: refine_prefixes 的结果
+        prefixes: 细化前互不相交的前缀
+        origins: {输入 cidr: (起源 ASN...)}
+    """
+    ordered = prefixes.sorted_unique()
+    starts = ordered.networks
+    refined: Dict[str, Tuple[int, ...]] = {}
+    for r in results:
+        net, plen = parse_cidr(r['cidr'])
+        end = net + (1 << (32 - plen)) - 1
+        asns = set()
+        i = max(bisect_right(starts, net) - 1, 0)
+        while i < len(ordered) and starts[i] <= end:
+            if starts[i] + ordered.num_addresses(i) - 1 >= net:
+                asns.update(origins.get(ordered.cidr(i), ()))
+            i += 1
+        if asns:
+            refined[r['cidr']] = tuple(sorted(asns))
+    return refined
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+多目标分类
+扫描时为每个采样 IP 记录区域 ID，一次扫描即可同时产出
+各（省份, 运营商）以及河北各地市的 CIDR 列表和按地址加权的统计
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from cidr_merger import merge_cidrs
+
+# 常见运营商关键字，用于在不同格式的区域字符串中定位 ISP 字段
+ISP_KEYWORDS = ['移动', '电信', '联通', '广电', '铁通', '教育网', '鹏博士', '长城']
+
+
+def normalize_province(province: str) -> str:
+    """省份名规范化（与 README 统计表保持一致）"""
+    return province.replace('省', '').replace('市', '')
+
+
+def parse_region(region: str) -> Tuple[str, str, str, str]:
+    """
+    将区域字符串解析为 (国家, 省份, 城市, ISP)
+
+    支持多种数据库格式:
+    - 标准v3: 国家|省份|城市|ISP
+    - 增强版: |国家|省份|城市|区域|街道|ISP|经度|维度
+    - n版本: 国家|省份||||ISP
+    """
+    if not region:
+        return '', '', '', ''
+    parts = region.split('|')
+    if parts and parts[0] == '' and len(parts) > 1:
+        parts = parts[1:]
+    parts = ['' if p == '0' else p for p in parts]
+    parts += [''] * (4 - len(parts))
+
+    country, province, city = parts[0], parts[1], parts[2]
+    isp = ''
+    for field in parts[3:]:
+        if any(kw in field for kw in ISP_KEYWORDS):
+            isp = field
+            break
+    if not isp and len(parts) <= 5:
+        isp = parts[3]
+    if isp.startswith('中国') and len(isp) > 2:
+        isp = isp[2:]
+    return country, province, city, isp
+
+
+class RegionTable:
+    """区域字符串驻留表：区域字符串 <-> 整数 ID，解析结果按 ID 缓存"""
+
+    def __init__(self):
+        self.regions: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._fields: Dict[int, Tuple[str, str, str, str]] = {}
+
+    def intern(self, region: str) -> int:
+        region = region or ''
+        rid = self._ids.get(region)
+        if rid is None:
+            rid = len(self.regions)
+            self._ids[region] = rid
+            self.regions.append(region)
+        return rid
+
+    def region(self, rid: int) -> str:
+        return self.regions[rid]
+
+    def fields(self, rid: int) -> Tuple[str, str, str, str]:
+        f = self._fields.get(rid)
+        if f is None:
+            f = parse_region(self.regions[rid])
+            self._fields[rid] = f
+        return f
+
+    def __len__(self):
+        return len(self.regions)
+
+
+def _cidr_size(cidr: str) -> int:
+    return 1 << (32 - int(cidr.split('/')[1]))
+
+
+def _new_target() -> Dict:
+    return {'cidrs': [], 'high': 0, 'medium': 0, 'addresses': 0, 'estimated_addresses': 0.0}
+
+
+def _add_hit(target: Dict, cidr: str, hits: int, samples: int):
+    status = 'high' if hits == samples else 'medium'
+    size = _cidr_size(cidr)
+    target['cidrs'].append(cidr)
+    target[status] += 1
+    target['addresses'] += size
+    target['estimated_addresses'] += size * hits / samples
+
+
+def classify_targets(results: List[Dict], table: RegionTable,
+                     city_province: str = '河北', city_isp: str = '移动') -> Dict[str, Dict]:
+    """
+    单次遍历扫描结果，按已记录的区域 ID 同时对所有目标分类
+
+    Args:
+        results: 扫描结果（需包含 region_ids 字段）
+        table: 扫描时使用的 RegionTable
+        city_province: 需要按地市细分的省份
+        city_isp: 按地市细分时的运营商
+
+    Returns:
+        {'province_isp': {(省份, ISP): 目标统计}, 'city': {城市: 目标统计}}
+        每个目标统计包含 cidrs/high/medium/addresses/estimated_addresses
+    """
+    province_isp: Dict[Tuple[str, str], Dict] = {}
+    city: Dict[str, Dict] = {}
+
+    for r in results:
+        rids = r.get('region_ids')
+        if not rids:
+            continue
+        samples = len(rids)
+        pi_hits: Dict[Tuple[str, str], int] = {}
+        city_hits: Dict[str, int] = {}
+        for rid in rids:
+            _, prov, c, isp = table.fields(rid)
+            key = (normalize_province(prov) or '未知', isp or '未知')
+            pi_hits[key] = pi_hits.get(key, 0) + 1
+            if city_province in prov and city_isp in isp:
+                c = c or '未知'
+                city_hits[c] = city_hits.get(c, 0) + 1
+
+        for key, hits in pi_hits.items():
+            _add_hit(province_isp.setdefault(key, _new_target()), r['cidr'], hits, samples)
+        for c, hits in city_hits.items():
+            _add_hit(city.setdefault(c, _new_target()), r['cidr'], hits, samples)
+
+    return {'province_isp': province_isp, 'city': city}
+
+
+def _safe_name(name: str) -> str:
+    return ''.join('_' if ch in '/\\:*?"<>| ' else ch for ch in name)
+
+
+def save_target_results(targets: Dict[str, Dict], out_dir: Optional[Path] = None) -> Path:
+    """
+    写出多目标分类结果
+
+    output/targets/
+        province_isp/<省份>_<ISP>.txt   各（省份, ISP）命中 CIDR（已合并）
+        city/<城市>.txt                 河北移动各地市命中 CIDR（已合并）
+        stats.json                       各目标按地址加权的统计
+
+    Returns:
+        输出目录
+    """
+    if out_dir is None:
+        out_dir = Path(__file__).parent.parent / 'output' / 'targets'
+    stats = {'province_isp': [], 'city': []}
+
+    groups = [
+        ('province_isp', {f'{p}_{i}': v for (p, i), v in targets['province_isp'].items()}),
+        ('city', targets['city']),
+    ]
+    for group, items in groups:
+        group_dir = out_dir / group
+        group_dir.mkdir(parents=True, exist_ok=True)
+        for name, t in sorted(items.items(), key=lambda x: -x[1]['estimated_addresses']):
+            merged = merge_cidrs(t['cidrs'])
+            (group_dir / f'{_safe_name(name)}.txt').write_text('\n'.join(merged), encoding='utf-8')
+            stats[group].append({
+                'target': name,
+                'cidrs': len(t['cidrs']),
+                'merged_cidrs': len(merged),
+                'high': t['high'],
+                'medium': t['medium'],
+                'addresses': t['addresses'],
+                'estimated_addresses': round(t['estimated_addresses']),
+            })
+
+    (out_dir / 'stats.json').write_text(json.dumps(stats, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"多目标分类: {len(stats['province_isp'])} 个(省份, ISP), {len(stats['city'])} 个地市 -> {out_dir}")
+    return out_dir
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+扫描结果文件（JSONL，自描述）
+
+第一行为 header（格式、版本、生成参数、区域字符串表），之后每行一条按地址排序的扫描结果；
+结果中的 region_ids 引用 header 中的区域表，读取时可重新驻留到调用方的 RegionTable。
+用于分片扫描的部分结果文件（见 sharding.py）。
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cidr_merger import cidr_sort_key
+from region_targets import RegionTable
+
+FORMAT = 'hebei-cmcc-results'
+FORMAT_VERSION = 1
+RESULT_FIELDS = ('cidr', 'status', 'hits', 'samples', 'sampled', 'region_ids')
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_result_file(path, results: List[Dict], region_table: Optional[RegionTable] = None,
+                      origins: Optional[Dict[str, Tuple[int, ...]]] = None, **meta) -> Path:
+    """
+    写出结果文件（按地址排序，先写临时文件再原子替换）
+
+    Args:
+        results: 扫描结果（scan_prefixes_concurrent 的输出）
+        region_table: 结果 region_ids 所引用的区域表
+        origins: 可选的 {cidr: (起源 ASN...)}，写入每条结果的 asns 字段
+        meta: 写入 header 的其他信息（分片号、输入哈希等）
+    """
+    header = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        **meta,
+        'count': len(results),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'regions': region_table.regions if region_table is not None else [],
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(_dumps(header) + '\n')
+        for r in sorted(results, key=lambda x: cidr_sort_key(x['cidr'])):
+            record = {k: v for k, v in r.items() if k in RESULT_FIELDS}
+            if origins is not None:
+                record['asns'] = list(origins.get(r['cidr'], ()))
+            f.write(_dumps(record) + '\n')
+    tmp.replace(path)
+    return path
+
+
+def read_result_header(path) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+    if header.get('format') != FORMAT:
+        raise ValueError(f"not a result file: {path}")
+    if header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"unsupported result file version {header.get('version')}: {path}")
+    return header
+
+
+def iter_result_file(path, region_table: Optional[RegionTable] = None) -> Iterator[Dict]:
+    """
+    流式读取结果（按文件内顺序，即地址顺序）
+
+    提供 region_table 时把 region_ids 重新映射到该表；否则丢弃 region_ids
+    """
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != FORMAT:
+            raise ValueError(f"not a result file: {path}")
+        regions = header.get('regions', [])
+        mapping = None
+        if region_table is not None:
+            mapping = [region_table.intern(r) for r in regions]
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            if 'region_ids' in r:
+                if mapping is None:
+                    del r['region_ids']
+                else:
+                    r['region_ids'] = [mapping[i] for i in r['region_ids']]
+            yield r
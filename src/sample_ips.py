@@ -1,28 +1,41 @@
 import random
-from ipaddress import ip_network
 
-def sample_ips_from_cidr(cidr: str, n: int = 3):
-    net = ip_network(cidr)
+from prefix_array import format_ip, parse_cidr
+
+def sample_ips_from_cidr(cidr, n: int = 3, rng=None):
+    # cidr: 'a.b.c.d/len' 字符串或 (网络地址, 掩码位数) 整数对（见 prefix_array.py，无需重复解析）
+    # rng: 可选的 random.Random 实例（固定种子时结果可复现），默认使用全局随机数
+    rng = rng or random
+    net, plen = parse_cidr(cidr) if isinstance(cidr, str) else cidr
+    total = 1 << (32 - plen)
     # prefer hosts for small nets
-    try:
-        total = net.num_addresses
-    except Exception:
-        total = 0
     if total <= 1024:
-        hosts = list(net.hosts())
-        if not hosts:
-            return [str(net.network_address)]
+        # 主机地址范围（与 IPv4Network.hosts() 一致：/31、/32 全部地址可用，其余去掉网络地址和广播地址）
+        hosts = range(net, net + total) if plen >= 31 else range(net + 1, net + total - 1)
         if len(hosts) <= n:
-            return [str(ip) for ip in hosts]
-        return [str(random.choice(hosts)) for _ in range(n)]
+            return [format_ip(ip) for ip in hosts]
+        return [format_ip(rng.choice(hosts)) for _ in range(n)]
     else:
-        ips = set()
+        # dict 去重并保留抽样顺序（set 的迭代顺序随进程哈希种子变化，固定 rng 时也不可复现）
+        ips = {}
         attempts = 0
         while len(ips) < n and attempts < n*20:
-            offset = random.randrange(1, total-1)
-            ip = net.network_address + offset
-            ips.add(str(ip))
+            offset = rng.randrange(1, total-1)
+            ips[format_ip(net + offset)] = None
             attempts += 1
         if not ips:
-            return [str(net.network_address)]
+            return [format_ip(net)]
         return list(ips)
+
+def sample_ips_stratified(cidr, n: int = 3, rng=None):
+    # 分层采样：把主机地址范围等分为 n 层，每层随机取 1 个地址（采样点覆盖整个网段，不会扎堆）
+    # 参数与返回值同 sample_ips_from_cidr
+    rng = rng or random
+    net, plen = parse_cidr(cidr) if isinstance(cidr, str) else cidr
+    total = 1 << (32 - plen)
+    lo, hi = (net, net + total) if plen >= 31 else (net + 1, net + total - 1)
+    count = hi - lo
+    if count <= n:
+        return [format_ip(ip) for ip in range(lo, hi)]
+    bounds = [lo + count * k // n for k in range(n + 1)]
+    return [format_ip(rng.randrange(bounds[k], bounds[k + 1])) for k in range(n)]
@@ -1,17 +1,48 @@
-from ip2region_client import IP2RegionClient
+import random
+from ip2region_client import IP2RegionClient, is_hebei_mobile_region
 from tqdm import tqdm
 from sample_ips import sample_ips_from_cidr
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from prefix_array import format_cidr
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from cidr_merger import cidr_sort_key
+from metrics import metrics
 
-def scan_single(cidr, ip2, sample_per_cidr=3):
-    ips = sample_ips_from_cidr(cidr, n=sample_per_cidr)
-    hits = 0
+def _lookup_regions(ip2, ips):
+    """
+    查询一组采样 IP 的区域字符串
+
+    ip2 可以是任意查询后端：只需实现 lookup_region_str(ip)；
+    若同时实现 lookup_many(ips)（如 MultiSourceIPClient），则整批调用
+    """
+    lookup_many = getattr(ip2, 'lookup_many', None)
+    if lookup_many is not None:
+        try:
+            return [r or '' for r in lookup_many(ips)]
+        except Exception:
+            pass
+    regions = []
     for ip in ips:
         try:
-            if ip2.is_hebei_mobile(ip):
-                hits += 1
+            regions.append(ip2.lookup_region_str(ip) or '')
         except Exception:
-            continue
+            regions.append('')
+    return regions
+
+def scan_single(cidr, ip2, sample_per_cidr=3, matcher=is_hebei_mobile_region, seed=None):
+    # cidr 可以是字符串或 PrefixArray 中的 (网络地址, 掩码位数)，只在写入结果时格式化一次
+    prefix = cidr
+    if not isinstance(cidr, str):
+        cidr = format_cidr(*cidr)
+    # 固定种子时每个网段使用独立的随机数序列，与扫描顺序、线程调度无关（断点续跑结果一致）
+    rng = random.Random(f'{seed}:{cidr}') if seed is not None else None
+    ips = sample_ips_from_cidr(prefix, n=sample_per_cidr, rng=rng)
+    # 记录每个采样点的区域，供多目标分类复用，无需二次查询
+    regions = _lookup_regions(ip2, ips)
+    return make_result(cidr, ips, regions, matcher)
+
+def make_result(cidr, ips, regions, matcher=is_hebei_mobile_region):
+    """由采样点及其区域生成一条扫描结果（全部命中 high / 部分命中 medium / 未命中 none）"""
+    hits = sum(1 for region in regions if matcher(region))
     if hits == 0:
         status = 'none'
     elif hits == len(ips):
@@ -23,19 +54,78 @@ def scan_single(cidr, ip2, sample_per_cidr=3):
         'sampled': ips,
         'hits': hits,
         'samples': len(ips),
-        'status': status
+        'status': status,
+        'regions': regions
     }
 
-def scan_prefixes_concurrent(prefixes, ip2, sample_per_cidr=3, max_workers=24):
+# 每个任务连续扫描的网段数：同一线程按地址顺序查询相邻网段，命中查询后端的段缓存（见 IP2RegionClient）
+SCAN_BATCH = 16
+
+def _scan_batch(prefixes, ip2, sample_per_cidr, seed):
     results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = {ex.submit(scan_single, p, ip2, sample_per_cidr): p for p in prefixes}
-        for fut in tqdm(as_completed(futures), total=len(futures), desc='Scanning CIDR'):
-            try:
-                res = fut.result()
-                results.append(res)
-            except Exception:
-                continue
-    # sort: high -> medium -> none
-    results_sorted = sorted(results, key=lambda x: (0 if x['status']=='high' else 1 if x['status']=='medium' else 2, x['cidr']))
-    return results_sorted
+    for p in prefixes:
+        try:
+            results.append(scan_single(p, ip2, sample_per_cidr, seed=seed))
+        except Exception:
+            metrics.incr('scan_errors')
+    return results
+
+def scan_prefixes_concurrent(prefixes, ip2, sample_per_cidr=3, max_workers=24, region_table=None,
+                             seed=None, checkpoint=None, stop=None):
+    """
+    并发扫描 CIDR 列表
+
+    prefixes: CIDR 字符串列表或 PrefixArray
+    ip2: 查询后端（IP2RegionClient、MultiSourceIPClient 等，见 _lookup_regions）
+    region_table: 可选的 RegionTable；提供时每条结果带 region_ids（每个采样点一个区域 ID），
+                  用于一次扫描产出多目标分类结果
+    seed: 可选的随机种子，固定后采样结果可复现
+    checkpoint: 可选的 Checkpoint（见 checkpoint.py），每完成一个网段追加一条记录
+    stop: 可选的 threading.Event；置位后取消剩余任务并抛出 KeyboardInterrupt
+    """
+    results = []
+    # 在途任务数有上限：结果随提交边完成边处理（断点及时落盘），也不必一次创建全部 Future
+    window = max_workers * 4
+    pending = set()
+    # 输入按地址排序，每个任务取连续的 SCAN_BATCH 个网段
+    batches = (prefixes[i:i + SCAN_BATCH] for i in range(0, len(prefixes), SCAN_BATCH))
+    with ThreadPoolExecutor(max_workers=max_workers) as ex, \
+            tqdm(total=len(prefixes), desc='Scanning CIDR') as bar:
+        try:
+            while True:
+                for batch in batches:
+                    pending.add(ex.submit(_scan_batch, batch, ip2, sample_per_cidr, seed))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if stop is not None and stop.is_set():
+                    raise KeyboardInterrupt
+                for fut in done:
+                    batch_results = fut.result()
+                    bar.update(len(batch_results))
+                    for res in batch_results:
+                        regions = res.pop('regions')
+                        if region_table is not None:
+                            res['region_ids'] = [region_table.intern(r) for r in regions]
+                        results.append(res)
+                        if checkpoint is not None:
+                            checkpoint.add(res)
+                        if metrics.enabled:
+                            metrics.incr('cidrs_scanned')
+                            metrics.incr('samples', res['samples'])
+                            metrics.incr(f"status_{res['status']}")
+        except BaseException:
+            # 中断时取消尚未开始的任务，只等待正在执行的少量任务
+            for fut in pending:
+                fut.cancel()
+            raise
+        finally:
+            if checkpoint is not None:
+                checkpoint.flush()
+    return sort_results(results)
+
+def sort_results(results):
+    """sort: high -> medium -> none，同级按地址数值排序（保证输出稳定，git diff 最小）"""
+    return sorted(results, key=lambda x: (0 if x['status']=='high' else 1 if x['status']=='medium' else 2, cidr_sort_key(x['cidr'])))
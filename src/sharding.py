@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+分片扫描
+
+把按地址排序的前缀列表确定性地切成 N 个连续分片（按地址数或预计查询次数加权均衡），
+每台机器 / 每个 CI 任务只扫描其中一片并写出自描述的部分结果文件（见 result_io.py），
+最后由 combine 子命令做一次流式 k 路归并，生成与单机运行相同的 txt/csv/json/合并输出。
+
+用法:
+    python src/main.py --shard 1/4 --use-cache         # 写出 output/shards/shard-1-of-4.jsonl
+    python src/main.py combine output/shards/*.jsonl    # 合并为常规输出
+"""
+import argparse
+import hashlib
+import heapq
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from cidr_merger import cidr_sort_key
+from prefix_array import PrefixArray
+from region_targets import RegionTable
+from result_io import iter_result_file, read_result_header
+
+WEIGHTS = ('lookups', 'addresses')
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """解析 'i/N'（i 从 1 开始，与 CI 的节点序号一致）"""
+    try:
+        i, n = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"invalid shard `{spec}`, expected i/N")
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError(f"invalid shard `{spec}`, expected 1 <= i <= N")
+    return i, n
+
+
+def prefix_weight(prefixlen: int, weight: str = 'lookups', sample_per_cidr: int = 3) -> int:
+    """
+    单个前缀的权重
+
+    addresses: 地址数；lookups: 预计查询次数（与 sample_ips_from_cidr 的采样规则一致，
+    小网段主机数不足 sample_per_cidr 时按主机数计）
+    """
+    size = 1 << (32 - prefixlen)
+    if weight == 'addresses':
+        return size
+    if weight != 'lookups':
+        raise ValueError(f"unknown shard weight `{weight}`")
+    hosts = size - 2 if prefixlen < 31 else size
+    return max(1, min(sample_per_cidr, hosts))
+
+
+def _as_sorted_array(prefixes) -> PrefixArray:
+    if not isinstance(prefixes, PrefixArray):
+        prefixes = PrefixArray.from_cidrs(prefixes, strict=True)
+    return prefixes.sorted_unique()
+
+
+def prefixes_hash(prefixes) -> str:
+    """
+    完整前缀列表的哈希（写入分片 header，合并时校验各分片来自同一输入）
+
+    网络地址按大端编码后再哈希（array 的 tobytes 是本机字节序），不同字节序的机器得到相同结果
+    """
+    ordered = _as_sorted_array(prefixes)
+    networks = array('I', ordered.networks)
+    if sys.byteorder == 'little':
+        networks.byteswap()
+    h = hashlib.sha256()
+    h.update(networks.tobytes())
+    h.update(ordered.prefixlens.tobytes())
+    return h.hexdigest()
+
+
+def partition(prefixes, n: int, weight: str = 'lookups', sample_per_cidr: int = 3) -> List[PrefixArray]:
+    """
+    按地址排序后切成 n 个连续分片，使各分片权重尽量接近 total/n
+
+    第 k 个切点取累计权重首次达到 k*total/n 的位置，结果只依赖输入集合本身（与输入顺序无关）
+
+    Args:
+        prefixes: PrefixArray 或 CIDR 字符串列表
+
+    Returns:
+        n 个 PrefixArray（前缀数少于 n 时靠后的分片为空）
+    """
+    ordered = _as_sorted_array(prefixes)
+    weights = [prefix_weight(plen, weight, sample_per_cidr) for plen in ordered.prefixlens]
+    total = sum(weights)
+    shards: List[PrefixArray] = []
+    start = 0
+    acc = 0
+    pos = 0
+    for k in range(1, n + 1):
+        target = total * k / n
+        while pos < len(ordered) and (acc + weights[pos] / 2 <= target or k == n):
+            acc += weights[pos]
+            pos += 1
+        shards.append(ordered[start:pos])
+        start = pos
+    return shards
+
+
+def shard_path(out_dir: Path, i: int, n: int) -> Path:
+    return out_dir / 'shards' / f'shard-{i}-of-{n}.jsonl'
+
+
+def check_shard_headers(headers: List[Dict], allow_partial: bool = False) -> int:
+    """
+    校验分片 header：同一 N、同一输入哈希与采样参数、无重复分片，缺片时报错（allow_partial 时仅警告）
+
+    Returns:
+        分片总数 N
+    """
+    if not headers:
+        raise ValueError("no shard files given")
+    first = headers[0]
+    seen = set()
+    for h in headers:
+        if 'shard' not in h:
+            raise ValueError("not a shard file (header has no shard field)")
+        for key in ('shards', 'prefixes_sha256', 'sample', 'weight', 'refine'):
+            if h.get(key) != first.get(key):
+                raise ValueError(f"shard {h['shard']}/{h['shards']} has different {key}: "
+                                 f"{h.get(key)} != {first.get(key)}")
+        if h['shard'] in seen:
+            raise ValueError(f"duplicate shard {h['shard']}/{h['shards']}")
+        seen.add(h['shard'])
+    n = first['shards']
+    missing = sorted(set(range(1, n + 1)) - seen)
+    if missing:
+        msg = f"missing shards {missing} of {n}"
+        if not allow_partial:
+            raise ValueError(msg)
+        print(f"⚠ {msg}，结果不完整")
+    return n
+
+
+def combine_shards(paths: List[Path], region_table: RegionTable,
+                   allow_partial: bool = False) -> Tuple[List[Dict], Dict[str, Tuple[int, ...]]]:
+    """
+    流式 k 路归并各分片结果（各文件内已按地址排序）
+
+    Returns:
+        (results, origins)：results 按地址排序，region_ids 已映射到 region_table；
+        origins 为 {cidr: (起源 ASN...)}
+    """
+    headers = [read_result_header(p) for p in paths]
+    check_shard_headers(headers, allow_partial)
+
+    streams = [iter_result_file(p, region_table) for p in paths]
+    results: List[Dict] = []
+    origins: Dict[str, Tuple[int, ...]] = {}
+    last = None
+    for r in heapq.merge(*streams, key=lambda x: cidr_sort_key(x['cidr'])):
+        if r['cidr'] == last:
+            continue
+        last = r['cidr']
+        asns = r.pop('asns', None)
+        if asns:
+            origins[r['cidr']] = tuple(asns)
+        results.append(r)
+    return results, origins
+
+
+def combine_main(argv=None):
+    """combine 子命令：合并分片结果并生成常规输出"""
+    from main import (generate_stats_markdown, save_asn_stats, save_results, summarize_by_asn,
+                      summarize_by_province, update_readme_with_stats)
+    from region_targets import classify_targets, save_target_results
+    from scanner_advanced import sort_results
+
+    parser = argparse.ArgumentParser(description='合并分片扫描结果')
+    parser.add_argument('shards', nargs='+', help='分片结果文件（shard-i-of-N.jsonl）')
+    parser.add_argument('--allow-partial', action='store_true', help='允许缺少部分分片')
+    parser.add_argument('--no-merge', action='store_true', help='禁用CIDR合并功能')
+    parser.add_argument('--no-delta', action='store_true', help='不输出与上一次结果的增量文件')
+    parser.add_argument('--multi-target', action='store_true', help='同时输出各(省份, ISP)及河北各地市的CIDR列表')
+    parser.add_argument('--budget-entries', type=int, default=None, help='预算合并：最大条目数')
+    parser.add_argument('--budget-overshoot', type=int, default=None, help='预算合并：最大可容忍超额覆盖地址数')
+    args = parser.parse_args(argv)
+
+    paths = [Path(p) for p in args.shards]
+    region_table = RegionTable()
+    results, origins = combine_shards(paths, region_table, allow_partial=args.allow_partial)
+    print(f"🧩 合并 {len(paths)} 个分片: {len(results)} 个网段")
+    results = sort_results(results)
+
+    budget = None
+    if args.budget_entries is not None or args.budget_overshoot is not None:
+        budget = {'max_entries': args.budget_entries, 'max_overshoot': args.budget_overshoot}
+    output_paths = save_results(results, enable_merge=not args.no_merge, budget=budget,
+                                enable_delta=not args.no_delta)
+    if origins:
+        output_paths += (save_asn_stats(summarize_by_asn(results, origins)),)
+    if args.multi_target:
+        output_paths += (save_target_results(classify_targets(results, region_table)),)
+
+    positives = [r for r in results if r['status'] != 'none']
+    update_readme_with_stats(Path('README.md'),
+                             generate_stats_markdown(summarize_by_province(positives, region_table)))
+
+    print('\nDone. Outputs:')
+    for path in output_paths:
+        print(f'  {path}')
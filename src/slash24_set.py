@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+/24 粒度的 IPv4 地址集合（位图）
+
+IPv4 共 2^24 个 /24，每个 /24 占 1 位，整个地址空间只需 2 MB。
+成员判断是一次位运算；并、交、差把整个位图转成 int 后一次完成（毫秒级），
+不需要排序的 IPv4Network 列表。适合扫描结果、两次运行的对比、排除列表、按省份的集合等。
+
+粒度为 /24：加入短于 /24 的前缀时置位其覆盖的全部 /24，加入长于 /24 的前缀时置位其所在的 /24。
+
+文件格式（.s24）: magic 'S24S' | version u16 | reserved u16 | count u32 | zlib 压缩的位图（大端位序，第 i 位为 i<<8 开始的 /24）
+
+用法:
+    python src/slash24_set.py old.txt new.txt --op difference    # new 中有、old 中没有的 /24（输出最少 CIDR）
+    python src/slash24_set.py a.txt b.s24 --op union --save merged.s24
+"""
+import argparse
+import re
+import socket
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+from prefix_array import PrefixArray, parse_cidr, range_to_prefixes
+
+SIZE = 1 << 24
+NBYTES = SIZE >> 3
+MAGIC = b'S24S'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>4sHHI')
+_NONZERO = re.compile(rb'[^\x00]')
+
+
+def _popcount(x: int) -> int:
+    return x.bit_count() if hasattr(x, 'bit_count') else bin(x).count('1')
+
+
+class Slash24Set:
+    """/24 位图集合"""
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits: bytearray = None):
+        if bits is not None and len(bits) != NBYTES:
+            raise ValueError(f"bitmap must be {NBYTES} bytes, got {len(bits)}")
+        self.bits = bits if bits is not None else bytearray(NBYTES)
+
+    # ---
+    # 构建
+
+    @classmethod
+    def from_cidrs(cls, cidrs: Iterable[str]) -> 'Slash24Set':
+        s = cls()
+        for cidr in cidrs:
+            s.add(cidr)
+        return s
+
+    @classmethod
+    def from_prefixes(cls, prefixes: Iterable[Tuple[int, int]]) -> 'Slash24Set':
+        """由 (网络地址, 掩码位数) 序列（如 PrefixArray）构建"""
+        s = cls()
+        for net, plen in prefixes:
+            s.add_prefix(net, plen)
+        return s
+
+    @classmethod
+    def from_results(cls, results: List[dict], statuses=('high', 'medium')) -> 'Slash24Set':
+        """由扫描结果构建（默认取阳性网段）"""
+        return cls.from_cidrs(r['cidr'] for r in results if r['status'] in statuses)
+
+    def add_prefix(self, net: int, plen: int):
+        if plen >= 24:
+            i = net >> 8
+            self.bits[i >> 3] |= 0x80 >> (i & 7)
+            return
+        self._set_range(net >> 8, 1 << (24 - plen))
+
+    def add(self, cidr: str):
+        self.add_prefix(*parse_cidr(cidr))
+
+    def _set_range(self, start: int, count: int):
+        """置位 [start, start + count) 个 /24（整字节部分用切片赋值）"""
+        end = start + count
+        while start < end and start & 7:
+            self.bits[start >> 3] |= 0x80 >> (start & 7)
+            start += 1
+        full = (end - start) >> 3
+        if full:
+            self.bits[start >> 3:(start >> 3) + full] = b'\xff' * full
+            start += full << 3
+        while start < end:
+            self.bits[start >> 3] |= 0x80 >> (start & 7)
+            start += 1
+
+    # ---
+    # 查询
+
+    def __contains__(self, item) -> bool:
+        """
+        item 为 IP 字符串、整数地址或 CIDR（CIDR 时判断其所在 / 覆盖的 /24 是否全部在集合中）
+
+        IP 字符串按 inet_pton 严格解析（拒绝八进制 / 十六进制 / 简写），无效时抛出 OSError
+        """
+        if isinstance(item, int):
+            i = item >> 8
+        elif '/' in item:
+            net, plen = parse_cidr(item)
+            if plen < 24:
+                return all(self._test(i) for i in range(net >> 8, (net >> 8) + (1 << (24 - plen))))
+            i = net >> 8
+        else:
+            i = int.from_bytes(socket.inet_pton(socket.AF_INET, item), 'big') >> 8
+        return self._test(i)
+
+    def _test(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (0x80 >> (i & 7)))
+
+    def __len__(self) -> int:
+        """集合中的 /24 个数"""
+        return _popcount(int.from_bytes(self.bits, 'big'))
+
+    def __bool__(self) -> bool:
+        return _NONZERO.search(self.bits) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        """按地址顺序遍历集合中每个 /24 的网络地址（整数）"""
+        for m in _NONZERO.finditer(self.bits):
+            byte_index = m.start()
+            b = self.bits[byte_index]
+            for bit in range(8):
+                if b & (0x80 >> bit):
+                    yield ((byte_index << 3) | bit) << 8
+
+    def runs(self) -> Iterator[Tuple[int, int]]:
+        """连续 /24 组成的闭区间 [start, end]（地址）"""
+        start = prev = None
+        for net in self:
+            if prev is not None and net == prev + 256:
+                prev = net
+                continue
+            if start is not None:
+                yield start, prev + 255
+            start = prev = net
+        if start is not None:
+            yield start, prev + 255
+
+    def to_prefix_array(self) -> PrefixArray:
+        """覆盖同一地址集合的最少前缀"""
+        return PrefixArray.from_pairs(p for start, end in self.runs() for p in range_to_prefixes(start, end))
+
+    def to_cidrs(self) -> List[str]:
+        return self.to_prefix_array().to_cidrs()
+
+    def exclude_prefixes(self, prefixes: PrefixArray) -> PrefixArray:
+        """
+        从前缀中去掉本集合覆盖的 /24
+
+        不短于 /24 的前缀所在 /24 在集合中时整条去掉；短于 /24 且部分被覆盖的前缀拆为剩余的 /24
+        """
+        out = PrefixArray()
+        for net, plen in prefixes:
+            if plen >= 24:
+                if not self._test(net >> 8):
+                    out.append(net, plen)
+                continue
+            first, count = net >> 8, 1 << (24 - plen)
+            covered = [self._test(i) for i in range(first, first + count)]
+            if not any(covered):
+                out.append(net, plen)
+            elif not all(covered):
+                for k, hit in enumerate(covered):
+                    if not hit:
+                        out.append((first + k) << 8, 24)
+        return out
+
+    # ---
+    # 集合运算（整个位图一次性运算）
+
+    def _binary(self, other: 'Slash24Set', op) -> 'Slash24Set':
+        x = op(int.from_bytes(self.bits, 'big'), int.from_bytes(other.bits, 'big'))
+        return Slash24Set(bytearray(x.to_bytes(NBYTES, 'big')))
+
+    def __or__(self, other: 'Slash24Set') -> 'Slash24Set':
+        return self._binary(other, lambda a, b: a | b)
+
+    def __and__(self, other: 'Slash24Set') -> 'Slash24Set':
+        return self._binary(other, lambda a, b: a & b)
+
+    def __sub__(self, other: 'Slash24Set') -> 'Slash24Set':
+        return self._binary(other, lambda a, b: a & ~b)
+
+    def __xor__(self, other: 'Slash24Set') -> 'Slash24Set':
+        return self._binary(other, lambda a, b: a ^ b)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Slash24Set) and self.bits == other.bits
+
+    def __repr__(self):
+        return f'Slash24Set({len(self)} /24s)'
+
+    # ---
+    # 序列化
+
+    def save(self, path) -> Path:
+        """写出 .s24 文件（先写临时文件再原子替换）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        tmp.write_bytes(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(self)) + zlib.compress(bytes(self.bits), 6))
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path) -> 'Slash24Set':
+        data = Path(path).read_bytes()
+        magic, version, _, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a /24 set file: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported /24 set version {version}: {path}")
+        s = cls(bytearray(zlib.decompress(data[HEADER.size:])))
+        if len(s) != count:
+            raise ValueError(f"corrupted /24 set file: {path}")
+        return s
+
+
+def load_set(path) -> Slash24Set:
+    """读取 .s24 文件或 CIDR 文本文件（每行一个，忽略空行和 # 注释）"""
+    path = Path(path)
+    with open(path, 'rb') as f:
+        if f.read(4) == MAGIC:
+            return Slash24Set.load(path)
+    lines = (line.split('#', 1)[0].strip() for line in path.read_text(encoding='utf-8').splitlines())
+    return Slash24Set.from_cidrs(line for line in lines if line)
+
+
+def main():
+    ops = {
+        'union': lambda a, b: a | b,
+        'intersection': lambda a, b: a & b,
+        'difference': lambda a, b: a - b,
+        'symmetric': lambda a, b: a ^ b,
+    }
+    parser = argparse.ArgumentParser(description='/24 粒度集合运算（CIDR 文本或 .s24 文件）')
+    parser.add_argument('a', help='集合 A')
+    parser.add_argument('b', nargs='?', default=None, help='集合 B（省略时只输出 A）')
+    parser.add_argument('--op', choices=sorted(ops), default='difference', help='B 相对 A 的运算：B op A')
+    parser.add_argument('--save', default=None, help='把结果保存为 .s24 文件')
+    parser.add_argument('--count', action='store_true', help='只输出 /24 个数')
+    args = parser.parse_args()
+
+    a = load_set(args.a)
+    result = ops[args.op](load_set(args.b), a) if args.b else a
+    if args.save:
+        result.save(args.save)
+    if args.count:
+        print(len(result))
+    else:
+        for cidr in result.to_cidrs():
+            print(cidr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+xdb 生成工具（ip2region/util.py、searcher.py 的对应写入端）
+
+读取现有的 xdb，按投影规则改写区域字符串（如只保留省份+ISP，或把非河北区域
+统一折叠为"其他"），合并改写后相同的相邻段，输出更小的、可被原版 Searcher
+直接读取的 xdb。段数越少，二分查找越浅，new_with_buffer 占用越小。
+
+用法:
+    python src/xdb_maker.py --src data/ip2region_v4.xdb --dst data/ip2region_hebei.xdb --projection hebei
+"""
+import argparse
+import io
+import random
+import struct
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from ip2region import util
+from ip2region import searcher as xdb_searcher
+from region_targets import parse_region
+
+Segment = Tuple[int, int, str]
+OTHER_REGION = '其他'
+
+
+def iter_segments(db_path) -> Iterator[Segment]:
+    """按地址顺序遍历 IPv4 xdb 中的所有段 (start, end, region)"""
+    with io.open(str(db_path), 'rb') as handle:
+        header = util.load_header(handle)
+        version = util.version_from_header(header)
+        if version is not util.IPv4:
+            raise ValueError(f"only IPv4 xdb is supported: {db_path}")
+        content = util.load_content(handle)
+
+    index_size = version.index_size
+    for ptr in range(header.startIndexPtr, header.endIndexPtr + 1, index_size):
+        start = util.le_get_uint32(content, ptr)
+        end = util.le_get_uint32(content, ptr + 4)
+        d_len = util.le_get_uint16(content, ptr + 8)
+        d_ptr = util.le_get_uint32(content, ptr + 10)
+        region = content[d_ptr:d_ptr + d_len].decode('utf-8') if d_len else ''
+        yield start, end, region
+
+
+def coalesce(segments) -> List[Segment]:
+    """合并区域相同且地址相邻的段"""
+    result: List[Segment] = []
+    for start, end, region in segments:
+        if result and result[-1][2] == region and result[-1][1] + 1 == start:
+            result[-1] = (result[-1][0], end, region)
+        else:
+            result.append((start, end, region))
+    return result
+
+
+def project_province_isp(region: str) -> str:
+    """只保留 国家|省份||ISP"""
+    country, province, _, isp = parse_region(region)
+    return f'{country}|{province}||{isp}'
+
+
+def project_province(region: str) -> str:
+    """只保留 国家|省份"""
+    country, province, _, _ = parse_region(region)
+    return f'{country}|{province}'
+
+
+def project_hebei(region: str) -> str:
+    """保留河北区域的 省份|城市|ISP，其余统一折叠为"其他" """
+    country, province, city, isp = parse_region(region)
+    if '河北' not in province:
+        return OTHER_REGION
+    return f'{country}|{province}|{city}|{isp}'
+
+
+def project_hebei_mobile(region: str) -> str:
+    """只区分河北移动（保留城市）与"其他" """
+    country, province, city, isp = parse_region(region)
+    if '河北' not in province or '移动' not in isp:
+        return OTHER_REGION
+    return f'{country}|{province}|{city}|{isp}'
+
+
+PROJECTIONS: Dict[str, Callable[[str], str]] = {
+    'province_isp': project_province_isp,
+    'province': project_province,
+    'hebei': project_hebei,
+    'hebei_mobile': project_hebei_mobile,
+}
+
+
+def write_xdb(path, segments: List[Segment], created_at: int = 0) -> Path:
+    """
+    写出 xdb v3 IPv4 文件（布局: header | vector index | region 数据 | segment index）
+
+    segments 必须按地址排序且连续覆盖整个 IPv4 空间。与官方 maker 一致，
+    段在每个 /16 边界处拆分，保证每条索引只属于一个 vector index 桶
+
+    Args:
+        created_at: 写入 header 的生成时间（Unix 时间戳）。默认 0，相同的段总是生成逐字节相同的文件
+    """
+    entries = []
+    for start, end, region in segments:
+        while start <= end:
+            block_end = min(end, start | 0xFFFF)
+            entries.append((start, block_end, region))
+            start = block_end + 1
+
+    index_size = util.IPv4.index_size
+    data_base = util.HeaderInfoLength + util.VectorIndexLength
+    region_ptrs = {}
+    data = bytearray()
+    for _, _, region in entries:
+        if region not in region_ptrs:
+            raw = region.encode('utf-8')
+            region_ptrs[region] = (data_base + len(data), len(raw))
+            data += raw
+
+    index_base = data_base + len(data)
+    vector = bytearray(util.VectorIndexLength)
+    index = bytearray(len(entries) * index_size)
+    for i, (start, end, region) in enumerate(entries):
+        ptr = index_base + i * index_size
+        slot = (start >> 16) * util.VectorIndexSize
+        if util.le_get_uint32(vector, slot) == 0:
+            struct.pack_into('<I', vector, slot, ptr)
+        struct.pack_into('<I', vector, slot + 4, ptr + index_size)
+        d_ptr, d_len = region_ptrs[region]
+        struct.pack_into('<IIHI', index, i * index_size, start, end, d_len, d_ptr)
+
+    header = bytearray(util.HeaderInfoLength)
+    struct.pack_into('<HHIIIHH', header, 0, util.XdbStructure30, 1, created_at,
+                     index_base, index_base + (len(entries) - 1) * index_size,
+                     util.XdbIPv4Id, 4)
+
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(vector)
+        f.write(data)
+        f.write(index)
+    tmp.replace(path)
+    return path
+
+
+def make_slim_xdb(src, dst, projection: Callable[[str], str]) -> Dict:
+    """
+    按投影规则生成精简 xdb
+
+    Returns:
+        统计信息（原/新段数、区域数、文件大小）
+    """
+    cache: Dict[str, str] = {}
+    original = 0
+
+    def projected():
+        nonlocal original
+        for start, end, region in iter_segments(src):
+            original += 1
+            new_region = cache.get(region)
+            if new_region is None:
+                new_region = cache[region] = projection(region)
+            yield start, end, new_region
+
+    segments = coalesce(projected())
+    # 沿用源库的生成时间：同一源库、同一投影总是得到相同的文件
+    write_xdb(dst, segments, created_at=util.load_header_from_file(str(src)).createdAt)
+    return {
+        'source_segments': original,
+        'segments': len(segments),
+        'regions': len({r for _, _, r in segments}),
+        'source_bytes': Path(src).stat().st_size,
+        'bytes': Path(dst).stat().st_size,
+    }
+
+
+def verify_projection(src, dst, projection: Callable[[str], str], samples: int = 10000, seed: int = 0) -> int:
+    """随机抽样对比：原库区域经投影后应与新库查询结果一致。返回不一致数"""
+    src_searcher = xdb_searcher.new_with_buffer(util.IPv4, util.load_content_from_file(str(src)))
+    dst_searcher = xdb_searcher.new_with_buffer(util.IPv4, util.load_content_from_file(str(dst)))
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(samples):
+        ip = rng.getrandbits(32).to_bytes(4, 'big')
+        if projection(src_searcher.search(ip)) != dst_searcher.search(ip):
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description='生成按目标投影的精简 xdb')
+    parser.add_argument('--src', default=str(project_root / 'data' / 'ip2region_v4.xdb'))
+    parser.add_argument('--dst', required=True)
+    parser.add_argument('--projection', choices=sorted(PROJECTIONS), default='hebei')
+    parser.add_argument('--verify', type=int, default=10000, help='随机抽样校验的 IP 数（0 跳过）')
+    args = parser.parse_args()
+
+    projection = PROJECTIONS[args.projection]
+    stats = make_slim_xdb(args.src, args.dst, projection)
+    print(f"✓ 已生成 {args.dst} (projection={args.projection})")
+    print(f"  段数: {stats['source_segments']} -> {stats['segments']}, 区域数: {stats['regions']}")
+    print(f"  大小: {stats['source_bytes'] / 1024 / 1024:.1f} MB -> {stats['bytes'] / 1024 / 1024:.1f} MB")
+
+    if args.verify:
+        mismatches = verify_projection(args.src, args.dst, projection, args.verify)
+        if mismatches:
+            raise SystemExit(f"❌ 校验失败: {mismatches}/{args.verify} 个 IP 结果不一致")
+        print(f"✓ 抽样校验通过 ({args.verify} 个 IP)")
+
+
+if __name__ == '__main__':
+    main()